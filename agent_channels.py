@@ -0,0 +1,181 @@
+"""
+子 Agent 通道模块
+按 agent_id 把一轮对话的帧路由到各个子 Agent 的通道：主 Agent 的帧照常发送，
+子 Agent 的帧只有客户端订阅（展开）后才发送，未订阅期间在服务端缓冲，展开时一次补发
+"""
+
+import time
+from collections import deque
+from typing import Optional
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 只有这些类型的帧属于子 Agent 的输出，其他帧（finish、error 等）总是直接发送
+AGENT_FRAME_TYPES = frozenset({"assistant", "tool", "plan"})
+
+# 缓冲时相邻的文本分块合并为一帧，单帧最多合并到这么多字符，便于超出上限时按帧丢弃最早的输出
+_MERGE_CHARS = 4096
+
+
+class AgentChannel:
+    """一个子 Agent 的通道"""
+
+    __slots__ = ("agent_id", "agent_info", "subscribed", "buffer", "buffered_chars", "dropped", "frames", "reported_at")
+
+    def __init__(self, agent_id: str, agent_info: Optional[dict], subscribed: bool):
+        self.agent_id = agent_id
+        self.agent_info = agent_info
+        self.subscribed = subscribed
+        self.buffer: deque = deque()
+        self.buffered_chars = 0
+        self.dropped = 0  # 超出缓冲上限被丢弃的帧数
+        self.frames = 0  # 本轮收到的帧数
+        self.reported_at = 0.0
+
+    def hold(self, frame: dict, max_chars: int) -> None:
+        """
+        缓冲一帧，超出字符上限时丢弃最早的帧
+
+        Args:
+            frame: 子 Agent 的帧
+            max_chars: 缓冲的字符上限
+        """
+        content = frame.get("content") or ""
+        last = self.buffer[-1] if self.buffer else None
+        if (
+            frame.get("type") == "assistant"
+            and last is not None
+            and last.get("type") == "assistant"
+            and len(last["content"]) + len(content) <= _MERGE_CHARS
+        ):
+            last["content"] += content
+        else:
+            # 复制后再缓冲：合并会修改帧，而原帧可能同时被响应缓存记录
+            self.buffer.append(dict(frame))
+        self.buffered_chars += len(content)
+        while self.buffered_chars > max_chars and len(self.buffer) > 1:
+            oldest = self.buffer.popleft()
+            self.buffered_chars -= len(oldest.get("content") or "")
+            self.dropped += 1
+
+    def drain(self) -> list[dict]:
+        """取出全部缓冲的帧"""
+        frames = list(self.buffer)
+        self.buffer.clear()
+        self.buffered_chars = 0
+        return frames
+
+    def status(self, event: str) -> dict:
+        """子 Agent 状态帧"""
+        return {
+            "type": "agent",
+            "event": event,
+            "agent_id": self.agent_id,
+            "agent_info": self.agent_info,
+            "subscribed": self.subscribed,
+            "frames": self.frames,
+            "pending": len(self.buffer),
+            "is_stream": False,
+        }
+
+
+class AgentRouter:
+    """
+    一个 WebSocket 连接的子 Agent 路由
+
+    on_demand 为 False 时（旧客户端）所有帧原样发送；为 True 时子 Agent 首次出现发送 started 状态帧，
+    未订阅的子 Agent 的输出只缓冲，并按 AGENT_STATUS_INTERVAL 限频发送 activity 状态帧（待发送帧数）
+
+    Args:
+        on_demand: 是否按需发送子 Agent 的输出
+        max_chars: 每个子 Agent 的缓冲字符上限
+        status_interval: activity 状态帧的最小间隔（秒）
+    """
+
+    def __init__(self, on_demand: bool = False, max_chars: int = None, status_interval: float = None):
+        self.on_demand = on_demand
+        self.max_chars = max_chars if max_chars is not None else config.AGENT_BUFFER_MAX_CHARS
+        self.status_interval = status_interval if status_interval is not None else config.AGENT_STATUS_INTERVAL
+        self.channels: dict[str, AgentChannel] = {}
+        self._subscriptions: set[str] = set()
+
+    def begin_turn(self) -> None:
+        """新一轮对话开始时清空通道和订阅（子 Agent ID 每轮都不同）"""
+        self.channels.clear()
+        self._subscriptions.clear()
+
+    def route(self, frame: dict) -> list[dict]:
+        """
+        路由一帧
+
+        Args:
+            frame: iFlow 会话产生的帧
+
+        Returns:
+            list[dict]: 现在需要发送的帧（可能为空）
+        """
+        if not self.on_demand:
+            return [frame]
+        agent_id = frame.get("agent_id")
+        if not agent_id or frame.get("type") not in AGENT_FRAME_TYPES:
+            if frame.get("type") == "finish":
+                # 本轮结束时报告各未订阅子 Agent 最终的待发送帧数
+                return [channel.status("finished") for channel in self.channels.values()] + [frame]
+            return [frame]
+
+        out = []
+        channel = self.channels.get(agent_id)
+        if channel is None:
+            channel = self.channels[agent_id] = AgentChannel(agent_id, frame.get("agent_info"), agent_id in self._subscriptions)
+            out.append(channel.status("started"))
+        channel.frames += 1
+        if channel.subscribed:
+            out.append(frame)
+            return out
+
+        channel.hold(frame, self.max_chars)
+        now = time.monotonic()
+        if out:
+            channel.reported_at = now  # 刚发送了 started 状态帧
+        elif now - channel.reported_at >= self.status_interval:
+            channel.reported_at = now
+            out.append(channel.status("activity"))
+        return out
+
+    def subscribe(self, agent_id: str) -> list[dict]:
+        """
+        订阅（展开）子 Agent：返回缓冲的输出，之后的输出直接发送（子 Agent 尚未出现时，出现后直接发送）
+
+        Args:
+            agent_id: 子 Agent ID
+
+        Returns:
+            list[dict]: 需要发送的帧（agent_backlog 帧，子 Agent 尚未出现时为空）
+        """
+        self._subscriptions.add(agent_id)
+        channel = self.channels.get(agent_id)
+        if channel is None:
+            return []
+        channel.subscribed = True
+        dropped, channel.dropped = channel.dropped, 0
+        return [{
+            "type": "agent_backlog",
+            "agent_id": agent_id,
+            "frames": channel.drain(),
+            "dropped": dropped,
+            "is_stream": False,
+        }]
+
+    def unsubscribe(self, agent_id: str) -> None:
+        """
+        取消订阅（折叠）子 Agent：之后的输出只缓冲
+
+        Args:
+            agent_id: 子 Agent ID
+        """
+        self._subscriptions.discard(agent_id)
+        channel = self.channels.get(agent_id)
+        if channel is not None:
+            channel.subscribed = False
@@ -0,0 +1,77 @@
+"""
+会话对象内存基准测试
+用 tracemalloc 测量每个 Session / IFlowSession 对象占用的字节数，
+对比当前基于 __slots__ 的实现与去掉 __slots__ 后（每个实例带 __dict__）的同一个类
+
+用法:
+    python benchmarks/session_memory_benchmark.py
+    python benchmarks/session_memory_benchmark.py --sessions 50000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from session_manager import Session  # noqa: E402
+from iflow_manager import IFlowSession  # noqa: E402
+
+
+def without_slots(cls: type) -> type:
+    """
+    复制一个去掉 __slots__ 的类（方法不变，实例改用 __dict__ 存放属性），作为优化前的对照
+    """
+    slots = set(getattr(cls, "__slots__", ()))
+    namespace = {name: value for name, value in vars(cls).items() if name not in slots and name != "__slots__"}
+    return type(f"{cls.__name__}WithDict", cls.__bases__, namespace)
+
+
+def bytes_per_object(factory, count: int) -> float:
+    """
+    创建 count 个对象并保留，返回平均每个对象新增的已跟踪字节数
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del objects
+    return growth / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20000, help="创建的会话对象数")
+    args = parser.parse_args()
+
+    working_dir = ROOT
+    cases = [
+        ("Session", Session, lambda cls: lambda i: cls(f"session-{i:08d}", f"Session {i}", working_dir, "glm-4.7")),
+        ("IFlowSession", IFlowSession, lambda cls: lambda i: cls(f"session-{i:08d}", working_dir, "glm-4.7")),
+    ]
+
+    print(f"{args.sessions} objects per measurement")
+    print(f"{'class':<16} {'__dict__':>12} {'__slots__':>12} {'saved':>10}")
+    for name, cls, make in cases:
+        # Session 的 to_dict 缓存也计入（列表接口会为每个会话生成）
+        def build(factory):
+            def create(i):
+                obj = factory(i)
+                if hasattr(obj, "to_dict"):
+                    obj.to_dict()
+                return obj
+            return create
+
+        before = bytes_per_object(build(make(without_slots(cls))), args.sessions)
+        after = bytes_per_object(build(make(cls)), args.sessions)
+        print(f"{name:<16} {before:>10.0f} B {after:>10.0f} B {(1 - after / before) * 100:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+流式响应基准测试
+对比不同的服务器运行时（事件循环 / HTTP 解析器 / WebSocket 实现 / 逐消息压缩）在流式工作负载下的吞吐量
+
+默认将 iFlow 会话替换为本地生成分块的假会话，只测量服务器和 WebSocket 的开销；
+指定 --trace 时改为回放录制的真实消息流（TRACE_RECORD_ENABLED=true 时录制），同时覆盖 SDK 消息的转换路径。
+
+用法:
+    python benchmarks/stream_benchmark.py
+    python benchmarks/stream_benchmark.py --clients 20 --chunks 2000 --chunk-size 40
+    python benchmarks/stream_benchmark.py --trace ~/.iflow2web/traces/<file>.jsonl.gz --speed 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (名称, 环境变量)
+RUNTIMES = [
+    ("asyncio + h11 + deflate", {"SERVER_LOOP": "asyncio", "SERVER_HTTP": "h11", "SERVER_WS_PER_MESSAGE_DEFLATE": "true"}),
+    ("asyncio + h11", {"SERVER_LOOP": "asyncio", "SERVER_HTTP": "h11", "SERVER_WS_PER_MESSAGE_DEFLATE": "false"}),
+    ("uvloop + httptools + deflate", {"SERVER_LOOP": "uvloop", "SERVER_HTTP": "httptools", "SERVER_WS_PER_MESSAGE_DEFLATE": "true"}),
+    ("uvloop + httptools", {"SERVER_LOOP": "uvloop", "SERVER_HTTP": "httptools", "SERVER_WS_PER_MESSAGE_DEFLATE": "false"}),
+]
+
+
+def serve(port: int, chunks: int, chunk_size: int, trace: str = None, speed: float = 0) -> None:
+    """
+    在当前进程中启动服务器，iFlow 会话替换为假会话，或使用回放录制消息流的客户端
+    """
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import uvicorn
+    from iflow_manager import IFlowManager
+    from server_runtime import resolve_runtime, uvicorn_options, report_runtime
+    from log_setup import setup_logging
+
+    text = "x" * chunk_size
+
+    class FakeSession:
+        async def send_message(self, message):
+            for _ in range(chunks):
+                yield {"type": "assistant", "content": text, "is_stream": True}
+            yield {"type": "finish", "content": "Task finished", "reason": "end_turn", "is_stream": False}
+
+    async def get_or_create_session(self, session_id, working_dir, model=None):
+        return FakeSession()
+
+    if trace:
+        import iflow_manager
+        from stream_trace import replay_client_factory
+        iflow_manager.IFlowClient = replay_client_factory(trace, speed)
+    else:
+        IFlowManager.get_or_create_session = get_or_create_session
+
+    setup_logging()
+    runtime = resolve_runtime()
+    report_runtime(runtime)
+    options = uvicorn_options(runtime)
+    options.pop("workers")
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning", log_config=None, **options)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def create_session(port: int) -> str:
+    body = json.dumps({"title": "bench", "working_dir": ROOT}).encode()
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api/sessions", data=body, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)["session_id"]
+
+
+async def run_client(port: int, session_id: str, compression: bool) -> int:
+    import websockets
+
+    frames = 0
+    async with websockets.connect(
+        f"ws://127.0.0.1:{port}/ws", compression="deflate" if compression else None, max_size=None
+    ) as ws:
+        await ws.send(json.dumps({"session_id": session_id}))
+        await ws.recv()  # pong
+        await ws.send(json.dumps({"type": "user_message", "content": "benchmark"}))
+        while True:
+            frame = json.loads(await ws.recv())
+            frames += 1
+            if frame["type"] in ("finish", "error"):
+                return frames
+
+
+async def run_load(port: int, clients: int, compression: bool) -> tuple[int, float]:
+    session_ids = [create_session(port) for _ in range(clients)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_client(port, sid, compression) for sid in session_ids))
+    return sum(results), time.perf_counter() - started
+
+
+def bench(name: str, env: dict, args) -> None:
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--serve", str(port),
+               "--chunks", str(args.chunks), "--chunk-size", str(args.chunk_size)]
+    if args.trace:
+        command += ["--trace", os.path.abspath(args.trace), "--speed", str(args.speed)]
+    process = subprocess.Popen(
+        command,
+        # 关闭连接数限制、限流和会话记录，避免影响测量；用量统计保留（属于流式热路径），但不写入用户目录
+        env={**os.environ, **env, "LOG_LEVEL": "WARNING", "WS_MAX_CONNECTIONS": "0",
+             "RATE_LIMIT_ENABLED": "false", "TRANSCRIPT_ENABLED": "false", "TRACE_RECORD_ENABLED": "false",
+             "USAGE_PATH": os.path.join(tempfile.gettempdir(), f"iflow2web-bench-usage-{port}.json")},
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(port)
+        compression = env.get("SERVER_WS_PER_MESSAGE_DEFLATE") == "true"
+        asyncio.run(run_load(port, 1, compression))  # 预热
+        frames, elapsed = asyncio.run(run_load(port, args.clients, compression))
+        print(f"{name:<32} {frames:>9} frames {elapsed:>8.2f}s {frames / elapsed:>12.0f} frames/s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10, help="并发 WebSocket 客户端数")
+    parser.add_argument("--chunks", type=int, default=1000, help="每个响应的分块数")
+    parser.add_argument("--chunk-size", type=int, default=32, help="每个分块的字符数")
+    parser.add_argument("--trace", help="回放录制的消息流文件，代替假会话")
+    parser.add_argument("--speed", type=float, default=0, help="回放倍速，0 表示不等待（默认）")
+    parser.add_argument("--verbose", action="store_true", help="显示服务器日志")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.chunks, args.chunk_size, args.trace, args.speed)
+        return
+
+    if args.trace:
+        print(f"{args.clients} clients replaying {args.trace} at speed {args.speed or 'max'}")
+    else:
+        print(f"{args.clients} clients x {args.chunks} chunks x {args.chunk_size} chars")
+    for name, env in RUNTIMES:
+        bench(name, env, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,16 +12,41 @@ load_dotenv()
 # 服务器配置
 SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")  # 监听所有网络接口，允许局域网访问
 SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))  # 服务器端口
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto").lower()  # 事件循环: auto, asyncio, uvloop
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto").lower()  # HTTP 解析器: auto, h11, httptools
+SERVER_WS = os.getenv("SERVER_WS", "auto").lower()  # WebSocket 实现: auto, websockets, wsproto
+SERVER_WS_PER_MESSAGE_DEFLATE = os.getenv("SERVER_WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"  # WebSocket 逐消息压缩
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))  # worker 进程数（会话状态在进程内，目前只支持 1）
+SERVER_TIMEOUT_KEEP_ALIVE = int(os.getenv("SERVER_TIMEOUT_KEEP_ALIVE", "5"))  # HTTP keep-alive 超时（秒）
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))  # 监听队列长度
 
 # WebSocket 配置
-WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10"))  # 最大并发连接数
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10"))  # 最大并发连接数，0 表示不限制
+WS_MAX_CONNECTIONS_PER_IP = int(os.getenv("WS_MAX_CONNECTIONS_PER_IP", "0"))  # 单个 IP 的最大并发连接数，0 表示不限制
 WS_PING_INTERVAL = int(os.getenv("WS_PING_INTERVAL", "20"))  # 心跳间隔（秒）
 WS_PING_TIMEOUT = int(os.getenv("WS_PING_TIMEOUT", "60"))  # 心跳超时（秒）
 
+# 限流配置（格式为 "次数/秒数"，留空或次数为 0 表示不限制）
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"  # 是否启用限流
+RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "ip")  # 客户端身份: ip 或 header
+RATE_LIMIT_HEADER = os.getenv("RATE_LIMIT_HEADER", "X-Client-Id")  # RATE_LIMIT_KEY=header 时使用的请求头
+RATE_LIMIT_PROMPT = os.getenv("RATE_LIMIT_PROMPT", "20/60")  # 提交提示词
+RATE_LIMIT_SESSION_CREATE = os.getenv("RATE_LIMIT_SESSION_CREATE", "30/60")  # 创建会话
+RATE_LIMIT_MODELS = os.getenv("RATE_LIMIT_MODELS", "60/60")  # 获取模型列表
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))  # 最多保留的令牌桶数
+
 # iFlow 配置
 # 默认工作目录（从环境变量读取，如果为空则使用当前目录）
 IFLOW_DEFAULT_WORKING_DIR = os.getenv("IFLOW_DEFAULT_WORKING_DIR", "")
 IFLOW_APPROVAL_MODE = os.getenv("IFLOW_APPROVAL_MODE", "YOLO")  # 审批模式: DEFAULT, AUTO_EDIT, YOLO, PLAN
+IFLOW_TURN_TIMEOUT = int(os.getenv("IFLOW_TURN_TIMEOUT", "1800"))  # 单轮对话的最长时间（秒），0 表示不限制
+IFLOW_IDLE_TIMEOUT = int(os.getenv("IFLOW_IDLE_TIMEOUT", "300"))  # 两条响应消息之间的最长间隔（秒），0 表示不限制
+IFLOW_HEALTH_CHECK_INTERVAL = float(os.getenv("IFLOW_HEALTH_CHECK_INTERVAL", "10"))  # 客户端健康检查间隔（秒）
+IFLOW_RESPAWN_ATTEMPTS = int(os.getenv("IFLOW_RESPAWN_ATTEMPTS", "3"))  # 启动失败时的最大尝试次数
+IFLOW_RESPAWN_BASE_DELAY = float(os.getenv("IFLOW_RESPAWN_BASE_DELAY", "1.0"))  # 重试的初始退避时间（秒），每次翻倍
+IFLOW_RESPAWN_MAX_DELAY = float(os.getenv("IFLOW_RESPAWN_MAX_DELAY", "30.0"))  # 重试的最大退避时间（秒）
+IFLOW_BREAKER_THRESHOLD = int(os.getenv("IFLOW_BREAKER_THRESHOLD", "5"))  # 全局连续启动失败多少次后熔断
+IFLOW_BREAKER_COOLDOWN = float(os.getenv("IFLOW_BREAKER_COOLDOWN", "60"))  # 熔断后多久允许试探启动（秒）
 
 # 模型配置
 IFLOW_DEFAULT_MODEL = os.getenv("IFLOW_DEFAULT_MODEL", "glm-4.7")  # 默认模型（推荐）
@@ -50,6 +75,7 @@ IFLOW_AVAILABLE_MODELS = [
     "MiniMax-M2.1",
     "Kimi-K2.5",
 ]  # 可用模型列表（从API动态获取 + 额外支持的模型）
+MODELS_CACHE_TTL = int(os.getenv("MODELS_CACHE_TTL", "300"))  # 模型列表缓存时间（秒）
 
 # 允许的工作目录白名单（安全限制）
 # TODO: 如果需要限制访问的目录，取消注释并添加允许的目录列表
@@ -60,10 +86,97 @@ IFLOW_AVAILABLE_MODELS = [
 # ]
 ALLOWED_WORKING_DIRS = None  # None 表示允许访问任意目录（仅限个人使用）
 
+# 会话列表配置
+SESSIONS_PAGE_MAX = int(os.getenv("SESSIONS_PAGE_MAX", "200"))  # /api/sessions 单页最大数量
+
+# 目录浏览配置（/api/fs）
+FS_INDEX_MAX_DIRS = int(os.getenv("FS_INDEX_MAX_DIRS", "512"))  # 目录索引最多缓存的目录数
+FS_INDEX_TTL = float(os.getenv("FS_INDEX_TTL", "2.0"))  # 缓存有效期（秒），过期后按 mtime 增量刷新
+FS_MAX_ENTRIES = int(os.getenv("FS_MAX_ENTRIES", "500"))  # 单次浏览最多返回的条目数
+
+# 响应缓存配置（对会话第一轮的只读提示词复用相同工作区状态下的响应，默认关闭）
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 缓存总字节上限
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))  # 缓存条目上限
+RESPONSE_CACHE_SCAN_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SCAN_MAX_ENTRIES", "5000"))  # 非 git 目录指纹最多统计的条目数，超出则不缓存
+# 额外允许缓存的可写审批模式（逗号分隔，如 "YOLO"），默认只缓存 PLAN 模式
+RESPONSE_CACHE_WRITE_MODES = [m.strip() for m in os.getenv("RESPONSE_CACHE_WRITE_MODES", "").split(",") if m.strip()]
+
+# 静态资源配置
+STATIC_COMPRESS_MIN_SIZE = int(os.getenv("STATIC_COMPRESS_MIN_SIZE", "1024"))  # 小于该字节数的文件不预压缩
+
+# 工作区文件变更推送配置
+FILE_WATCH_ENABLED = os.getenv("FILE_WATCH_ENABLED", "true").lower() == "true"
+FILE_WATCH_FORCE_POLLING = os.getenv("FILE_WATCH_FORCE_POLLING", "false").lower() == "true"  # 不使用 inotify 等系统通知
+FILE_WATCH_DEBOUNCE_MS = int(os.getenv("FILE_WATCH_DEBOUNCE_MS", "800"))  # 防抖窗口（毫秒）
+FILE_WATCH_POLL_INTERVAL = float(os.getenv("FILE_WATCH_POLL_INTERVAL", "2.0"))  # 轮询间隔（秒）
+FILE_WATCH_MAX_SCAN = int(os.getenv("FILE_WATCH_MAX_SCAN", "20000"))  # 轮询时最多扫描的文件数
+FILE_WATCH_MAX_FILES = int(os.getenv("FILE_WATCH_MAX_FILES", "200"))  # 每条消息最多列出的文件数
+FILE_DIFF_MAX_BYTES = int(os.getenv("FILE_DIFF_MAX_BYTES", "262144"))  # 单个文件差异的最大字节数
+
+# 会话休眠配置（空闲会话释放 iFlow 进程，下次发送消息时自动恢复）
+SESSION_HIBERNATE_AFTER = int(os.getenv("SESSION_HIBERNATE_AFTER", "900"))  # 空闲多少秒后休眠，0 表示不休眠（需要 TRANSCRIPT_ENABLED 或 SESSION_NATIVE_RESUME 才能恢复上下文）
+SESSION_NATIVE_RESUME = os.getenv("SESSION_NATIVE_RESUME", "false").lower() == "true"  # 优先尝试 iFlow 原生会话恢复（loadSession）
+HIBERNATE_REPLAY_MAX_CHARS = int(os.getenv("HIBERNATE_REPLAY_MAX_CHARS", "8000"))  # 重放上下文的字符上限
+TRANSCRIPT_ENABLED = os.getenv("TRANSCRIPT_ENABLED", "true").lower() == "true"  # 是否记录对话内容（休眠恢复需要）
+TRANSCRIPT_DIR = os.getenv("TRANSCRIPT_DIR", os.path.join(os.path.expanduser("~"), ".iflow2web", "transcripts"))  # 对话记录目录
+
+# 全文搜索配置（SQLite FTS5 索引对话记录）
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "true").lower() == "true"
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", os.path.join(os.path.expanduser("~"), ".iflow2web", "search.db"))  # 索引数据库路径
+SEARCH_FLUSH_INTERVAL = float(os.getenv("SEARCH_FLUSH_INTERVAL", "2.0"))  # 批量写入索引的间隔（秒）
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", "200"))  # 待写入记录达到该数量时立即写入
+SEARCH_PAGE_MAX = int(os.getenv("SEARCH_PAGE_MAX", "100"))  # 每次搜索最多返回的结果数
+
+# 用量统计配置（按会话和按模型累计轮数、输出量、工具调用和耗时）
+USAGE_ENABLED = os.getenv("USAGE_ENABLED", "true").lower() == "true"
+USAGE_PATH = os.getenv("USAGE_PATH", os.path.join(os.path.expanduser("~"), ".iflow2web", "usage.json"))  # 累计值持久化文件
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "60"))  # 写入文件的间隔（秒）
+
+# 模型性能统计和默认模型选择（样本来自用量统计，需要 USAGE_ENABLED）
+MODEL_STATS_WINDOW = int(os.getenv("MODEL_STATS_WINDOW", "50"))  # 每个模型保留的最近轮次数
+MODEL_STATS_MAX_AGE = float(os.getenv("MODEL_STATS_MAX_AGE", "1800"))  # 样本有效期（秒），0 表示不过期
+MODEL_SELECTION_POLICY = os.getenv("MODEL_SELECTION_POLICY", "static").lower()  # static / latency / error_rate
+MODEL_SELECTION_MIN_SAMPLES = int(os.getenv("MODEL_SELECTION_MIN_SAMPLES", "5"))  # 参与比较所需的最少样本数
+MODEL_SELECTION_MAX_ERROR_RATE = float(os.getenv("MODEL_SELECTION_MAX_ERROR_RATE", "0.2"))  # 超过该错误率视为后端异常
+
+# 子 Agent 输出按需发送（客户端在初始化帧中声明 agent_streams=on_demand 时生效）
+AGENT_BUFFER_MAX_CHARS = int(os.getenv("AGENT_BUFFER_MAX_CHARS", "200000"))  # 每个未展开的子 Agent 在服务端缓冲的字符上限，超出时丢弃最早的输出
+AGENT_STATUS_INTERVAL = float(os.getenv("AGENT_STATUS_INTERVAL", "1.0"))  # 未展开的子 Agent 发送 activity 状态帧的最小间隔（秒）
+
+# 对话记录导出配置
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "65536"))  # 导出响应每次写出的字节数
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))  # gzip 压缩级别（1-9）
+
+# iFlow 消息流录制配置（录制文件可通过 stream_trace.ReplayClient 离线回放）
+TRACE_RECORD_ENABLED = os.getenv("TRACE_RECORD_ENABLED", "false").lower() == "true"  # 是否录制每轮收到的 SDK 消息和时间
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(os.path.expanduser("~"), ".iflow2web", "traces"))  # 录制文件目录
+
+# 进程资源统计配置（基于 /proc，仅 Linux）
+PROCESS_SAMPLE_INTERVAL = float(os.getenv("PROCESS_SAMPLE_INTERVAL", "5.0"))  # 采样间隔（秒）
+SESSION_MAX_RSS_MB = int(os.getenv("SESSION_MAX_RSS_MB", "0"))  # 单个会话进程树的内存上限（MB），0 表示不限制
+SESSION_MAX_CPU_SECONDS = int(os.getenv("SESSION_MAX_CPU_SECONDS", "0"))  # 单个会话进程树的累计 CPU 时间上限（秒），0 表示不限制
+
+# 事件循环监控配置
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))  # 延迟采样间隔（秒）
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.25"))  # 循环阻塞超过该时长（秒）时抓取调用栈
+LOOP_STALL_STACK_DEPTH = int(os.getenv("LOOP_STALL_STACK_DEPTH", "30"))  # 抓取的调用栈最大深度
+
+# 内存分析配置（开启后提供 /api/admin/memory 端点并启动 tracemalloc，会增加内存分配开销）
+MEMORY_PROFILING_ENABLED = os.getenv("MEMORY_PROFILING_ENABLED", "false").lower() == "true"
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))  # 每次分配记录的调用栈深度
+
 # 日志配置
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG, INFO, WARNING, ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # text, json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # 日志队列上限，队列满时丢弃新日志而不阻塞
+LOG_MESSAGE_BODIES = os.getenv("LOG_MESSAGE_BODIES", "false").lower() == "true"  # 是否记录用户消息正文（默认只记录长度）
+LOG_BODY_MAX_CHARS = int(os.getenv("LOG_BODY_MAX_CHARS", "200"))  # 记录正文时的截断长度
+LOG_CHUNK_INTERVAL = float(os.getenv("LOG_CHUNK_INTERVAL", "5.0"))  # 流式分块日志的限速间隔（秒）
 
 # 前端配置
 TERMINAL_THEME = os.getenv("TERMINAL_THEME", "dark")  # dark, light
 TERMINAL_FONT_FAMILY = os.getenv("TERMINAL_FONT_FAMILY", "Consolas, Monaco, 'Courier New', monospace")
-TERMINAL_FONT_SIZE = os.getenv("TERMINAL_FONT_SIZE", "14px")
\ No newline at end of file
+TERMINAL_FONT_SIZE = os.getenv("TERMINAL_FONT_SIZE", "14px")
+TERMINAL_MAX_DOM_MESSAGES = int(os.getenv("TERMINAL_MAX_DOM_MESSAGES", "300"))  # 终端 DOM 中最多保留的消息数，更早的消息按需挂载
\ No newline at end of file
@@ -0,0 +1,365 @@
+"""
+工作区文件变更监听模块
+每个会话监听其工作目录（watchfiles/inotify，不可用时回退到轮询），防抖合并后通过 WebSocket 推送 files_changed 消息；
+文件差异按需加载，目录扫描始终在线程中执行
+"""
+
+import asyncio
+import difflib
+import os
+from typing import Awaitable, Callable, Optional
+from fs_browser import normalize_path
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import watchfiles  # uvicorn[standard] 自带，未安装时使用轮询
+except ImportError:
+    watchfiles = None
+
+# 不监听的目录（与 watchfiles 的默认过滤规则一致）
+IGNORED_DIRS = frozenset({
+    ".git", ".hg", ".svn", ".idea", ".venv", ".tox", ".mypy_cache", ".pytest_cache",
+    ".hypothesis", "__pycache__", "node_modules",
+})
+
+ADDED = "added"
+MODIFIED = "modified"
+DELETED = "deleted"
+
+Notify = Callable[[str, dict], Awaitable[None]]
+
+
+class ChangeSet:
+    """合并同一文件在防抖窗口内的多次变更"""
+
+    def __init__(self):
+        self._changes: dict[str, str] = {}
+
+    def add(self, path: str, change: str) -> None:
+        """
+        记录一次变更
+
+        Args:
+            path: 相对路径
+            change: added、modified 或 deleted
+        """
+        previous = self._changes.get(path)
+        if previous == ADDED:
+            if change == DELETED:
+                del self._changes[path]  # 新建后又删除，等于没有变化
+            return
+        if previous == DELETED and change == ADDED:
+            change = MODIFIED
+        self._changes[path] = change
+
+    def drain(self) -> dict[str, str]:
+        """
+        取出并清空已记录的变更
+
+        Returns:
+            dict[str, str]: 路径 -> 变更类型
+        """
+        changes, self._changes = self._changes, {}
+        return changes
+
+    def __len__(self) -> int:
+        return len(self._changes)
+
+
+def snapshot_tree(root: str, max_files: int = None) -> dict[str, tuple[int, int]]:
+    """
+    扫描目录树，记录每个文件的 (mtime_ns, size)（同步，在线程中调用）
+
+    Args:
+        root: 根目录
+        max_files: 最多记录的文件数
+
+    Returns:
+        dict[str, tuple[int, int]]: 相对路径 -> (mtime_ns, size)
+    """
+    max_files = max_files if max_files is not None else config.FILE_WATCH_MAX_SCAN
+    snapshot = {}
+    stack = [root]
+    while stack and len(snapshot) < max_files:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in IGNORED_DIRS:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            rel = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                            snapshot[rel] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return snapshot
+
+
+def diff_snapshots(old: dict, new: dict) -> list[tuple[str, str]]:
+    """
+    比较两次扫描结果
+
+    Returns:
+        list[tuple[str, str]]: (相对路径, 变更类型) 列表
+    """
+    changes = [(path, DELETED) for path in old.keys() - new.keys()]
+    for path, stat in new.items():
+        previous = old.get(path)
+        if previous is None:
+            changes.append((path, ADDED))
+        elif previous != stat:
+            changes.append((path, MODIFIED))
+    return changes
+
+
+class WorkingTreeWatcher:
+    """单个工作目录的变更监听器"""
+
+    def __init__(self, session_id: str, root: str, notify: Notify, force_polling: bool = None):
+        self.session_id = session_id
+        self.root = os.path.abspath(root)
+        self.notify = notify
+        self.force_polling = config.FILE_WATCH_FORCE_POLLING if force_polling is None else force_polling
+        self.mode: Optional[str] = None  # native 或 polling
+        self._changes = ChangeSet()
+        self._stop_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        开始监听（必须在事件循环中调用）
+        """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        停止监听
+        """
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        if watchfiles is not None and not self.force_polling:
+            try:
+                await self._watch_native()
+                return
+            except Exception as e:
+                # 例如 inotify 监听数达到系统上限
+                logger.warning(f"Native file watching failed for {self.root}: {e}, falling back to polling")
+        await self._watch_polling()
+
+    async def _watch_native(self) -> None:
+        self.mode = "native"
+        # watchfiles 在后台线程中监听，并在防抖窗口内聚合变更
+        async for changes in watchfiles.awatch(
+            self.root,
+            debounce=config.FILE_WATCH_DEBOUNCE_MS,
+            stop_event=self._stop_event,
+            ignore_permission_denied=True,
+        ):
+            # 区分文件和目录需要 stat，放到线程中执行
+            for path, change in await asyncio.to_thread(self._classify, changes):
+                self._changes.add(path, change)
+            await self._emit()
+
+    def _classify(self, changes: set) -> list[tuple[str, str]]:
+        result = []
+        for change, path in changes:
+            if change == watchfiles.Change.deleted:
+                kind = DELETED
+            elif os.path.isdir(path):
+                continue  # 目录本身的事件没有意义，其中文件的变化会单独上报
+            else:
+                kind = ADDED if change == watchfiles.Change.added else MODIFIED
+            result.append((os.path.relpath(path, self.root).replace(os.sep, "/"), kind))
+        return result
+
+    async def _watch_polling(self) -> None:
+        self.mode = "polling"
+        interval = config.FILE_WATCH_POLL_INTERVAL
+        previous = await asyncio.to_thread(snapshot_tree, self.root)
+        while not self._stop_event.is_set():
+            await asyncio.sleep(interval)
+            current = await asyncio.to_thread(snapshot_tree, self.root)
+            for path, change in diff_snapshots(previous, current):
+                self._changes.add(path, change)
+            previous = current
+            await self._emit()
+
+    async def _emit(self) -> None:
+        changes = self._changes.drain()
+        if not changes:
+            return
+        limit = config.FILE_WATCH_MAX_FILES
+        files = [{"path": path, "change": change} for path, change in sorted(changes.items())[:limit]]
+        await self.notify(self.session_id, {
+            "type": "files_changed",
+            "files": files,
+            "total": len(changes),
+            "truncated": len(changes) > limit,
+        })
+
+
+class FileWatchRegistry:
+    """按会话管理监听器：会话的第一个连接建立时开始监听，最后一个连接断开时停止"""
+
+    def __init__(self):
+        self._watchers: dict[str, WorkingTreeWatcher] = {}
+        self._refs: dict[str, int] = {}
+
+    def acquire(self, session_id: str, root: str, notify: Notify) -> None:
+        """
+        为会话增加一个引用，必要时启动监听
+
+        Args:
+            session_id: 会话 ID
+            root: 工作目录
+            notify: 推送消息的回调 (session_id, 消息)
+        """
+        if not config.FILE_WATCH_ENABLED:
+            return
+        self._refs[session_id] = self._refs.get(session_id, 0) + 1
+        if session_id not in self._watchers:
+            watcher = WorkingTreeWatcher(session_id, root, notify)
+            self._watchers[session_id] = watcher
+            watcher.start()
+
+    async def release(self, session_id: str) -> None:
+        """
+        释放会话的一个引用，没有引用时停止监听
+
+        Args:
+            session_id: 会话 ID
+        """
+        if session_id not in self._refs:
+            return
+        self._refs[session_id] -= 1
+        if self._refs[session_id] <= 0:
+            del self._refs[session_id]
+            watcher = self._watchers.pop(session_id, None)
+            if watcher is not None:
+                await watcher.stop()
+
+    async def stop_all(self) -> None:
+        """
+        停止所有监听
+        """
+        watchers = list(self._watchers.values())
+        self._watchers.clear()
+        self._refs.clear()
+        for watcher in watchers:
+            await watcher.stop()
+
+    @property
+    def count(self) -> int:
+        """当前活跃的监听器数"""
+        return len(self._watchers)
+
+
+def resolve_in_root(root: str, rel_path: str) -> str:
+    """
+    将相对路径解析到工作目录内，拒绝越出工作目录的路径
+
+    Args:
+        root: 工作目录
+        rel_path: 相对路径
+
+    Returns:
+        str: 绝对路径
+
+    Raises:
+        ValueError: 路径不在工作目录内
+    """
+    root = normalize_path(root)
+    full_path = normalize_path(os.path.join(root, rel_path))
+    if full_path == root or not full_path.startswith(root.rstrip(os.sep) + os.sep):
+        raise ValueError(f"Path is outside the working directory: {rel_path}")
+    return full_path
+
+
+def _content_diff(full_path: str, rel_path: str, max_bytes: int) -> dict:
+    """
+    没有 git 基线时，把当前文件内容作为新增内容展示（同步，在线程中调用）
+    """
+    try:
+        with open(full_path, "rb") as f:
+            content = f.read(max_bytes + 1)
+    except FileNotFoundError:
+        return {"path": rel_path, "diff": "", "binary": False, "truncated": False, "exists": False}
+    if b"\0" in content[:8192]:
+        return {"path": rel_path, "diff": "", "binary": True, "truncated": False, "exists": True}
+    truncated = len(content) > max_bytes
+    lines = content[:max_bytes].decode("utf-8", errors="replace").splitlines(keepends=True)
+    diff = "".join(difflib.unified_diff([], lines, "/dev/null", f"b/{rel_path}"))
+    return {"path": rel_path, "diff": diff, "binary": False, "truncated": truncated, "exists": True}
+
+
+async def _run_git(root: str, *args: str) -> Optional[bytes]:
+    """
+    运行 git 命令
+
+    Returns:
+        bytes: 标准输出，git 不可用或命令失败时返回 None
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "git", *args,
+            cwd=root,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+    except (OSError, NotImplementedError):
+        return None
+    return stdout if process.returncode == 0 else None
+
+
+async def file_diff(root: str, rel_path: str) -> dict:
+    """
+    获取文件相对于 git HEAD 的差异（不是 git 仓库或文件未跟踪时，展示文件当前内容）
+
+    Args:
+        root: 工作目录
+        rel_path: 相对路径
+
+    Returns:
+        dict: path、diff、binary、truncated、exists
+
+    Raises:
+        ValueError: 路径不在工作目录内
+    """
+    full_path = resolve_in_root(root, rel_path)
+    max_bytes = config.FILE_DIFF_MAX_BYTES
+
+    stdout = await _run_git(root, "diff", "--no-color", "--no-ext-diff", "HEAD", "--", full_path)
+    if stdout:
+        return {
+            "path": rel_path,
+            "diff": stdout[:max_bytes].decode("utf-8", errors="replace"),
+            "binary": b"Binary files" in stdout[:1024],
+            "truncated": len(stdout) > max_bytes,
+            "exists": os.path.exists(full_path),
+        }
+    if stdout is not None and await _run_git(root, "ls-files", "--", full_path):
+        # 已跟踪且与 HEAD 相同
+        return {"path": rel_path, "diff": "", "binary": False, "truncated": False, "exists": True}
+    return await asyncio.to_thread(_content_diff, full_path, rel_path, max_bytes)
+
+
+# 全局监听器注册表
+file_watchers = FileWatchRegistry()
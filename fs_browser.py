@@ -0,0 +1,314 @@
+"""
+工作目录浏览模块
+提供基于 os.scandir 的缓存目录索引和白名单前缀树，用于目录浏览、自动补全和创建会话时的目录校验
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_path(path: str) -> str:
+    """
+    规范化路径（展开 ~、解析符号链接、统一大小写和分隔符）
+
+    Args:
+        path: 原始路径
+
+    Returns:
+        规范化后的绝对路径
+    """
+    return os.path.normcase(os.path.realpath(os.path.expanduser(path)))
+
+
+def _split_path(normalized: str) -> list[str]:
+    """将规范化路径拆分为组件，保留驱动器/根作为第一个组件"""
+    drive, rest = os.path.splitdrive(normalized)
+    parts = [p for p in rest.split(os.sep) if p]
+    return [drive + os.sep] + parts
+
+
+class PathTrie:
+    """路径前缀树 - 判断路径是否位于某个允许的目录之下"""
+
+    _TERMINAL = "\0"
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self._root: dict = {}
+        for path in paths:
+            self.add(path)
+
+    def add(self, path: str) -> None:
+        """
+        添加允许的目录
+
+        Args:
+            path: 目录路径
+        """
+        node = self._root
+        for part in _split_path(normalize_path(path)):
+            node = node.setdefault(part, {})
+        node[self._TERMINAL] = True
+
+    def contains(self, path: str) -> bool:
+        """
+        判断路径是否等于或位于某个已添加的目录之下
+
+        Args:
+            path: 待检查的路径
+
+        Returns:
+            bool: 是否允许
+        """
+        node = self._root
+        for part in _split_path(normalize_path(path)):
+            if self._TERMINAL in node:
+                return True
+            node = node.get(part)
+            if node is None:
+                return False
+        return self._TERMINAL in node
+
+    def is_ancestor(self, path: str) -> bool:
+        """
+        判断路径是否为某个已添加目录的上级目录（本身不在白名单内）
+
+        Args:
+            path: 待检查的路径
+
+        Returns:
+            bool: 是否为上级目录
+        """
+        node = self._root
+        for part in _split_path(normalize_path(path)):
+            if self._TERMINAL in node:
+                return False
+            node = node.get(part)
+            if node is None:
+                return False
+        return self._TERMINAL not in node
+
+
+class _CachedDir:
+    """目录缓存条目"""
+
+    __slots__ = ("mtime_ns", "checked_at", "entries")
+
+    def __init__(self, mtime_ns: int, checked_at: float, entries: list[tuple[str, bool]]):
+        self.mtime_ns = mtime_ns
+        self.checked_at = checked_at
+        self.entries = entries
+
+
+class DirectoryIndex:
+    """目录索引 - 缓存 scandir 结果，仅在目录 mtime 变化时重新扫描"""
+
+    def __init__(self, max_dirs: int = None, ttl: float = None):
+        self.max_dirs = max_dirs if max_dirs is not None else config.FS_INDEX_MAX_DIRS
+        self.ttl = ttl if ttl is not None else config.FS_INDEX_TTL
+        self._dirs: OrderedDict[str, _CachedDir] = OrderedDict()
+        # 多个 to_thread 线程共享缓存：锁只保护 OrderedDict 的读写，stat 和 scandir 在锁外执行
+        self._lock = threading.Lock()
+        self._trie: Optional[PathTrie] = None
+        self._trie_source: Optional[tuple] = None
+        self.scans = 0
+
+    def allowed_trie(self) -> Optional[PathTrie]:
+        """
+        获取白名单前缀树（配置变化时自动重建）
+
+        Returns:
+            PathTrie，未配置白名单时返回 None
+        """
+        allowed = config.ALLOWED_WORKING_DIRS
+        if allowed is None:
+            return None
+        source = tuple(allowed)
+        if self._trie is None or self._trie_source != source:
+            self._trie = PathTrie(source)
+            self._trie_source = source
+        return self._trie
+
+    def is_allowed(self, path: str) -> bool:
+        """
+        判断路径是否在白名单内
+
+        Args:
+            path: 目录路径
+
+        Returns:
+            bool: 是否允许
+        """
+        trie = self.allowed_trie()
+        return trie is None or trie.contains(path)
+
+    def _scan(self, path: str) -> list[tuple[str, bool]]:
+        """扫描目录，返回 (名称, 是否目录) 列表"""
+        with self._lock:
+            self.scans += 1
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    entries.append((entry.name, entry.is_dir()))
+                except OSError:
+                    continue
+        entries.sort(key=lambda e: (not e[1], e[0].lower()))
+        return entries
+
+    def list_dir(self, path: str) -> list[tuple[str, bool]]:
+        """
+        列出目录内容（同步，应在线程中调用）
+
+        缓存未过期时直接返回；过期后先比较目录 mtime，只有变化时才重新扫描
+
+        Args:
+            path: 目录路径
+
+        Returns:
+            list[tuple[str, bool]]: (名称, 是否目录) 列表
+
+        Raises:
+            OSError: 目录不存在或无法访问
+        """
+        key = normalize_path(path)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._dirs.get(key)
+            if cached is not None:
+                self._dirs.move_to_end(key)
+                if now - cached.checked_at < self.ttl:
+                    return cached.entries
+
+        mtime_ns = os.stat(key).st_mtime_ns
+        if cached is not None and mtime_ns == cached.mtime_ns:
+            cached.checked_at = now
+            return cached.entries
+
+        entries = self._scan(key)
+        with self._lock:
+            # 扫描期间条目可能已被其他线程更新或淘汰，统一以新结果写入
+            self._dirs[key] = _CachedDir(mtime_ns, now, entries)
+            self._dirs.move_to_end(key)
+            while len(self._dirs) > self.max_dirs:
+                self._dirs.popitem(last=False)
+        return entries
+
+    def is_dir(self, path: str) -> bool:
+        """
+        判断路径是否为目录（优先使用缓存）
+
+        Args:
+            path: 路径
+
+        Returns:
+            bool: 是否为已存在的目录
+        """
+        key = normalize_path(path)
+        with self._lock:
+            cached = self._dirs.get(key)
+        if cached is not None and time.monotonic() - cached.checked_at < self.ttl:
+            return True
+        return os.path.isdir(key)
+
+    def browse(self, path: str, dirs_only: bool = True) -> dict:
+        """
+        浏览目录（同步）
+
+        Args:
+            path: 目录路径
+            dirs_only: 是否只返回子目录
+
+        Returns:
+            dict: 包含 path、parent 和 entries 的字典
+        """
+        abs_path = os.path.abspath(os.path.expanduser(path))
+        entries = []
+        for name, is_dir in self.list_dir(abs_path):
+            if dirs_only and not is_dir:
+                continue
+            entries.append({"name": name, "path": os.path.join(abs_path, name), "is_dir": is_dir})
+            if len(entries) >= config.FS_MAX_ENTRIES:
+                break
+
+        parent = os.path.dirname(abs_path)
+        if parent == abs_path or not self.is_allowed(parent):
+            parent = None
+        return {"path": abs_path, "parent": parent, "entries": entries}
+
+    def complete(self, partial: str, limit: int = 20) -> list[dict]:
+        """
+        自动补全目录路径（同步）
+
+        白名单目录的上级目录也会作为候选返回（不可选），以便从根目录逐级补全到白名单目录
+
+        Args:
+            partial: 用户输入的部分路径
+            limit: 最多返回的候选数
+
+        Returns:
+            list[dict]: 候选列表，每项包含 path 和 selectable
+        """
+        expanded = os.path.expanduser(partial)
+        base, prefix = os.path.split(expanded)
+        if not base:
+            return []
+        try:
+            entries = self.list_dir(base)
+        except OSError:
+            return []
+
+        trie = self.allowed_trie()
+        prefix_key = os.path.normcase(prefix)
+        suggestions = []
+        for name, is_dir in entries:
+            if not is_dir or not os.path.normcase(name).startswith(prefix_key):
+                continue
+            candidate = os.path.join(base, name)
+            if trie is None or trie.contains(candidate):
+                suggestions.append({"path": candidate, "selectable": True})
+            elif trie.is_ancestor(candidate):
+                suggestions.append({"path": candidate, "selectable": False})
+            else:
+                continue
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+    def roots(self) -> list[str]:
+        """
+        获取浏览起点（白名单目录，或默认工作目录）
+
+        Returns:
+            list[str]: 起点目录列表
+        """
+        if config.ALLOWED_WORKING_DIRS is not None:
+            return list(config.ALLOWED_WORKING_DIRS)
+        return [config.IFLOW_DEFAULT_WORKING_DIR or os.getcwd()]
+
+    async def is_allowed_async(self, path: str) -> bool:
+        """在线程中判断路径是否在白名单内（解析符号链接需要逐级 lstat）"""
+        return await asyncio.to_thread(self.is_allowed, path)
+
+    async def is_dir_async(self, path: str) -> bool:
+        """在线程中判断路径是否为目录"""
+        return await asyncio.to_thread(self.is_dir, path)
+
+    async def browse_async(self, path: str, dirs_only: bool = True) -> dict:
+        """在线程中浏览目录，避免阻塞事件循环"""
+        return await asyncio.to_thread(self.browse, path, dirs_only)
+
+    async def complete_async(self, partial: str, limit: int = 20) -> list[dict]:
+        """在线程中自动补全，避免阻塞事件循环"""
+        return await asyncio.to_thread(self.complete, partial, limit)
+
+
+# 全局目录索引实例
+directory_index = DirectoryIndex()
@@ -6,7 +6,9 @@ iFlow SDK 管理模块
 
 import asyncio
 import os
-from typing import AsyncGenerator, Optional
+import time
+from collections import Counter
+from typing import AsyncGenerator, AsyncIterable, Optional
 from iflow_sdk import IFlowClient, IFlowOptions, ApprovalMode
 from iflow_sdk.types import (
     AssistantMessage,
@@ -14,10 +16,14 @@ from iflow_sdk.types import (
     PlanMessage,
     TaskFinishMessage,
 )
+from transcript_store import transcript_store, build_replay_prompt
+from stream_trace import TraceRecorder
+from search_index import search_index
+from usage_stats import TurnUsage, usage_tracker
+from model_stats import model_performance, select_default_model
 import config
 import logging
 
-logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 
@@ -38,52 +44,333 @@ def mask_sensitive_data(data: str, mask_char: str = "*", visible_chars: int = 4)
     return data[:visible_chars] + mask_char * (len(data) - visible_chars)
 
 
+# 流式响应超时次数统计：turn_timeout（整轮超时）、idle_timeout（分块间隔超时）
+stream_timeouts: Counter = Counter()
+
+
+# 崩溃恢复统计：crashes（检测到客户端失效）、restarts（自动重启成功）、spawn_failures（启动失败）
+recovery_stats: Counter = Counter()
+
+
+class IFlowSpawnError(Exception):
+    """iFlow 客户端启动失败"""
+
+
+class IFlowUnavailableError(Exception):
+    """熔断器打开，暂时不再启动 iFlow 客户端"""
+
+
+class CircuitBreaker:
+    """
+    全局熔断器：连续启动失败达到阈值后暂停所有启动，冷却后只放行一次试探
+    """
+
+    def __init__(self, threshold: int = None, cooldown: float = None):
+        self.threshold = threshold if threshold is not None else config.IFLOW_BREAKER_THRESHOLD
+        self.cooldown = cooldown if cooldown is not None else config.IFLOW_BREAKER_COOLDOWN
+        self.failures = 0
+        self.trips = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        """closed、open 或 half_open"""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        是否允许启动（半开状态下只允许一个试探）
+
+        Returns:
+            bool: 是否允许
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """记录一次启动成功，关闭熔断器"""
+        self.failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        """结束试探但不计入成败（启动尝试本身预期可能失败时，例如原生恢复）"""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """记录一次启动失败，达到阈值或试探失败时打开熔断器"""
+        self.failures += 1
+        was_trial = self._trial_in_flight
+        self._trial_in_flight = False
+        if was_trial or (self._opened_at is None and self.failures >= self.threshold):
+            self._opened_at = time.monotonic()
+            self.trips += 1
+            logger.error(f"iFlow spawn circuit breaker opened after {self.failures} consecutive failures")
+
+    def retry_after(self) -> float:
+        """
+        距离允许试探的剩余秒数
+
+        Returns:
+            float: 秒数，未打开时为 0
+        """
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def snapshot(self) -> dict:
+        """
+        获取熔断器状态
+
+        Returns:
+            dict: 状态、连续失败次数、打开次数和剩余冷却时间
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+# 全局启动熔断器
+spawn_breaker = CircuitBreaker()
+
+
+class StreamTimeout(Exception):
+    """流式响应超时"""
+
+    def __init__(self, reason: str, timeout: float):
+        super().__init__(f"{reason} after {timeout:.0f}s")
+        self.reason = reason
+        self.timeout = timeout
+
+
+def hibernation_supported() -> bool:
+    """
+    休眠后能否恢复对话上下文（原生恢复或通过会话记录重放）
+
+    Returns:
+        bool: 两者都不可用时返回 False，此时休眠会丢失整个对话，不应休眠
+    """
+    return config.TRANSCRIPT_ENABLED or config.SESSION_NATIVE_RESUME
+
+
 class IFlowSession:
     """iFlow 会话 - 每个会话有独立的客户端"""
 
+    __slots__ = (
+        "session_id", "working_dir", "model", "_client", "_lock", "last_active", "busy", "hibernated",
+        "_resume_id", "_needs_replay", "_crashed", "restarts", "turns",
+    )
+
     def __init__(self, session_id: str, working_dir: str, model: str = None):
         self.session_id = session_id
         self.working_dir = working_dir
         self.model = model or config.IFLOW_DEFAULT_MODEL
         self._client: Optional[IFlowClient] = None
         self._lock: asyncio.Lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+        self.busy = False
+        self.hibernated = False
+        self._resume_id: Optional[str] = None  # iFlow CLI 的会话 ID，用于原生恢复
+        self._needs_replay = False
+        self._crashed = False
+        self.restarts = 0
+        self.turns = 0  # 本进程中已进行的对话轮数（包括回放缓存的轮次）
+
+    @property
+    def pid(self) -> Optional[int]:
+        """由本会话启动的 iFlow CLI 进程 ID，未启动或已退出时为 None"""
+        process_manager = getattr(self._client, "_process_manager", None)
+        process = getattr(process_manager, "_process", None)
+        if process is None or process.returncode is not None:
+            return None
+        return process.pid
 
     async def initialize(self) -> None:
-        """初始化 iFlow 客户端"""
+        """初始化 iFlow 客户端（休眠后再次初始化时恢复对话上下文）"""
         async with self._lock:
             if self._client is None:
-                # 使用绝对路径
-                abs_working_dir = os.path.abspath(self.working_dir)
-
-                # 验证工作目录是否存在
-                if not os.path.exists(abs_working_dir):
-                    error_msg = f"工作目录不存在: {abs_working_dir}"
-                    logger.error(error_msg)
-                    raise FileNotFoundError(error_msg)
-
-                if not os.path.isdir(abs_working_dir):
-                    error_msg = f"路径不是目录: {abs_working_dir}"
-                    logger.error(error_msg)
-                    raise NotADirectoryError(error_msg)
-
-                # 创建 iFlow 配置
-                # 注意：模型配置需要在 iFlow CLI 的配置文件中设置（~/.iflow/settings.json）
-                # 这里通过 metadata 传递模型信息，用于日志记录
-                options = IFlowOptions(
-                    approval_mode=ApprovalMode[config.IFLOW_APPROVAL_MODE],
-                    auto_start_process=True,  # 自动管理 iFlow 进程
-                    cwd=abs_working_dir,  # 设置工作目录
-                    metadata={"model": self.model, "session_id": self.session_id}
-                )
-
-                # 创建客户端
-                self._client = IFlowClient(options)
-                await self._client.__aenter__()
+                # 文件系统检查在线程中执行，不阻塞事件循环
+                abs_working_dir = await asyncio.to_thread(self._check_working_dir, self.working_dir)
+
+                resume_id = self._resume_id if self.hibernated and config.SESSION_NATIVE_RESUME else None
+                client = None
+                if resume_id:
+                    # 原生恢复失败（iFlow 尚不支持 loadSession 或会话已失效）时不计入熔断器，改用新会话并重放上下文
+                    try:
+                        client = await self._start_client(abs_working_dir, resume_id, count_failure=False)
+                    except IFlowSpawnError as e:
+                        logger.warning(f"Native resume failed for session {self.session_id} ({e}), falling back to context replay")
+                    else:
+                        if getattr(client, "_session_id", None) != resume_id:
+                            logger.warning(f"Native resume failed for session {self.session_id}, falling back to context replay")
+                            await client.__aexit__(None, None, None)
+                            client = None
+                    if client is None:
+                        resume_id = None
+                        self._resume_id = None
+                if client is None:
+                    client = await self._start_client(abs_working_dir, None)
+                self._client = client
+
+                if self.hibernated:
+                    self._needs_replay = resume_id is None
+                    self.hibernated = False
+                    logger.info(f"Rehydrated session {self.session_id} ({'native resume' if resume_id else 'context replay'})")
                 logger.info(f"Initialized iFlow client for session: {mask_sensitive_data(self.session_id)}, working_dir: {abs_working_dir}, model: {self.model}")
 
+    def is_healthy(self) -> bool:
+        """
+        检查客户端是否仍然可用（已连接且 iFlow 进程未退出）
+
+        Returns:
+            bool: 是否可用，客户端未启动时返回 False
+        """
+        client = self._client
+        if client is None or getattr(client, "_connected", True) is False:
+            return False
+        process = getattr(getattr(client, "_process_manager", None), "_process", None)
+        return not isinstance(getattr(process, "returncode", None), int)
+
+    async def _discard_client(self) -> None:
+        """
+        丢弃已失效的客户端，下一轮自动重启并重放上下文
+        """
+        async with self._lock:
+            client = self._client
+            if client is None:
+                return
+            self._client = None
+            self._crashed = True
+            self._needs_replay = True
+            recovery_stats["crashes"] += 1
+        logger.warning(f"iFlow client for session {self.session_id} is no longer healthy, discarding")
+        try:
+            await asyncio.wait_for(client.__aexit__(None, None, None), timeout=5.0)
+        except Exception as e:
+            logger.debug(f"Error closing dead iFlow client for session {self.session_id}: {e}")
+
+    async def _start_with_backoff(self) -> None:
+        """
+        启动客户端，失败时按指数退避重试
+        """
+        attempts = max(1, config.IFLOW_RESPAWN_ATTEMPTS)
+        for attempt in range(attempts):
+            try:
+                await self.initialize()
+                return
+            except IFlowSpawnError as e:
+                if attempt == attempts - 1:
+                    raise
+                delay = min(config.IFLOW_RESPAWN_BASE_DELAY * 2 ** attempt, config.IFLOW_RESPAWN_MAX_DELAY)
+                logger.warning(f"Failed to start iFlow for session {self.session_id} ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _start_client(self, abs_working_dir: str, resume_id: Optional[str], count_failure: bool = True) -> IFlowClient:
+        """
+        启动 iFlow 客户端（受全局熔断器保护）
+
+        Args:
+            abs_working_dir: 工作目录
+            resume_id: 要恢复的 iFlow 会话 ID，None 表示新会话
+            count_failure: 失败是否计入熔断器（原生恢复失败时会改用新会话，不计入）
+        """
+        if not spawn_breaker.allow():
+            raise IFlowUnavailableError(f"iFlow 暂时不可用（连续启动失败），请在 {spawn_breaker.retry_after():.0f} 秒后重试")
+
+        # 创建 iFlow 配置
+        # 注意：模型配置需要在 iFlow CLI 的配置文件中设置（~/.iflow/settings.json）
+        # 这里通过 metadata 传递模型信息，用于日志记录
+        options = IFlowOptions(
+            approval_mode=ApprovalMode[config.IFLOW_APPROVAL_MODE],
+            auto_start_process=True,  # 自动管理 iFlow 进程
+            cwd=abs_working_dir,  # 设置工作目录
+            metadata={"model": self.model, "session_id": self.session_id},
+            session_id=resume_id,
+        )
+
+        # 创建客户端
+        client = IFlowClient(options)
+        try:
+            await client.__aenter__()
+        except Exception as e:
+            if count_failure:
+                spawn_breaker.record_failure()
+                recovery_stats["spawn_failures"] += 1
+            else:
+                spawn_breaker.release()
+            try:
+                await client.__aexit__(None, None, None)
+            except Exception:
+                pass
+            raise IFlowSpawnError(str(e) or type(e).__name__) from e
+        spawn_breaker.record_success()
+        return client
+
+    async def hibernate(self) -> bool:
+        """
+        休眠会话：记录可恢复的会话 ID 后释放 iFlow 进程，对话记录已持久化
+
+        Returns:
+            bool: 是否已休眠（正在处理消息或客户端未启动时不休眠）
+        """
+        async with self._lock:
+            if self._client is None or self.busy:
+                return False
+            # 先摘下客户端再关闭：关闭期间开始的一轮看到的是已休眠的会话，会等待锁并重新初始化，
+            # 而不是在正在关闭的客户端上发送消息
+            client, self._client = self._client, None
+            self.hibernated = True
+            self._resume_id = getattr(client, "_session_id", None) or self._resume_id
+            try:
+                await client.__aexit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error closing hibernated iFlow client for session {self.session_id}: {e}")
+            logger.info(f"Hibernated idle session: {self.session_id}")
+            return True
+
+    @staticmethod
+    def _check_working_dir(working_dir: str) -> str:
+        """
+        验证工作目录（同步，在线程中调用）
+
+        Args:
+            working_dir: 工作目录
+
+        Returns:
+            str: 工作目录的绝对路径
+        """
+        # 使用绝对路径
+        abs_working_dir = os.path.abspath(working_dir)
+
+        # 验证工作目录是否存在
+        if not os.path.exists(abs_working_dir):
+            error_msg = f"工作目录不存在: {abs_working_dir}"
+            logger.error(error_msg)
+            raise FileNotFoundError(error_msg)
+
+        if not os.path.isdir(abs_working_dir):
+            error_msg = f"路径不是目录: {abs_working_dir}"
+            logger.error(error_msg)
+            raise NotADirectoryError(error_msg)
+
+        return abs_working_dir
+
     async def send_message(self, message: str) -> AsyncGenerator[dict, None]:
         """
-        发送消息给 iFlow 并接收响应
+        发送消息给 iFlow 并接收响应（同时写入会话记录）
 
         Args:
             message: 用户消息
@@ -91,14 +378,216 @@ class IFlowSession:
         Yields:
             dict: 消息数据，包含 type 和 content
         """
-        if self._client is None:
-            await self.initialize()
+        self.busy = True
+        self.turns += 1
+        self.last_active = time.monotonic()
+        deadline = time.monotonic() + config.IFLOW_TURN_TIMEOUT if config.IFLOW_TURN_TIMEOUT > 0 else None
+        try:
+            # 进程已退出或连接已断开时丢弃旧客户端，重新启动
+            if self._client is not None and not self.is_healthy():
+                await self._discard_client()
+            if self._client is None:
+                await self._start_with_backoff()
+            if self._crashed:
+                self._crashed = False
+                self.restarts += 1
+                recovery_stats["restarts"] += 1
+                logger.info(f"Recovered iFlow session {self.session_id} (restart #{self.restarts})")
+                yield {
+                    "type": "recovered",
+                    "content": "iFlow 进程意外退出，已自动重启，并通过会话记录恢复了上下文",
+                    "restarts": self.restarts,
+                    "is_stream": False,
+                }
 
-        # 发送消息
-        await self._client.send_message(message)
+            prompt = message
+            if self._needs_replay:
+                entries = await transcript_store.read(self.session_id)
+                prompt = build_replay_prompt(entries, message)
+                self._needs_replay = False
+
+            # 录制本轮收到的 SDK 消息流，供离线回放
+            recorder = TraceRecorder(self.session_id, prompt, self.model) if config.TRACE_RECORD_ENABLED else None
+            # 本轮用量先局部累计，结束时一次合并到会话和模型的累计值
+            usage = TurnUsage() if config.USAGE_ENABLED else None
+            finished = False
+            try:
+                # 发送消息
+                await asyncio.wait_for(self._client.send_message(prompt), self._remaining(deadline))
+                await self._record("user", message)
+
+                assistant_text = []
+                async for response in self._receive_responses(deadline, recorder, usage):
+                    if response["type"] == "assistant":
+                        assistant_text.append(response["content"])
+                    elif response["type"] == "finish":
+                        finished = True
+                        if assistant_text:
+                            await self._record("assistant", "".join(assistant_text))
+                    yield response
+            except (asyncio.CancelledError, GeneratorExit):
+                # 调用方取消或提前关闭（例如客户端断开）：本轮未读完的消息（包括 TaskFinish）仍在 SDK 队列中，
+                # 会被下一轮先读到，所以中断并重启客户端，下一轮通过重放会话记录恢复上下文
+                if not finished:
+                    if usage is not None:
+                        usage.outcome = "cancelled"
+                    logger.info(f"iFlow turn for session {self.session_id} cancelled, aborting")
+                    await self._abort_turn()
+                raise
+            except (StreamTimeout, asyncio.TimeoutError) as e:
+                reason = e.reason if isinstance(e, StreamTimeout) else "turn_timeout"
+                stream_timeouts[reason] += 1
+                if usage is not None:
+                    usage.outcome = reason
+                logger.warning(f"iFlow turn for session {self.session_id} aborted: {reason}")
+                await self._abort_turn()
+                yield {
+                    "type": "error",
+                    "content": "iFlow 长时间没有响应，本轮已取消" if reason == "idle_timeout" else "iFlow 响应超时，本轮已取消",
+                    "reason": reason,
+                    "is_stream": False,
+                }
+                yield {
+                    "type": "finish",
+                    "content": "Task aborted",
+                    "reason": reason,
+                    "timed_out": True,
+                    "is_stream": False,
+                }
+            except Exception:
+                if usage is not None:
+                    usage.outcome = "error"
+                raise
+            finally:
+                if usage is not None:
+                    usage_tracker.record_turn(self.session_id, self.model, usage)
+                    model_performance.record(self.model, usage)
+                if recorder is not None:
+                    await recorder.save()
+        finally:
+            self.busy = False
+            self.last_active = time.monotonic()
+
+    async def replay_cached(self, message: str, frames: AsyncIterable[dict]) -> AsyncGenerator[dict, None]:
+        """
+        转发响应缓存命中的帧流，并像实际对话一样写入会话记录、搜索索引和用量统计
+
+        缓存的回复没有经过 iFlow 进程，下一轮实际对话通过重放会话记录让 iFlow 看到这一轮；
+        回放的耗时不代表模型的性能，不计入模型性能统计
+
+        Args:
+            message: 用户消息
+            frames: 缓存的帧流
 
-        # 接收响应流
-        async for msg in self._client.receive_messages():
+        Yields:
+            dict: 消息数据
+        """
+        self.busy = True
+        self.turns += 1
+        usage = TurnUsage() if config.USAGE_ENABLED else None
+        if usage is not None:
+            usage.outcome = "cached"
+        try:
+            await self._record("user", message)
+            assistant_text = []
+            async for frame in frames:
+                if frame.get("type") == "assistant":
+                    assistant_text.append(frame.get("content", ""))
+                    if usage is not None:
+                        usage.observe_text(frame.get("content", ""))
+                elif frame.get("type") == "finish" and assistant_text:
+                    await self._record("assistant", "".join(assistant_text))
+                yield frame
+            if config.TRANSCRIPT_ENABLED:
+                self._needs_replay = True
+        finally:
+            if usage is not None:
+                usage_tracker.record_turn(self.session_id, self.model, usage)
+            self.busy = False
+            self.last_active = time.monotonic()
+
+    async def _record(self, role: str, content: str) -> None:
+        """
+        写入会话记录，并加入全文搜索的待索引队列
+        """
+        if config.TRANSCRIPT_ENABLED:
+            await transcript_store.append(self.session_id, role, content)
+        search_index.add(self.session_id, role, content)
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        """距离整轮截止时间的剩余秒数，不限时返回 None"""
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    async def _iter_messages(
+        self,
+        deadline: Optional[float],
+        recorder: Optional[TraceRecorder] = None,
+        usage: Optional[TurnUsage] = None,
+    ) -> AsyncGenerator:
+        """
+        逐条接收 iFlow 消息，超过分块间隔或整轮截止时间时抛出 StreamTimeout
+        """
+        messages = self._client.receive_messages().__aiter__()
+        idle_timeout = config.IFLOW_IDLE_TIMEOUT if config.IFLOW_IDLE_TIMEOUT > 0 else None
+        while True:
+            remaining = self._remaining(deadline)
+            if remaining is not None and (idle_timeout is None or remaining <= idle_timeout):
+                timeout, reason = remaining, "turn_timeout"
+            else:
+                timeout, reason = idle_timeout, "idle_timeout"
+            try:
+                msg = await asyncio.wait_for(messages.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise StreamTimeout(reason, config.IFLOW_TURN_TIMEOUT if reason == "turn_timeout" else idle_timeout)
+            if recorder is not None:
+                recorder.record(msg)
+            if usage is not None:
+                usage.observe(msg)
+            yield msg
+
+    async def _abort_turn(self) -> None:
+        """
+        取消卡住的一轮对话：中断后重启客户端，下一轮通过重放会话记录恢复上下文
+        """
+        client = self._client
+        if client is None:
+            return
+        try:
+            await asyncio.wait_for(client.interrupt(), timeout=5.0)
+        except Exception as e:
+            logger.debug(f"Interrupt failed for session {self.session_id}: {e}")
+        async with self._lock:
+            if self._client is client:
+                try:
+                    await asyncio.wait_for(client.__aexit__(None, None, None), timeout=10.0)
+                except Exception as e:
+                    logger.warning(f"Error closing stalled iFlow client for session {self.session_id}: {e}")
+                self._client = None
+                self._needs_replay = True
+
+    async def _receive_responses(
+        self,
+        deadline: Optional[float] = None,
+        recorder: Optional[TraceRecorder] = None,
+        usage: Optional[TurnUsage] = None,
+    ) -> AsyncGenerator[dict, None]:
+        """
+        接收响应流并转换为前端消息格式
+
+        Args:
+            deadline: 整轮截止时间（time.monotonic），None 表示不限时
+            recorder: 消息流录制器，None 表示不录制
+            usage: 本轮用量，None 表示不统计
+
+        Yields:
+            dict: 消息数据
+        """
+        async for msg in self._iter_messages(deadline, recorder, usage):
             if isinstance(msg, AssistantMessage):
                 # AI 回复消息（流式）
                 response = {
@@ -176,34 +665,121 @@ class IFlowManager:
     _instance: Optional["IFlowManager"] = None
     _sessions: dict[str, IFlowSession] = {}
     _lock: asyncio.Lock = asyncio.Lock()
+    _models_cache: Optional[dict] = None
+    _models_fetched_at: float = 0.0
+    models_version: int = 0
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
 
-    @staticmethod
-    async def get_available_models() -> dict:
+    @property
+    def session_count(self) -> int:
+        """当前活跃的 iFlow 会话数"""
+        return len(self._sessions)
+
+    def active_sessions(self) -> dict[str, IFlowSession]:
         """
-        从API获取可用的模型列表，并合并配置文件中的额外模型
+        获取当前活跃的 iFlow 会话（副本）
+
+        Returns:
+            dict[str, IFlowSession]: session_id -> 会话
+        """
+        return dict(self._sessions)
+
+    async def get_available_models(self, force_refresh: bool = False) -> dict:
+        """
+        获取可用的模型列表（带缓存，过期后重新从API获取）
+
+        Args:
+            force_refresh: 是否忽略缓存强制刷新
 
         Returns:
             dict: 包含 default_model 和 available_models 的字典
         """
+        cache_valid = (
+            IFlowManager._models_cache is not None
+            and time.monotonic() - IFlowManager._models_fetched_at < config.MODELS_CACHE_TTL
+        )
+        if cache_valid and not force_refresh:
+            return self._with_selected_default(IFlowManager._models_cache)
+
+        models = await self._fetch_available_models()
+        if models != IFlowManager._models_cache:
+            IFlowManager.models_version += 1
+        IFlowManager._models_cache = models
+        IFlowManager._models_fetched_at = time.monotonic()
+        return self._with_selected_default(models)
+
+    def get_cached_models(self) -> dict:
+        """
+        获取缓存的模型列表（不发起网络请求），尚未获取时返回配置中的模型
+
+        Returns:
+            dict: 包含 default_model 和 available_models 的字典
+        """
+        if IFlowManager._models_cache is not None:
+            return self._with_selected_default(IFlowManager._models_cache)
+        return self._with_selected_default({
+            "default_model": config.IFLOW_DEFAULT_MODEL,
+            "available_models": config.IFLOW_AVAILABLE_MODELS,
+        })
+
+    @staticmethod
+    def _with_selected_default(models: dict) -> dict:
+        """
+        按 MODEL_SELECTION_POLICY 用观测到的性能替换默认模型（static 策略时原样返回）
+
+        Args:
+            models: 包含 default_model 和 available_models 的字典
+
+        Returns:
+            dict: 同样结构的字典，另含 configured_default_model
+        """
+        if config.MODEL_SELECTION_POLICY == "static":
+            return models
+        selected = select_default_model(models["available_models"], models["default_model"])
+        return {**models, "default_model": selected, "configured_default_model": models["default_model"]}
+
+    def default_model(self) -> str:
+        """
+        新会话的默认模型（不发起网络请求）
+
+        Returns:
+            str: 模型名称
+        """
+        return self.get_cached_models()["default_model"]
+
+    @staticmethod
+    def _read_settings() -> dict:
+        """
+        读取 iFlow CLI 配置文件（同步，在线程中调用）
+
+        Returns:
+            dict: 配置内容，文件不存在时返回空字典
+        """
         import json
-        import os
 
-        try:
-            # 读取配置文件获取API密钥
-            settings_path = os.path.expanduser("~/.iflow/settings.json")
-            api_key = None
-            base_url = "https://apis.iflow.cn/v1"
+        settings_path = os.path.expanduser("~/.iflow/settings.json")
+        if not os.path.exists(settings_path):
+            return {}
+        with open(settings_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
 
-            if os.path.exists(settings_path):
-                with open(settings_path, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                    api_key = settings.get("apiKey")
-                    base_url = settings.get("baseUrl", "https://apis.iflow.cn/v1")
+    @staticmethod
+    async def _fetch_available_models() -> dict:
+        """
+        从API获取可用的模型列表，并合并配置文件中的额外模型
+
+        Returns:
+            dict: 包含 default_model 和 available_models 的字典
+        """
+        try:
+            # 读取配置文件获取API密钥（文件 I/O 在线程中执行）
+            settings = await asyncio.to_thread(IFlowManager._read_settings)
+            api_key = settings.get("apiKey")
+            base_url = settings.get("baseUrl", "https://apis.iflow.cn/v1")
 
             # 获取当前配置的默认模型（使用代码中的默认值）
             default_model = config.IFLOW_DEFAULT_MODEL
@@ -280,6 +856,21 @@ class IFlowManager:
                 logger.info(f"Created new iFlow session: {session_id}, model: {model}")
             return self._sessions[session_id]
 
+    async def has_history(self, session_id: str) -> bool:
+        """
+        会话是否已有对话（本进程中的轮次，或持久化的会话记录）
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            bool: 是否已有对话
+        """
+        session = self._sessions.get(session_id)
+        if session is not None and session.turns > 0:
+            return True
+        return config.TRANSCRIPT_ENABLED and await transcript_store.has_entries(session_id)
+
     async def close_session(self, session_id: str) -> None:
         """
         关闭会话
@@ -293,6 +884,86 @@ class IFlowManager:
                 del self._sessions[session_id]
                 logger.info(f"Closed iFlow session: {session_id}")
 
+    @property
+    def hibernated_count(self) -> int:
+        """当前处于休眠状态的 iFlow 会话数"""
+        return sum(1 for session in self._sessions.values() if session.hibernated)
+
+    async def hibernate_idle(self, idle_seconds: float) -> int:
+        """
+        休眠空闲时间超过阈值的会话
+
+        Args:
+            idle_seconds: 空闲阈值（秒）
+
+        Returns:
+            int: 本次休眠的会话数
+        """
+        if not hibernation_supported():
+            return 0
+        now = time.monotonic()
+        count = 0
+        for session in list(self._sessions.values()):
+            if not session.busy and now - session.last_active >= idle_seconds:
+                if await session.hibernate():
+                    count += 1
+        return count
+
+    async def run_hibernation(self) -> None:
+        """
+        后台任务：定期休眠空闲会话
+        """
+        if not hibernation_supported():
+            logger.warning("Session hibernation disabled: neither TRANSCRIPT_ENABLED nor SESSION_NATIVE_RESUME can restore the conversation")
+            return
+        idle_seconds = config.SESSION_HIBERNATE_AFTER
+        while True:
+            await asyncio.sleep(max(idle_seconds / 4, 5.0))
+            try:
+                await self.hibernate_idle(idle_seconds)
+            except Exception as e:
+                logger.error(f"Error hibernating idle sessions: {e}", exc_info=True)
+
+    async def check_health(self) -> int:
+        """
+        检查所有空闲会话的客户端，提前释放已失效的客户端
+
+        Returns:
+            int: 发现的失效客户端数
+        """
+        count = 0
+        for session in list(self._sessions.values()):
+            if session._client is not None and not session.busy and not session.is_healthy():
+                await session._discard_client()
+                count += 1
+        return count
+
+    async def run_health_checks(self) -> None:
+        """
+        后台任务：定期检查客户端健康状态
+        """
+        while True:
+            await asyncio.sleep(config.IFLOW_HEALTH_CHECK_INTERVAL)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"Error checking iFlow client health: {e}", exc_info=True)
+
+    def recovery_snapshot(self) -> dict:
+        """
+        获取崩溃恢复统计
+
+        Returns:
+            dict: 全局计数、熔断器状态和每个会话的重启次数
+        """
+        return {
+            "crashes": recovery_stats["crashes"],
+            "restarts": recovery_stats["restarts"],
+            "spawn_failures": recovery_stats["spawn_failures"],
+            "breaker": spawn_breaker.snapshot(),
+            "session_restarts": {sid: session.restarts for sid, session in self._sessions.items() if session.restarts},
+        }
+
     async def close_all(self) -> None:
         """关闭所有会话"""
         async with self._lock:
@@ -0,0 +1,191 @@
+"""
+日志模块
+基于队列的非阻塞日志管道：协程中只把日志记录放入队列，格式化输出和磁盘 I/O 在后台线程完成
+支持可选的 JSON 结构化输出、消息正文脱敏/截断，以及高频事件（如流式分块）的限速
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+import config
+
+# LogRecord 的标准属性，JSON 输出时只附加 extra 传入的其他字段
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON 结构化日志格式，每条记录一行"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列已满时丢弃日志记录（并计数），而不是阻塞事件循环"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """
+    高频日志限速器：同一个键在时间间隔内最多输出一条，期间被抑制的条数附加在下一条日志中
+    """
+
+    def __init__(self, interval: float, max_keys: int = 1024):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._last: dict[str, float] = {}
+        self._suppressed: dict[str, int] = {}
+
+    def log(self, logger: logging.Logger, level: int, key: str, msg: str, *args) -> bool:
+        """
+        按限速规则记录日志
+
+        Args:
+            logger: 日志记录器
+            level: 日志级别
+            key: 限速键（如会话 ID）
+            msg: 日志消息（% 格式，参数延迟格式化）
+
+        Returns:
+            bool: 是否实际输出
+        """
+        # 级别未启用时不做任何格式化
+        if not logger.isEnabledFor(level):
+            return False
+
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+
+        if key not in self._last and len(self._last) >= self.max_keys:
+            self._last.clear()
+            self._suppressed.clear()
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg = f"{msg} (+{suppressed} suppressed)"
+        logger.log(level, msg, *args)
+        return True
+
+    def reset(self, key: str) -> None:
+        """
+        清除某个键的限速状态（如一次流式响应结束时）
+
+        Args:
+            key: 限速键
+        """
+        self._last.pop(key, None)
+        self._suppressed.pop(key, None)
+
+
+def redact_body(text: Optional[str]) -> str:
+    """
+    处理要写入日志的消息正文：默认只记录长度，开启 LOG_MESSAGE_BODIES 后截断记录
+
+    Args:
+        text: 消息正文
+
+    Returns:
+        str: 可安全写入日志的文本
+    """
+    text = text or ""
+    if not config.LOG_MESSAGE_BODIES:
+        return f"<{len(text)} chars>"
+    limit = config.LOG_BODY_MAX_CHARS
+    if len(text) <= limit:
+        return repr(text)
+    return f"{text[:limit]!r}...(+{len(text) - limit} chars)"
+
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+
+
+def setup_logging() -> None:
+    """
+    配置根日志记录器使用队列管道（可重复调用，只生效一次）
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stderr)
+        if config.LOG_FORMAT == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+        root = logging.getLogger()
+        root.setLevel(config.LOG_LEVEL)
+        root.addHandler(_queue_handler)
+        _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    停止后台日志线程，输出队列中剩余的日志
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
+
+
+def dropped_records() -> int:
+    """
+    获取因队列已满而丢弃的日志条数
+
+    Returns:
+        int: 丢弃条数
+    """
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def queued_records() -> int:
+    """
+    获取队列中等待后台线程输出的日志条数
+
+    Returns:
+        int: 条数
+    """
+    return _queue_handler.queue.qsize() if _queue_handler is not None else 0
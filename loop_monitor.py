@@ -0,0 +1,150 @@
+"""
+事件循环监控模块
+持续测量事件循环延迟；看门狗线程在循环被阻塞超过阈值时抓取循环线程的调用栈，用于定位阻塞调用
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """事件循环延迟监控与阻塞看门狗"""
+
+    def __init__(self, interval: float = None, threshold: float = None, max_stalls: int = 20):
+        self.interval = interval if interval is not None else config.LOOP_MONITOR_INTERVAL
+        self.threshold = threshold if threshold is not None else config.LOOP_STALL_THRESHOLD
+        self.stalls: deque = deque(maxlen=max_stalls)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0  # 指数移动平均
+        self.stall_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """
+        启动监控（必须在事件循环中调用）
+        """
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """
+        停止监控
+        """
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+
+    async def _measure(self) -> None:
+        # 定时休眠，实际唤醒时间与预期的差值就是循环延迟
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.record_lag(max(0.0, now - expected))
+
+    def record_lag(self, lag: float) -> None:
+        """
+        记录一次延迟采样
+
+        Args:
+            lag: 延迟（秒）
+        """
+        self.samples += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.avg_lag = lag if self.samples == 1 else self.avg_lag * 0.9 + lag * 0.1
+
+    def _watch(self) -> None:
+        # 看门狗线程：心跳超过阈值未更新时说明循环被阻塞，每次阻塞只抓取一次调用栈
+        check_interval = max(self.threshold / 4, 0.01)
+        captured_for = None
+        while not self._stop_event.wait(check_interval):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for >= self.threshold and captured_for != heartbeat:
+                captured_for = heartbeat
+                self.capture_stall(blocked_for)
+
+    def capture_stall(self, blocked_for: float) -> Optional[dict]:
+        """
+        抓取事件循环线程当前的调用栈
+
+        Args:
+            blocked_for: 已阻塞的时长（秒）
+
+        Returns:
+            dict: 阻塞记录，无法获取循环线程栈帧时返回 None
+        """
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = "".join(traceback.format_stack(frame, limit=config.LOOP_STALL_STACK_DEPTH))
+        stall = {
+            "at": time.time(),
+            "blocked_for": round(blocked_for, 4),
+            "stack": stack,
+        }
+        self.stalls.append(stall)
+        self.stall_count += 1
+        logger.warning("Event loop blocked for %.3fs, loop thread stack:\n%s", blocked_for, stack)
+        return stall
+
+    def snapshot(self) -> dict:
+        """
+        获取监控指标
+
+        Returns:
+            dict: 延迟统计和最近的阻塞记录
+        """
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "samples": self.samples,
+            "lag_last": round(self.last_lag, 6),
+            "lag_avg": round(self.avg_lag, 6),
+            "lag_max": round(self.max_lag, 6),
+            "stall_count": self.stall_count,
+            "recent_stalls": list(self.stalls),
+        }
+
+
+# 全局监控实例
+loop_monitor = LoopMonitor()
@@ -4,9 +4,15 @@ FastAPI + WebSocket 实现 iFlow CLI 的 Web 界面
 """
 
 import os
+import json
+import hashlib
+import asyncio
 import uvicorn
-from fastapi import FastAPI, WebSocket, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+from fastapi import FastAPI, WebSocket, Request, HTTPException, Query, Depends
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
@@ -14,20 +20,75 @@ import logging
 import config
 import websocket_handler
 from session_manager import session_manager
-from iflow_manager import iflow_manager
+from iflow_manager import iflow_manager, stream_timeouts
+from fs_browser import directory_index
+from static_assets import asset_manifest, IMMUTABLE_CACHE_CONTROL
+from log_setup import setup_logging, stop_logging, dropped_records
+from loop_monitor import loop_monitor
+from process_stats import resource_monitor
+from transcript_store import transcript_store
+from file_watcher import file_watchers, file_diff
+from server_runtime import resolve_runtime, uvicorn_options, report_runtime
+from response_cache import response_cache
+from rate_limiter import rate_limiter, limit, MODELS, SESSION_CREATE
+from memory_stats import memory_profiler
+from search_index import search_index
+from usage_stats import usage_tracker
+from model_stats import model_performance
+from transcript_export import EXPORT_FORMATS, export_session, export_archive
 
-# 配置日志
-logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：启动时配置日志管道并构建带哈希的静态资源清单
+    """
+    setup_logging()
+    if config.MEMORY_PROFILING_ENABLED:
+        memory_profiler.start()
+    if config.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    resource_monitor.start(notify=websocket_handler.manager.send_to_session)
+    await asyncio.to_thread(asset_manifest.build)
+    # 预先获取模型列表，首屏引导数据无需等待网络请求
+    models_task = asyncio.create_task(iflow_manager.get_available_models())
+    hibernation_task = asyncio.create_task(iflow_manager.run_hibernation()) if config.SESSION_HIBERNATE_AFTER > 0 else None
+    health_task = asyncio.create_task(iflow_manager.run_health_checks())
+    backfill_task = asyncio.create_task(search_index.backfill()) if config.SEARCH_ENABLED else None
+    usage_task = None
+    if config.USAGE_ENABLED:
+        await usage_tracker.load()
+        usage_task = asyncio.create_task(usage_tracker.run_persistence())
+    yield
+    if usage_task is not None:
+        usage_task.cancel()
+        await usage_tracker.save()
+    if backfill_task is not None:
+        backfill_task.cancel()
+    await search_index.flush()
+    search_index.close()
+    models_task.cancel()
+    if hibernation_task is not None:
+        hibernation_task.cancel()
+    health_task.cancel()
+    await loop_monitor.stop()
+    await resource_monitor.stop()
+    await file_watchers.stop_all()
+    memory_profiler.stop()
+    stop_logging()
+
+
 # 创建 FastAPI 应用
-app = FastAPI(title="iflow2web", description="iFlow CLI Web Interface")
+app = FastAPI(title="iflow2web", description="iFlow CLI Web Interface", lifespan=lifespan)
 
-# 挂载静态文件
+# 挂载静态文件（未带哈希的原始路径，保留兼容）
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # 配置模板
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_manifest.url
 
 
 # 请求模型
@@ -37,26 +98,94 @@ class CreateSessionRequest(BaseModel):
     model: str = None
 
 
-@app.get("/", response_class=HTMLResponse)
-async def root(request: Request):
+# 渲染后的页面外壳缓存：(版本键, HTML, ETag)
+_shell_cache: dict = {"key": None, "html": None, "etag": None}
+
+
+def build_bootstrap() -> dict:
     """
-    主页 - 返回终端界面
+    构建首屏引导数据（模型、会话和前端配置），内联到页面中
+
+    Returns:
+        dict: 引导数据
     """
     # 如果配置的默认工作目录为空，使用当前目录
     default_working_dir = config.IFLOW_DEFAULT_WORKING_DIR if config.IFLOW_DEFAULT_WORKING_DIR else os.getcwd()
-
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "server_host": config.SERVER_HOST,
-            "server_port": config.SERVER_PORT,
-            "terminal_theme": config.TERMINAL_THEME,
-            "terminal_font_family": config.TERMINAL_FONT_FAMILY,
-            "terminal_font_size": config.TERMINAL_FONT_SIZE,
+    return {
+        "models": iflow_manager.get_cached_models(),
+        "sessions": session_manager.list_sessions(),
+        "config": {
             "default_working_dir": default_working_dir,
-        }
+            "terminal_theme": config.TERMINAL_THEME,
+            "terminal_max_dom_messages": config.TERMINAL_MAX_DOM_MESSAGES,
+        },
+    }
+
+
+def render_shell() -> tuple[str, str]:
+    """
+    渲染页面外壳，只有会话、模型或静态资源变化时才重新渲染
+
+    Returns:
+        tuple[str, str]: (HTML, ETag)
+    """
+    # 默认模型可能随观测到的性能变化，一并作为缓存键
+    key = (session_manager.version, iflow_manager.models_version, iflow_manager.default_model(), asset_manifest.version)
+    if _shell_cache["key"] == key:
+        return _shell_cache["html"], _shell_cache["etag"]
+
+    bootstrap = build_bootstrap()
+    # 转义 "<"，防止内联 JSON 提前结束 <script> 标签
+    bootstrap_json = json.dumps(bootstrap, ensure_ascii=False).replace("<", "\\u003c")
+    html = templates.get_template("index.html").render(
+        server_host=config.SERVER_HOST,
+        server_port=config.SERVER_PORT,
+        terminal_theme=config.TERMINAL_THEME,
+        terminal_font_family=config.TERMINAL_FONT_FAMILY,
+        terminal_font_size=config.TERMINAL_FONT_SIZE,
+        terminal_max_dom_messages=config.TERMINAL_MAX_DOM_MESSAGES,
+        default_working_dir=bootstrap["config"]["default_working_dir"],
+        bootstrap_json=bootstrap_json,
     )
+    etag = '"' + hashlib.sha256(html.encode("utf-8")).hexdigest()[:16] + '"'
+
+    _shell_cache.update(key=key, html=html, etag=etag)
+    return html, etag
+
+
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request):
+    """
+    主页 - 返回终端界面（内联首屏引导数据，支持 ETag 条件请求）
+    """
+    html, etag = render_shell()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=html, headers=headers)
+
+
+@app.get("/assets/{asset_path:path}")
+async def get_asset(asset_path: str, request: Request):
+    """
+    提供带哈希文件名的静态资源（预压缩 + 长期缓存）
+    """
+    asset = asset_manifest.get(asset_path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "ETag": asset.etag,
+        "Vary": "Accept-Encoding",
+    }
+    if request.headers.get("if-none-match") == asset.etag:
+        return Response(status_code=304, headers=headers)
+
+    encoding, content = asset.negotiate(request.headers.get("accept-encoding", ""))
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type=asset.media_type, headers=headers)
 
 
 @app.get("/health")
@@ -67,30 +196,80 @@ async def health_check():
     return {"status": "healthy", "service": "iflow2web"}
 
 
-@app.get("/api/models")
+@app.get("/api/metrics")
+async def get_metrics():
+    """
+    运行指标：事件循环延迟与阻塞记录、连接和会话数、响应缓存、日志丢弃数
+    """
+    return {
+        "loop": loop_monitor.snapshot(),
+        "sessions": session_manager.session_count,
+        "iflow_sessions": iflow_manager.session_count,
+        "hibernated_sessions": iflow_manager.hibernated_count,
+        "stream_timeouts": dict(stream_timeouts),
+        "recovery": iflow_manager.recovery_snapshot(),
+        "connections": websocket_handler.manager.snapshot(),
+        "file_watchers": file_watchers.count,
+        "processes": resource_monitor.snapshot(),
+        "rate_limits": rate_limiter.snapshot(),
+        "search": search_index.stats(),
+        "usage": usage_tracker.totals(),
+        "response_cache": response_cache.stats(),
+        "log_dropped": dropped_records(),
+    }
+
+
+@app.get("/api/models", dependencies=[Depends(limit(MODELS))])
 async def get_models():
     """
-    获取可用的模型列表（从API动态获取）
+    获取可用的模型列表（从API动态获取），附带各模型最近的首字延迟、输出速度和错误率
     """
-    return await iflow_manager.get_available_models()
+    models = await iflow_manager.get_available_models()
+    return {**models, "selection_policy": config.MODEL_SELECTION_POLICY, "model_stats": model_performance.snapshot()}
 
 
 @app.get("/api/sessions")
-async def list_sessions():
+async def list_sessions(
+    request: Request,
+    limit: int = Query(None, ge=1, le=config.SESSIONS_PAGE_MAX),
+    cursor: str = None,
+    working_dir: str = None,
+    model: str = None,
+    title_prefix: str = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+):
     """
-    列出所有会话
+    列出会话（按最近活动时间排序，支持游标分页、过滤和 ETag 条件请求）
     """
-    sessions = session_manager.list_sessions()
-    return {"sessions": sessions}
+    etag = f'"sessions-{session_manager.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        page = session_manager.list_sessions_page(
+            limit=limit,
+            cursor=cursor,
+            working_dir=working_dir,
+            model=model,
+            title_prefix=title_prefix,
+            order=order,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(content=page, headers=headers)
 
 
-@app.post("/api/sessions")
+@app.post("/api/sessions", dependencies=[Depends(limit(SESSION_CREATE))])
 async def create_session(request: CreateSessionRequest):
     """
     创建新会话
     """
     try:
-        session = session_manager.create_session(request.title, request.working_dir, request.model)
+        model = request.model
+        if model is None and config.MODEL_SELECTION_POLICY != "static":
+            model = iflow_manager.default_model()
+        session = await session_manager.create_session_async(request.title, request.working_dir, model)
         return session.to_dict()
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -104,7 +283,23 @@ async def get_session(session_id: str):
     session = session_manager.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session.to_dict()
+    data = session.to_dict()
+    data["resources"] = resource_monitor.get_usage(session_id)
+    return data
+
+
+@app.get("/api/sessions/{session_id}/diff")
+async def get_file_diff(session_id: str, path: str):
+    """
+    按需获取工作目录中某个文件的差异（相对于 git HEAD）
+    """
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        return await file_diff(session.working_dir, path)
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
 
 
 @app.delete("/api/sessions/{session_id}")
@@ -115,9 +310,212 @@ async def delete_session(session_id: str):
     success = session_manager.delete_session(session_id)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
+    # 释放 iFlow 进程并删除对话记录
+    await iflow_manager.close_session(session_id)
+    await transcript_store.delete(session_id)
+    await search_index.delete_session(session_id)
+    usage_tracker.forget_session(session_id)
     return {"message": "Session deleted"}
 
 
+@app.get("/api/sessions/{session_id}/usage")
+async def get_session_usage(session_id: str):
+    """
+    获取会话的累计用量
+    """
+    if not session_manager.get_session(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, **usage_tracker.session_usage(session_id)}
+
+
+@app.get("/api/usage")
+async def get_usage(
+    model: str = None,
+    sort: str = Query("turns", pattern="^(turns|chars|bytes|wall_time)$"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    用量统计：所有模型的合计、按模型的累计值，以及按指定字段排序的会话累计值（可按模型过滤）
+    """
+    sessions = [
+        {"session_id": session_id, **usage}
+        for session_id, usage in usage_tracker.sessions.items()
+        if model is None or usage.get("model") == model
+    ]
+    sessions.sort(key=lambda usage: usage[sort], reverse=True)
+    sessions = sessions[:limit]
+    for usage in sessions:
+        session = session_manager.get_session(usage["session_id"])
+        usage["title"] = session.title if session else None
+        usage["working_dir"] = session.working_dir if session else None
+    return {
+        "since": usage_tracker.since,
+        "totals": usage_tracker.totals(),
+        "models": usage_tracker.models,
+        "sessions": sessions,
+    }
+
+
+@app.get("/api/sessions/{session_id}/export")
+async def export_session_transcript(
+    session_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|markdown)$"),
+    gzip: bool = False,
+):
+    """
+    流式导出会话记录（NDJSON 或 Markdown，可选 gzip 压缩），逐行读取记录文件，内存占用与记录大小无关
+    """
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    extension, media_type = EXPORT_FORMATS[format]
+    filename = f"{session_id}{extension}"
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_session(session.to_dict(), format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/api/export")
+async def export_transcripts(
+    session_id: list[str] = Query(None),
+    format: str = Query("ndjson", pattern="^(ndjson|markdown)$"),
+):
+    """
+    把多个会话（默认全部）的记录导出为流式 zip 归档，每个会话一个文件
+    """
+    if session_id:
+        found = {sid: session_manager.get_session(sid) for sid in session_id}
+        missing = [sid for sid, session in found.items() if session is None]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Session not found: {', '.join(missing)}")
+        sessions = [session.to_dict() for session in found.values()]
+    else:
+        sessions = session_manager.list_sessions()
+    filename = f"iflow2web-transcripts-{datetime.now():%Y%m%d-%H%M%S}.zip"
+    return StreamingResponse(
+        export_archive(sessions, format),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def parse_time_filter(value: Optional[str], name: str) -> Optional[float]:
+    """
+    解析 ISO 8601 日期或时间（例如 2024-05-01 或 2024-05-01T12:00:00）为时间戳
+
+    Raises:
+        HTTPException: 格式无效
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+
+
+@app.get("/api/search")
+async def search_transcripts(
+    q: str = Query(..., min_length=1),
+    session_id: str = None,
+    role: str = Query(None, pattern="^(user|assistant)$"),
+    since: str = None,
+    until: str = None,
+    limit: int = Query(20, ge=1, le=config.SEARCH_PAGE_MAX),
+    offset: int = Query(0, ge=0),
+):
+    """
+    全文搜索对话记录（按相关度排序，支持会话、角色和时间过滤，片段中命中处用 <mark> 标记）
+    """
+    if not config.SEARCH_ENABLED:
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    results = await search_index.search(
+        q,
+        session_id=session_id,
+        role=role,
+        since=parse_time_filter(since, "since"),
+        until=parse_time_filter(until, "until"),
+        limit=limit,
+        offset=offset,
+    )
+    for result in results:
+        session = session_manager.get_session(result["session_id"])
+        result["title"] = session.title if session else None
+    return {"query": q, "results": results, "limit": limit, "offset": offset}
+
+
+@app.get("/api/fs")
+async def browse_fs(path: str = None, prefix: str = None, dirs_only: bool = True):
+    """
+    浏览工作目录或自动补全路径
+
+    - 传入 prefix 时返回补全候选
+    - 传入 path 时返回该目录下的条目
+    - 都不传时返回浏览起点（白名单目录或默认工作目录）
+    """
+    if prefix is not None:
+        return {"suggestions": await directory_index.complete_async(prefix)}
+
+    if not path:
+        roots = directory_index.roots()
+        return {
+            "path": None,
+            "parent": None,
+            "entries": [{"name": root, "path": root, "is_dir": True} for root in roots],
+        }
+
+    if not await directory_index.is_allowed_async(path):
+        raise HTTPException(status_code=403, detail="Working directory not allowed")
+
+    try:
+        return await directory_index.browse_async(path, dirs_only)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="Directory not found")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+
+def require_memory_profiling() -> None:
+    """内存分析端点默认关闭，未开启时按不存在处理"""
+    if not config.MEMORY_PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get("/api/admin/memory", dependencies=[Depends(require_memory_profiling)])
+async def get_memory_report(limit: int = Query(20, ge=1, le=200)):
+    """
+    内存报告：按子系统估算的占用、tracemalloc 按模块统计和分配最多的位置
+    """
+    return await memory_profiler.report(limit)
+
+
+@app.post("/api/admin/memory/snapshot", dependencies=[Depends(require_memory_profiling)])
+async def take_memory_snapshot():
+    """
+    记录 tracemalloc 基线快照
+    """
+    try:
+        return await memory_profiler.take_baseline()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/api/admin/memory/diff", dependencies=[Depends(require_memory_profiling)])
+async def get_memory_diff(limit: int = Query(20, ge=1, le=200)):
+    """
+    与基线快照比较，列出内存增长最多的代码位置
+    """
+    try:
+        return await memory_profiler.diff(limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -132,6 +530,8 @@ def main():
     """
     import sys
 
+    setup_logging()
+
     # 从命令行参数获取端口号
     port = config.SERVER_PORT
     if len(sys.argv) > 1:
@@ -148,12 +548,18 @@ def main():
     logger.info(f"Terminal theme: {config.TERMINAL_THEME}")
     logger.info(f"Access the interface at: http://{config.SERVER_HOST}:{port}")
 
+    runtime = resolve_runtime()
+    report_runtime(runtime)
+
     uvicorn.run(
         "main:app",
         host=config.SERVER_HOST,
         port=port,
         reload=False,
         log_level=config.LOG_LEVEL.lower(),
+        # 不使用 uvicorn 自带的同步日志处理器，访问日志也经由队列管道输出
+        log_config=None,
+        **uvicorn_options(runtime),
     )
 
 
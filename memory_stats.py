@@ -0,0 +1,257 @@
+"""
+内存分析模块
+按子系统（会话、连接、缓冲区、队列、缓存）估算内存占用，
+开启 tracemalloc 后还可以按模块统计分配，并与基线快照比较找出增长最多的代码位置
+"""
+
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import Optional
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 只展开这些容器和本项目定义的对象，其他对象（WebSocket、SDK 客户端、锁、线程等）只计算自身大小，
+# 避免顺着引用遍历到整个应用
+_CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+_project_types: dict[type, bool] = {}
+
+
+def _is_project_type(cls: type) -> bool:
+    cached = _project_types.get(cls)
+    if cached is None:
+        module = sys.modules.get(cls.__module__)
+        path = getattr(module, "__file__", None) or ""
+        path = os.path.abspath(path)
+        cached = _project_types[cls] = path.startswith(ROOT + os.sep) and "site-packages" not in path
+    return cached
+
+
+def deep_sizeof(obj, skip: tuple[str, ...] = (), max_objects: int = 200_000) -> tuple[int, int]:
+    """
+    估算对象及其引用的内置容器和本项目对象占用的字节数
+
+    Args:
+        obj: 根对象
+        skip: 不展开的属性名（例如会话的 iFlow 客户端）
+        max_objects: 最多遍历的对象数，防止统计本身占用过多时间
+
+    Returns:
+        tuple[int, int]: (字节数, 对象数)
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack and len(seen) < max_objects:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, _CONTAINERS):
+            stack.extend(item)
+        elif _is_project_type(type(item)) and not isinstance(item, type):
+            for name, value in _attributes(item):
+                if name not in skip:
+                    stack.append(value)
+    return size, len(seen)
+
+
+def _attributes(obj):
+    if hasattr(obj, "__dict__"):
+        yield from vars(obj).items()
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if name != "__dict__" and hasattr(obj, name):
+                yield name, getattr(obj, name)
+
+
+def _usage(*objects, skip: tuple[str, ...] = ()) -> dict:
+    total_bytes = total_objects = 0
+    for obj in objects:
+        size, count = deep_sizeof(obj, skip)
+        total_bytes += size
+        total_objects += count
+    return {"bytes": total_bytes, "objects": total_objects}
+
+
+def subsystem_usage() -> dict:
+    """
+    按子系统估算内存占用
+
+    Returns:
+        dict: 子系统 -> {"bytes", "objects"}，sessions 另含会话数和平均每个会话的字节数
+    """
+    from session_manager import session_manager
+    from iflow_manager import iflow_manager, IFlowManager
+    from websocket_handler import manager
+    from response_cache import response_cache
+    from fs_browser import directory_index
+    from static_assets import asset_manifest
+    from loop_monitor import loop_monitor
+    from file_watcher import file_watchers
+    from rate_limiter import rate_limiter
+    from log_setup import queued_records
+
+    # iFlow 客户端和锁不属于会话记录本身，单独由进程统计（/api/metrics 的 processes）反映
+    sessions = _usage(
+        session_manager._sessions,
+        session_manager._activity_index,
+        session_manager._index_keys,
+        iflow_manager._sessions,
+        skip=("_client", "_lock"),
+    )
+    count = session_manager.session_count
+    sessions["count"] = count
+    sessions["bytes_per_session"] = sessions["bytes"] // count if count else 0
+
+    return {
+        "sessions": sessions,
+        "connections": _usage(manager),
+        "buffers": _usage(loop_monitor.stalls, file_watchers, rate_limiter),
+        "queues": {"log_records": queued_records()},
+        "caches": _usage(response_cache, directory_index, asset_manifest, IFlowManager._models_cache),
+    }
+
+
+def _top_stats(stats, limit: int) -> list[dict]:
+    top = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        entry = {
+            "location": f"{os.path.relpath(frame.filename, ROOT) if frame.filename.startswith(ROOT) else frame.filename}:{frame.lineno}",
+            "bytes": stat.size,
+            "count": stat.count,
+        }
+        if hasattr(stat, "size_diff"):
+            entry["bytes_diff"] = stat.size_diff
+            entry["count_diff"] = stat.count_diff
+        top.append(entry)
+    return top
+
+
+def _by_module(snapshot: tracemalloc.Snapshot) -> dict[str, int]:
+    """按本项目模块汇总已分配的字节数（其他分配计入 other）"""
+    modules: dict[str, int] = {}
+    for stat in snapshot.statistics("filename"):
+        filename = stat.traceback[0].filename
+        if filename.startswith(ROOT + os.sep):
+            name = os.path.relpath(filename, ROOT)
+        else:
+            name = "other"
+        modules[name] = modules.get(name, 0) + stat.size
+    return dict(sorted(modules.items(), key=lambda item: item[1], reverse=True))
+
+
+class MemoryProfiler:
+    """tracemalloc 快照管理：开启跟踪、记录基线、与基线比较"""
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at: Optional[float] = None
+
+    @property
+    def tracing(self) -> bool:
+        """tracemalloc 是否已开启"""
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = None) -> None:
+        """
+        开启 tracemalloc（会增加每次分配的开销，只在需要分析时开启）
+
+        Args:
+            frames: 每次分配记录的调用栈深度
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or config.MEMORY_TRACE_FRAMES)
+            logger.info("tracemalloc started")
+
+    def stop(self) -> None:
+        """关闭 tracemalloc 并丢弃基线"""
+        self._baseline = None
+        self._baseline_at = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    async def _snapshot(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        # 快照和统计比较耗时，放到线程中执行
+        snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+        return snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    async def take_baseline(self) -> dict:
+        """
+        记录基线快照
+
+        Returns:
+            dict: 基线的时间和已跟踪的字节数
+
+        Raises:
+            RuntimeError: tracemalloc 未开启
+        """
+        self._baseline = await self._snapshot()
+        self._baseline_at = time.time()
+        traced = await asyncio.to_thread(lambda: sum(trace.size for trace in self._baseline.traces))
+        return {"taken_at": self._baseline_at, "traced_bytes": traced}
+
+    async def diff(self, limit: int = 20) -> dict:
+        """
+        与基线快照比较，列出增长最多的代码位置
+
+        Args:
+            limit: 列出的位置数
+
+        Returns:
+            dict: 基线时间、总增长字节数和增长最多的位置
+
+        Raises:
+            RuntimeError: tracemalloc 未开启或没有基线
+        """
+        if self._baseline is None:
+            raise RuntimeError("No baseline snapshot, take one first")
+        snapshot = await self._snapshot()
+        stats = await asyncio.to_thread(snapshot.compare_to, self._baseline, "lineno")
+        return {
+            "baseline_at": self._baseline_at,
+            "bytes_diff": sum(stat.size_diff for stat in stats),
+            "top": _top_stats(stats, limit),
+        }
+
+    async def report(self, limit: int = 20) -> dict:
+        """
+        内存报告：子系统估算，开启 tracemalloc 时另含按模块统计和分配最多的位置
+
+        Args:
+            limit: 列出的位置数
+
+        Returns:
+            dict: 内存报告
+        """
+        report = {
+            "tracing": self.tracing,
+            "baseline_at": self._baseline_at,
+            "subsystems": subsystem_usage(),
+        }
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = await self._snapshot()
+            report["traced"] = {"current_bytes": current, "peak_bytes": peak}
+            report["modules"] = await asyncio.to_thread(_by_module, snapshot)
+            report["top"] = _top_stats(await asyncio.to_thread(snapshot.statistics, "lineno"), limit)
+        return report
+
+
+# 全局内存分析实例
+memory_profiler = MemoryProfiler()
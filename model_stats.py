@@ -0,0 +1,171 @@
+"""
+模型性能统计模块
+按模型保留最近若干轮对话的首字延迟、输出速度和成败，
+并按可选策略（延迟或错误率）为新会话选择默认模型，避开当前变慢或出错的后端
+"""
+
+import math
+import time
+from collections import deque
+from typing import Optional
+from usage_stats import TurnUsage
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 这些结果计为失败，其余结束原因（包括 max_tokens、refusal）计为成功
+FAILED_OUTCOMES = frozenset({"error", "idle_timeout", "turn_timeout"})
+
+# 延迟策略下，其他模型的首字延迟中位数至少比配置的默认模型快这么多才会切换，避免在相近的模型间来回切换
+_LATENCY_MARGIN = 0.8
+
+
+def _percentile(values: list[float], fraction: float) -> Optional[float]:
+    """最近秩百分位数，没有数据时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class ModelPerformance:
+    """按模型保留最近的对话轮次样本"""
+
+    def __init__(self, window: int = None, max_age: float = None):
+        self.window = window if window is not None else config.MODEL_STATS_WINDOW
+        self.max_age = max_age if max_age is not None else config.MODEL_STATS_MAX_AGE
+        # 模型 -> deque[(记录时间, 首字延迟, 输出速度, 是否成功)]
+        self._samples: dict[str, deque] = {}
+
+    def record(self, model: Optional[str], turn: TurnUsage) -> None:
+        """
+        记录一轮对话
+
+        Args:
+            model: 模型名称
+            turn: 本轮用量（需已结束）
+        """
+        if not model:
+            return
+        finished = turn.finished_at or time.monotonic()
+        throughput = None
+        if turn.first_token_at is not None and turn.chars > 0:
+            streaming = finished - turn.first_token_at
+            if streaming > 0:
+                throughput = turn.chars / streaming
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append((finished, turn.time_to_first_token, throughput, turn.outcome not in FAILED_OUTCOMES))
+
+    def _recent(self, model: str) -> list[tuple]:
+        samples = self._samples.get(model)
+        if not samples:
+            return []
+        cutoff = time.monotonic() - self.max_age if self.max_age > 0 else None
+        return [sample for sample in samples if cutoff is None or sample[0] >= cutoff]
+
+    def stats(self, model: str) -> dict:
+        """
+        获取模型最近的性能统计
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            dict: 样本数、首字延迟（p50/p90，秒）、输出速度中位数（字符/秒）和错误率
+        """
+        samples = self._recent(model)
+        ttfts = [sample[1] for sample in samples if sample[1] is not None]
+        throughputs = [sample[2] for sample in samples if sample[2] is not None]
+        failures = sum(1 for sample in samples if not sample[3])
+
+        def rounded(value: Optional[float], digits: int) -> Optional[float]:
+            return round(value, digits) if value is not None else None
+
+        return {
+            "samples": len(samples),
+            "ttft_p50": rounded(_percentile(ttfts, 0.5), 3),
+            "ttft_p90": rounded(_percentile(ttfts, 0.9), 3),
+            "throughput_p50": rounded(_percentile(throughputs, 0.5), 1),
+            "error_rate": round(failures / len(samples), 3) if samples else None,
+        }
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        所有有样本的模型的性能统计
+
+        Returns:
+            dict: 模型 -> 统计
+        """
+        return {model: self.stats(model) for model in self._samples if self._recent(model)}
+
+    def reset(self) -> None:
+        """清空全部样本（测试使用）"""
+        self._samples.clear()
+
+
+def _error_rate_key(stats: dict) -> tuple:
+    """错误率策略的排序键：先比较错误率，再比较首字延迟（没有延迟数据的排在后面）"""
+    ttft = stats["ttft_p50"]
+    return (stats["error_rate"], ttft if ttft is not None else float("inf"))
+
+
+def select_default_model(
+    available: list[str],
+    configured: str,
+    performance: ModelPerformance = None,
+    policy: str = None,
+) -> str:
+    """
+    按策略选择新会话的默认模型
+
+    只比较最近样本数达到 MODEL_SELECTION_MIN_SAMPLES 的模型。配置的默认模型样本不足时保持不变，
+    这样旧样本过期后会重新回到配置的默认模型并重新测量，不会永久避开一个已经恢复的后端
+
+    Args:
+        available: 可用模型列表
+        configured: 配置的默认模型
+        performance: 性能统计，默认使用全局实例
+        policy: static（始终使用配置的默认模型）、latency（首字延迟最低）或 error_rate（默认模型出错过多时换用错误率最低的模型），
+            默认使用 MODEL_SELECTION_POLICY
+
+    Returns:
+        str: 默认模型
+    """
+    policy = policy or config.MODEL_SELECTION_POLICY
+    if policy not in ("latency", "error_rate"):
+        return configured
+    performance = performance or model_performance
+
+    min_samples = max(1, config.MODEL_SELECTION_MIN_SAMPLES)
+    max_error_rate = config.MODEL_SELECTION_MAX_ERROR_RATE
+    measured = {}
+    for model in dict.fromkeys([configured, *available]):
+        stats = performance.stats(model)
+        if stats["samples"] >= min_samples:
+            measured[model] = stats
+    current = measured.get(configured)
+    if current is None:
+        return configured
+
+    healthy = {model: stats for model, stats in measured.items() if stats["error_rate"] <= max_error_rate}
+    if policy == "error_rate":
+        if current["error_rate"] <= max_error_rate or not healthy:
+            return configured
+        best = min(healthy, key=lambda model: _error_rate_key(healthy[model]))
+    else:
+        candidates = {model: stats for model, stats in healthy.items() if stats["ttft_p50"] is not None}
+        if not candidates:
+            return configured
+        best = min(candidates, key=lambda model: candidates[model]["ttft_p50"])
+        if configured in candidates and candidates[best]["ttft_p50"] > candidates[configured]["ttft_p50"] * _LATENCY_MARGIN:
+            return configured
+    if best != configured:
+        logger.debug(f"Default model {configured} replaced by {best} ({policy} policy)")
+    return best
+
+
+# 全局模型性能统计实例
+model_performance = ModelPerformance()
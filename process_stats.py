@@ -0,0 +1,348 @@
+"""
+进程资源统计模块
+从 /proc 读取每个 iFlow 会话进程树的 CPU 时间、内存（RSS）和打开的文件描述符数，
+可选地在会话超出资源限制时终止其进程并通知客户端
+"""
+
+import asyncio
+import os
+import signal
+import time
+from typing import Awaitable, Callable, Optional
+from iflow_manager import iflow_manager
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROC_ROOT = "/proc"
+
+try:
+    _CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):  # 非 Linux 平台
+    _CLOCK_TICKS = 100
+    _PAGE_SIZE = 4096
+
+
+def proc_available() -> bool:
+    """
+    当前平台是否支持 /proc 统计
+
+    Returns:
+        bool: /proc 是否可用
+    """
+    return os.path.isdir(os.path.join(PROC_ROOT, "self"))
+
+
+def _read_stat(pid: int) -> Optional[tuple[int, float, int]]:
+    """
+    读取 /proc/<pid>/stat
+
+    Returns:
+        tuple[int, float, int]: (父进程 ID, 累计 CPU 秒数, 启动时间)，进程不存在时返回 None；
+            启动时间（开机后的时钟滴答数）与 PID 一起唯一标识一个进程，用于发现 PID 被复用
+    """
+    try:
+        with open(os.path.join(PROC_ROOT, str(pid), "stat"), "rb") as f:
+            data = f.read().decode("utf-8", "replace")
+    except OSError:
+        return None
+    # 进程名可能包含空格和括号，从最后一个 ")" 之后开始解析
+    fields = data[data.rfind(")") + 2:].split()
+    ppid = int(fields[1])
+    utime, stime = int(fields[11]), int(fields[12])
+    return ppid, (utime + stime) / _CLOCK_TICKS, int(fields[19])
+
+
+def _read_rss(pid: int) -> int:
+    try:
+        with open(os.path.join(PROC_ROOT, str(pid), "statm"), "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _count_fds(pid: int) -> int:
+    try:
+        return len(os.listdir(os.path.join(PROC_ROOT, str(pid), "fd")))
+    except OSError:
+        return 0
+
+
+def _children(pid: int) -> Optional[list[int]]:
+    """
+    通过 /proc/<pid>/task/*/children 获取子进程（内核不支持时返回 None）
+    """
+    task_dir = os.path.join(PROC_ROOT, str(pid), "task")
+    children = []
+    try:
+        for tid in os.listdir(task_dir):
+            with open(os.path.join(task_dir, tid, "children"), "rb") as f:
+                children.extend(int(child) for child in f.read().split())
+    except FileNotFoundError:
+        return None if os.path.isdir(task_dir) else []
+    except OSError:
+        return []
+    return children
+
+
+def _parent_map() -> dict[int, list[int]]:
+    """
+    扫描所有进程构建父进程 -> 子进程映射（children 文件不可用时的回退）
+    """
+    tree: dict[int, list[int]] = {}
+    for entry in os.listdir(PROC_ROOT):
+        if entry.isdigit():
+            stat = _read_stat(int(entry))
+            if stat is not None:
+                tree.setdefault(stat[0], []).append(int(entry))
+    return tree
+
+
+def process_tree(root_pid: int) -> list[int]:
+    """
+    获取进程及其所有后代进程的 PID
+
+    Args:
+        root_pid: 根进程 ID
+
+    Returns:
+        list[int]: 进程 ID 列表（根进程在前），根进程不存在时返回空列表
+    """
+    if _read_stat(root_pid) is None:
+        return []
+    pids = [root_pid]
+    seen = {root_pid}
+    parent_map = None
+    for pid in pids:  # 遍历过程中追加子进程，广度优先
+        children = _children(pid)
+        if children is None:
+            if parent_map is None:
+                parent_map = _parent_map()
+            children = parent_map.get(pid, [])
+        for child in children:
+            if child not in seen:
+                seen.add(child)
+                pids.append(child)
+    return pids
+
+
+def sample_tree(root_pid: int) -> Optional[dict]:
+    """
+    采样进程树的资源使用（同步，在线程中调用）
+
+    Args:
+        root_pid: 根进程 ID
+
+    Returns:
+        dict: pids、cpu_seconds、rss_bytes、open_fds，以及内部字段 _procs（各进程的 PID 和启动时间），
+            进程不存在时返回 None
+    """
+    pids = process_tree(root_pid)
+    if not pids:
+        return None
+    cpu_seconds = 0.0
+    rss_bytes = 0
+    open_fds = 0
+    alive = []
+    procs = []
+    for pid in pids:
+        stat = _read_stat(pid)
+        if stat is None:
+            continue  # 采样期间已退出
+        alive.append(pid)
+        procs.append((pid, stat[2]))
+        cpu_seconds += stat[1]
+        rss_bytes += _read_rss(pid)
+        open_fds += _count_fds(pid)
+    return {
+        "pids": alive,
+        "cpu_seconds": round(cpu_seconds, 2),
+        "rss_bytes": rss_bytes,
+        "open_fds": open_fds,
+        "_procs": procs,
+    }
+
+
+def kill_sampled(procs: list[tuple[int, int]]) -> int:
+    """
+    终止采样到的进程（同步，在线程中调用）
+
+    发送信号前重新读取 /proc/<pid>/stat，只终止启动时间与采样一致的进程：采样之后进程可能已经退出，
+    其 PID 可能已被无关进程复用。后代进程先于父进程终止，避免父进程在此期间再创建新的子进程
+
+    Args:
+        procs: 采样时的 (PID, 启动时间) 列表（根进程在前）
+
+    Returns:
+        int: 发送了 SIGKILL 的进程数
+    """
+    killed = 0
+    for pid, start_time in reversed(procs):
+        stat = _read_stat(pid)
+        if stat is None or stat[2] != start_time:
+            continue  # 已退出或 PID 已被复用
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+
+class ResourceMonitor:
+    """定期采样所有 iFlow 会话的进程树，并执行可选的资源限制"""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval if interval is not None else config.PROCESS_SAMPLE_INTERVAL
+        self.usage: dict[str, dict] = {}  # session_id -> 最近一次采样
+        self.killed = 0
+        self._task: Optional[asyncio.Task] = None
+        self._notify: Optional[Callable[[str, dict], Awaitable[None]]] = None
+
+    def start(self, notify: Callable[[str, dict], Awaitable[None]] = None) -> None:
+        """
+        启动定期采样（必须在事件循环中调用）
+
+        Args:
+            notify: 会话因超限被终止时调用的回调 (session_id, 消息)
+        """
+        if not proc_available():
+            logger.info("/proc not available, per-session process accounting disabled")
+            return
+        self._notify = notify
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        停止采样
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sample_all()
+            except Exception as e:
+                logger.error(f"Error sampling session processes: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def sample_all(self) -> dict[str, dict]:
+        """
+        采样所有活跃 iFlow 会话并检查资源限制
+
+        Returns:
+            dict[str, dict]: session_id -> 资源使用
+        """
+        pids = {session_id: session.pid for session_id, session in iflow_manager.active_sessions().items()}
+        pids = {session_id: pid for session_id, pid in pids.items() if pid is not None}
+        samples = await asyncio.to_thread(lambda: {sid: sample_tree(pid) for sid, pid in pids.items()})
+
+        now = time.monotonic()
+        usage = {}
+        for session_id, sample in samples.items():
+            if sample is None:
+                continue
+            previous = self.usage.get(session_id)
+            if previous and now > previous["_sampled_at"]:
+                cpu_delta = sample["cpu_seconds"] - previous["cpu_seconds"]
+                sample["cpu_percent"] = round(max(0.0, cpu_delta) * 100 / (now - previous["_sampled_at"]), 1)
+            else:
+                sample["cpu_percent"] = 0.0
+            sample["_sampled_at"] = now
+            usage[session_id] = sample
+        self.usage = usage
+
+        for session_id, sample in list(usage.items()):
+            reason = self.limit_exceeded(sample)
+            if reason:
+                await self.kill_session(session_id, sample, reason)
+        return usage
+
+    @staticmethod
+    def limit_exceeded(sample: dict) -> Optional[str]:
+        """
+        检查采样是否超出配置的限制
+
+        Args:
+            sample: 资源采样
+
+        Returns:
+            str: 超限原因，未超限时返回 None
+        """
+        max_rss = config.SESSION_MAX_RSS_MB * 1024 * 1024
+        if max_rss and sample["rss_bytes"] > max_rss:
+            return f"memory {sample['rss_bytes'] // (1024 * 1024)} MB exceeds {config.SESSION_MAX_RSS_MB} MB"
+        if config.SESSION_MAX_CPU_SECONDS and sample["cpu_seconds"] > config.SESSION_MAX_CPU_SECONDS:
+            return f"CPU time {sample['cpu_seconds']:.0f}s exceeds {config.SESSION_MAX_CPU_SECONDS}s"
+        return None
+
+    async def kill_session(self, session_id: str, sample: dict, reason: str) -> None:
+        """
+        终止超限会话的 iFlow 进程树并通知客户端
+
+        Args:
+            session_id: 会话 ID
+            sample: 最近一次资源采样
+            reason: 超限原因
+        """
+        logger.warning(f"Session {session_id} exceeded resource limit ({reason}), terminating iFlow process")
+        # 先按采样结果终止进程树（核对启动时间，不误杀复用了 PID 的进程）：进行中的一轮对话随进程退出而结束，
+        # 不会在对话进行中等待客户端关闭
+        await asyncio.to_thread(kill_sampled, sample.get("_procs", []))
+        try:
+            await asyncio.wait_for(iflow_manager.close_session(session_id), timeout=10.0)
+        except Exception as e:
+            logger.error(f"Error closing session {session_id}: {e}")
+
+        self.usage.pop(session_id, None)
+        self.killed += 1
+        if self._notify is not None:
+            await self._notify(session_id, {
+                "type": "error",
+                "content": f"iFlow 进程已因超出资源限制被终止: {reason}",
+                "reason": "resource_limit",
+            })
+
+    def get_usage(self, session_id: str) -> Optional[dict]:
+        """
+        获取会话最近一次的资源使用
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            dict: 资源使用（不含内部字段），没有采样时返回 None
+        """
+        sample = self.usage.get(session_id)
+        if sample is None:
+            return None
+        return {key: value for key, value in sample.items() if not key.startswith("_")}
+
+    def snapshot(self) -> dict:
+        """
+        获取所有会话的资源使用汇总
+
+        Returns:
+            dict: 汇总和每个会话的资源使用
+        """
+        sessions = {session_id: self.get_usage(session_id) for session_id in self.usage}
+        return {
+            "enabled": self._task is not None,
+            "killed": self.killed,
+            "total_rss_bytes": sum(s["rss_bytes"] for s in sessions.values()),
+            "total_cpu_seconds": round(sum(s["cpu_seconds"] for s in sessions.values()), 2),
+            "sessions": sessions,
+        }
+
+
+# 全局资源监控实例
+resource_monitor = ResourceMonitor()
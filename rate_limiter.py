@@ -0,0 +1,213 @@
+"""
+限流模块
+按客户端身份（IP 或指定请求头）对提交提示词、创建会话和获取模型列表做令牌桶限流，
+在启动任何 iFlow 进程工作之前拒绝超额请求
+"""
+
+import math
+import time
+from collections import Counter
+from typing import Optional
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROMPT = "prompt"
+SESSION_CREATE = "session_create"
+MODELS = "models"
+
+
+def parse_rate(spec: str) -> Optional[tuple[int, float]]:
+    """
+    解析限流配置，格式为 "次数/秒数"，例如 "20/60"
+
+    Args:
+        spec: 限流配置
+
+    Returns:
+        tuple[int, float]: (桶容量, 每秒补充的令牌数)，为空或次数为 0 时返回 None（不限流）
+
+    Raises:
+        ValueError: 格式错误
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    count, _, period = spec.partition("/")
+    count, period = int(count), float(period or 1)
+    if count < 0 or period <= 0:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    if count == 0:
+        return None
+    return count, count / period
+
+
+class TokenBucket:
+    """令牌桶：容量为 capacity，按 refill_rate 每秒补充"""
+
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, refill_rate: float, now: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """
+        尝试取出令牌
+
+        Returns:
+            float: 0 表示成功，否则为需要等待的秒数
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.refill_rate
+
+    def is_full(self, now: float) -> bool:
+        """补充后是否已满（满桶与新建桶等价，可以回收）"""
+        return self.tokens + (now - self.updated) * self.refill_rate >= self.capacity
+
+
+class RateLimiter:
+    """按作用域和客户端身份维护令牌桶"""
+
+    def __init__(self, limits: dict[str, str] = None, max_buckets: int = None):
+        if limits is None:
+            limits = {
+                PROMPT: config.RATE_LIMIT_PROMPT,
+                SESSION_CREATE: config.RATE_LIMIT_SESSION_CREATE,
+                MODELS: config.RATE_LIMIT_MODELS,
+            }
+        self.limits = {scope: parse_rate(spec) for scope, spec in limits.items()}
+        self.max_buckets = max_buckets if max_buckets is not None else config.RATE_LIMIT_MAX_BUCKETS
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self.allowed: Counter = Counter()  # 作用域 -> 放行次数
+        self.limited: Counter = Counter()  # 作用域 -> 拒绝次数
+
+    def acquire(self, scope: str, client: str) -> float:
+        """
+        为客户端在作用域内消耗一个令牌
+
+        Args:
+            scope: 作用域（prompt、session_create、models）
+            client: 客户端身份
+
+        Returns:
+            float: 0 表示放行，否则为建议的重试等待秒数
+        """
+        limit = self.limits.get(scope) if config.RATE_LIMIT_ENABLED else None
+        if limit is None:
+            return 0.0
+        now = time.monotonic()
+        key = (scope, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(limit[0], limit[1], now)
+        retry_after = bucket.take(now)
+        if retry_after:
+            self.limited[scope] += 1
+        else:
+            self.allowed[scope] += 1
+        return retry_after
+
+    def _prune(self, now: float) -> None:
+        # 已经补满的桶与新建的桶等价，直接丢弃
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_full(now)]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_buckets:
+            # 仍然过多时丢弃最久未使用的一半
+            stale = sorted(self._buckets, key=lambda k: self._buckets[k].updated)[:len(self._buckets) // 2]
+            for key in stale:
+                del self._buckets[key]
+
+    def reset(self) -> None:
+        """清空所有令牌桶和计数"""
+        self._buckets.clear()
+        self.allowed.clear()
+        self.limited.clear()
+
+    def snapshot(self) -> dict:
+        """
+        获取限流统计
+
+        Returns:
+            dict: 是否启用、每个作用域的限制和放行/拒绝次数、当前令牌桶数
+        """
+        return {
+            "enabled": config.RATE_LIMIT_ENABLED,
+            "key": config.RATE_LIMIT_KEY,
+            "buckets": len(self._buckets),
+            "scopes": {
+                scope: {
+                    "capacity": limit[0] if limit else None,
+                    "per_second": round(limit[1], 4) if limit else None,
+                    "allowed": self.allowed[scope],
+                    "limited": self.limited[scope],
+                }
+                for scope, limit in self.limits.items()
+            },
+        }
+
+
+def client_identity(connection: HTTPConnection) -> str:
+    """
+    获取客户端身份：配置为 header 且请求带有该请求头时使用请求头的值，否则使用客户端 IP
+
+    Args:
+        connection: HTTP 请求或 WebSocket 连接
+
+    Returns:
+        str: 客户端身份
+    """
+    if config.RATE_LIMIT_KEY == "header":
+        value = connection.headers.get(config.RATE_LIMIT_HEADER)
+        if value:
+            return f"header:{value}"
+    client = connection.client
+    return f"ip:{client.host if client else 'unknown'}"
+
+
+def rate_limit_message(retry_after: float) -> str:
+    """拒绝时展示给用户的提示"""
+    return f"请求过于频繁，请在 {math.ceil(retry_after)} 秒后重试"
+
+
+def limit(scope: str):
+    """
+    创建 FastAPI 依赖：超出限额时返回 429 和 Retry-After
+
+    Args:
+        scope: 作用域
+
+    Returns:
+        依赖函数
+    """
+    async def dependency(connection: HTTPConnection) -> None:
+        client = client_identity(connection)
+        retry_after = rate_limiter.acquire(scope, client)
+        if retry_after:
+            logger.warning(f"Rate limited {client} on {scope}, retry after {retry_after:.1f}s")
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "error": "rate_limited",
+                    "message": rate_limit_message(retry_after),
+                    "scope": scope,
+                    "retry_after": round(retry_after, 1),
+                },
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+    return dependency
+
+
+# 全局限流器实例
+rate_limiter = RateLimiter()
@@ -0,0 +1,317 @@
+"""
+响应缓存模块
+对只读提示词的响应帧流进行内容寻址缓存（可选功能，默认关闭）
+缓存键由模型、审批模式、规范化后的提示词和工作区指纹组成
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import AsyncGenerator, Optional
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 只读审批模式：该模式下 iFlow 不会修改工作区，可以安全复用响应
+READ_ONLY_APPROVAL_MODES = ("PLAN",)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    规范化提示词（去除首尾空白并合并连续空白）
+
+    Args:
+        prompt: 原始提示词
+
+    Returns:
+        规范化后的提示词
+    """
+    return " ".join(prompt.split())
+
+
+def _read_git_head(git_dir: str) -> Optional[str]:
+    """
+    读取 git HEAD 指向的提交（不启动子进程）
+
+    Args:
+        git_dir: .git 目录路径
+
+    Returns:
+        提交哈希，无法解析时返回 None
+    """
+    try:
+        with open(os.path.join(git_dir, "HEAD"), "r", encoding="utf-8") as f:
+            head = f.read().strip()
+        if not head.startswith("ref:"):
+            return head
+
+        ref = head[4:].strip()
+        ref_path = os.path.join(git_dir, *ref.split("/"))
+        if os.path.exists(ref_path):
+            with open(ref_path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+
+        # 引用可能已被打包到 packed-refs
+        packed_refs = os.path.join(git_dir, "packed-refs")
+        if os.path.exists(packed_refs):
+            with open(packed_refs, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.strip().split(" ", 1)
+                    if len(parts) == 2 and parts[1] == ref:
+                        return parts[0]
+        # 尚无提交的新仓库
+        return ref
+    except OSError:
+        return None
+
+
+def _stat_fingerprint(base_dir: str, paths: list[str]) -> list[tuple[str, int, int]]:
+    """
+    获取文件的 (路径, mtime_ns, size) 列表，已删除的文件记为 (-1, -1)
+    """
+    result = []
+    for path in sorted(paths):
+        try:
+            st = os.stat(os.path.join(base_dir, path))
+            result.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            result.append((path, -1, -1))
+    return result
+
+
+async def _git_dirty_files(working_dir: str) -> Optional[list[str]]:
+    """
+    通过 git status 获取工作区中已修改/未跟踪的文件列表
+
+    Returns:
+        文件路径列表，git 不可用时返回 None
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "git", "status", "--porcelain=v1", "-z", "--untracked-files=all",
+            cwd=working_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+    except (OSError, NotImplementedError) as e:
+        logger.debug(f"git status unavailable: {e}")
+        return None
+
+    if process.returncode != 0:
+        return None
+
+    # -z 输出格式: "XY path\0"，重命名条目后会多一个原路径
+    files = []
+    entries = stdout.decode("utf-8", errors="replace").split("\0")
+    skip_next = False
+    for entry in entries:
+        if skip_next:
+            skip_next = False
+            continue
+        if len(entry) < 4:
+            continue
+        files.append(entry[3:])
+        if entry[0] in ("R", "C"):
+            skip_next = True
+    return files
+
+
+def _scan_tree(working_dir: str, max_entries: int) -> Optional[list[tuple[str, int, int]]]:
+    """
+    非 git 目录的回退指纹：递归收集所有条目的 mtime 和大小（不跟随符号链接）
+
+    Args:
+        working_dir: 工作目录
+        max_entries: 最多统计的条目数
+
+    Returns:
+        (相对路径, mtime_ns, size) 列表，条目数超过上限时返回 None（此时不应使用缓存）
+    """
+    result = []
+    pending = [("", working_dir)]
+    while pending:
+        rel_dir, abs_dir = pending.pop()
+        with os.scandir(abs_dir) as it:
+            for entry in it:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                result.append((rel_path, st.st_mtime_ns, st.st_size))
+                if len(result) > max_entries:
+                    return None
+                if is_dir:
+                    pending.append((rel_path, entry.path))
+    result.sort()
+    return result
+
+
+async def compute_fingerprint(working_dir: str) -> Optional[str]:
+    """
+    计算工作区的廉价指纹: git HEAD + 脏文件 mtime 集合（非 git 目录递归统计全部条目）
+
+    Args:
+        working_dir: 工作目录
+
+    Returns:
+        指纹字符串，无法计算时返回 None（此时不应使用缓存）
+    """
+    abs_dir = os.path.abspath(working_dir)
+    git_dir = os.path.join(abs_dir, ".git")
+
+    try:
+        if await asyncio.to_thread(os.path.isdir, git_dir):
+            head = await asyncio.to_thread(_read_git_head, git_dir)
+            dirty = await _git_dirty_files(abs_dir)
+            if head is None or dirty is None:
+                return None
+            stats = await asyncio.to_thread(_stat_fingerprint, abs_dir, dirty)
+            payload = ["git", head, stats]
+        else:
+            stats = await asyncio.to_thread(_scan_tree, abs_dir, config.RESPONSE_CACHE_SCAN_MAX_ENTRIES)
+            if stats is None:
+                logger.debug(f"Working dir {abs_dir} too large to fingerprint, skipping cache")
+                return None
+            payload = ["scan", stats]
+    except OSError as e:
+        logger.debug(f"Failed to fingerprint working dir {abs_dir}: {e}")
+        return None
+
+    return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """响应缓存 - 按字节数和条目数限制的 LRU 缓存"""
+
+    def __init__(self, max_bytes: int = None, max_entries: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else config.RESPONSE_CACHE_MAX_BYTES
+        self.max_entries = max_entries if max_entries is not None else config.RESPONSE_CACHE_MAX_ENTRIES
+        self._entries: OrderedDict[str, tuple[list[dict], int]] = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_enabled_for(self, approval_mode: str) -> bool:
+        """
+        判断在指定审批模式下是否可以使用缓存
+
+        可写模式（DEFAULT/AUTO_EDIT/YOLO）必须通过 RESPONSE_CACHE_WRITE_MODES 显式开启
+
+        Args:
+            approval_mode: 审批模式
+
+        Returns:
+            bool: 是否可以使用缓存
+        """
+        if not config.RESPONSE_CACHE_ENABLED:
+            return False
+        return approval_mode in READ_ONLY_APPROVAL_MODES or approval_mode in config.RESPONSE_CACHE_WRITE_MODES
+
+    @staticmethod
+    def make_key(model: str, approval_mode: str, prompt: str, fingerprint: str) -> str:
+        """
+        生成缓存键
+
+        Args:
+            model: 模型名称
+            approval_mode: 审批模式
+            prompt: 提示词（会被规范化）
+            fingerprint: 工作区指纹
+
+        Returns:
+            缓存键
+        """
+        raw = json.dumps([model, approval_mode, normalize_prompt(prompt), fingerprint])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[list[dict]]:
+        """
+        查找缓存的帧流
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            帧列表，未命中时返回 None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, frames: list[dict]) -> bool:
+        """
+        保存一轮完整的帧流
+
+        Args:
+            key: 缓存键
+            frames: 帧列表（最后一帧应为 finish）
+
+        Returns:
+            bool: 是否已缓存（超过容量上限的单条响应不缓存）
+        """
+        size = sum(len(json.dumps(frame, default=str)) for frame in frames)
+        if size > self.max_bytes:
+            return False
+
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)[1]
+
+        self._entries[key] = (frames, size)
+        self._total_bytes += size
+
+        while self._entries and (self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_size
+            self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: 条目数、字节数和命中统计
+        """
+        return {
+            "enabled": config.RESPONSE_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    @staticmethod
+    async def replay(frames: list[dict]) -> AsyncGenerator[dict, None]:
+        """
+        重放缓存的帧流
+
+        Args:
+            frames: 缓存的帧列表
+
+        Yields:
+            dict: 带 cached 标记的帧
+        """
+        for frame in frames:
+            yield {**frame, "cached": True}
+
+
+# 全局响应缓存实例
+response_cache = ResponseCache()
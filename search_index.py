@@ -0,0 +1,337 @@
+"""
+会话全文搜索模块
+基于 SQLite FTS5 索引对话记录：新记录先进入内存队列，由后台任务批量写入（数据库操作都在线程中执行，不影响流式响应）；
+查询支持相关度排序、会话和时间过滤以及片段高亮
+"""
+
+import asyncio
+import html
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from transcript_store import transcript_store
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 高亮标记先用控制字符占位，转义 HTML 后再替换为 <mark>
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+# trigram 分词器支持中文等没有空格分词的文本，要求查询词至少 3 个字符
+_TRIGRAM_MIN_CHARS = 3
+
+
+def _highlight(text: str) -> str:
+    """转义 HTML 并把占位标记替换为 <mark>"""
+    return html.escape(text).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _quote(term: str) -> str:
+    """把查询词转义为 FTS5 短语，避免用户输入被解析为查询语法"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _manual_snippet(content: str, terms: list[str], width: int = 64) -> str:
+    """为无法使用 FTS5 snippet 的短查询词生成高亮片段"""
+    lower = content.lower()
+    positions = [lower.find(term.lower()) for term in terms]
+    start = min((p for p in positions if p >= 0), default=0)
+    begin = max(0, start - width // 2)
+    excerpt = content[begin:begin + width]
+    for term in sorted(set(terms), key=len, reverse=True):
+        lowered = excerpt.lower()
+        pieces, cursor = [], 0
+        index = lowered.find(term.lower())
+        while index >= 0:
+            pieces.append(excerpt[cursor:index] + _MARK_START + excerpt[index:index + len(term)] + _MARK_END)
+            cursor = index + len(term)
+            index = lowered.find(term.lower(), cursor)
+        excerpt = "".join(pieces) + excerpt[cursor:]
+    prefix = "…" if begin > 0 else ""
+    suffix = "…" if begin + width < len(content) else ""
+    return prefix + excerpt + suffix
+
+
+class SearchIndex:
+    """对话记录的 FTS5 全文索引"""
+
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else config.SEARCH_DB_PATH
+        self.tokenizer: Optional[str] = None
+        self.indexed = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._pending: list[tuple[str, str, str, float]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库并建表（在持有 _db_lock 时调用）"""
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'entries'").fetchone()
+            if row is None:
+                try:
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE entries USING fts5("
+                        "content, session_id UNINDEXED, role UNINDEXED, ts UNINDEXED, tokenize='trigram')"
+                    )
+                except sqlite3.OperationalError:
+                    # SQLite 3.34 之前没有 trigram 分词器
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE entries USING fts5("
+                        "content, session_id UNINDEXED, role UNINDEXED, ts UNINDEXED)"
+                    )
+                conn.commit()
+                row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'entries'").fetchone()
+            self.tokenizer = "trigram" if "trigram" in row[0] else "unicode61"
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---- 写入 ----
+
+    def add(self, session_id: str, role: str, content: str, ts: float = None) -> None:
+        """
+        把一条记录加入待索引队列，由后台任务批量写入
+
+        Args:
+            session_id: 会话 ID
+            role: user 或 assistant
+            content: 消息内容
+            ts: 时间戳，默认为当前时间
+        """
+        if not config.SEARCH_ENABLED or not content:
+            return
+        self._pending.append((content, session_id, role, ts if ts is not None else time.time()))
+        if len(self._pending) >= config.SEARCH_BATCH_SIZE:
+            self._schedule_flush(0)
+        else:
+            self._schedule_flush(config.SEARCH_FLUSH_INTERVAL)
+
+    def _schedule_flush(self, delay: float) -> None:
+        # 用定时器而不是等待中的任务：事件循环关闭时未触发的定时器会被直接丢弃
+        if self._flush_handle is not None:
+            if delay > 0:
+                return  # 已有等待中的批量写入
+            self._flush_handle.cancel()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 不在事件循环中（例如同步调用），等下次 flush
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_in_background())
+
+    async def _flush_in_background(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to write search index: {e}", exc_info=True)
+
+    async def flush(self) -> int:
+        """
+        把待索引队列写入数据库
+
+        Returns:
+            int: 写入的记录数
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()  # 已经在这里写入，取消等待中的批量写入
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            await asyncio.to_thread(self._insert, batch)
+        return len(batch)
+
+    def _insert(self, rows: list[tuple[str, str, str, float]]) -> None:
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT INTO entries(content, session_id, role, ts) VALUES (?, ?, ?, ?)", rows)
+            self.indexed += len(rows)
+
+    def _delete(self, session_id: str) -> None:
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM entries WHERE session_id = ?", (session_id,))
+
+    async def delete_session(self, session_id: str) -> None:
+        """
+        删除会话的全部索引记录
+
+        Args:
+            session_id: 会话 ID
+        """
+        self._pending = [row for row in self._pending if row[1] != session_id]
+        await asyncio.to_thread(self._delete, session_id)
+
+    def backfill_sync(self) -> int:
+        """
+        为尚未索引的会话记录文件建立索引（同步，在线程中调用）
+
+        Returns:
+            int: 新索引的会话数
+        """
+        base_dir = transcript_store.base_dir
+        try:
+            names = [name[:-len(".jsonl")] for name in os.listdir(base_dir) if name.endswith(".jsonl")]
+        except FileNotFoundError:
+            return 0
+        with self._db_lock:
+            conn = self._connect()
+            indexed = {row[0] for row in conn.execute("SELECT DISTINCT session_id FROM entries")}
+        count = 0
+        for session_id in names:
+            if session_id in indexed:
+                continue
+            try:
+                entries = transcript_store.read_sync(session_id)
+            except ValueError:
+                continue
+            rows = [
+                (entry.get("content", ""), session_id, entry.get("role", ""), entry.get("ts", 0.0))
+                for entry in entries if entry.get("content")
+            ]
+            if rows:
+                self._insert(rows)
+                count += 1
+        return count
+
+    async def backfill(self) -> None:
+        """
+        后台任务：启动时为已有的会话记录建立索引
+        """
+        try:
+            count = await asyncio.to_thread(self.backfill_sync)
+            if count:
+                logger.info(f"Indexed transcripts of {count} sessions for search")
+        except Exception as e:
+            logger.error(f"Failed to backfill search index: {e}", exc_info=True)
+
+    # ---- 查询 ----
+
+    def search_sync(
+        self,
+        query: str,
+        session_id: str = None,
+        role: str = None,
+        since: float = None,
+        until: float = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> list[dict]:
+        """
+        全文搜索（同步，在线程中调用）
+
+        Args:
+            query: 查询文本，按空白拆分为多个词，所有词都需要出现
+            session_id: 只搜索该会话
+            role: 只搜索 user 或 assistant 的消息
+            since: 起始时间戳（包含）
+            until: 结束时间戳（不包含）
+            limit: 返回条数
+            offset: 跳过条数
+
+        Returns:
+            list[dict]: 按相关度排序的结果，包含 session_id、role、ts、snippet（HTML，命中处用 <mark> 标记）和 score
+        """
+        terms = [term for term in query.split() if term]
+        if not terms:
+            return []
+
+        with self._db_lock:
+            conn = self._connect()
+            min_chars = _TRIGRAM_MIN_CHARS if self.tokenizer == "trigram" else 1
+            match_terms = [term for term in terms if len(term) >= min_chars]
+            short_terms = [term for term in terms if len(term) < min_chars]
+
+            where, params = [], []
+            if match_terms:
+                where.append("entries MATCH ?")
+                params.append(" ".join(_quote(term) for term in match_terms))
+            for term in short_terms:
+                # 过短的词无法使用 trigram 索引，退回到子串匹配
+                where.append("content LIKE ? ESCAPE '\\'")
+                params.append("%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+            if session_id:
+                where.append("session_id = ?")
+                params.append(session_id)
+            if role:
+                where.append("role = ?")
+                params.append(role)
+            if since is not None:
+                where.append("ts >= ?")
+                params.append(since)
+            if until is not None:
+                where.append("ts < ?")
+                params.append(until)
+
+            if match_terms:
+                # 片段长度按词计算，trigram 下一个词约等于一个字符
+                tokens = 64 if self.tokenizer == "trigram" else 24
+                columns = f"snippet(entries, 0, '{_MARK_START}', '{_MARK_END}', '…', {tokens}), bm25(entries)"
+                order = "bm25(entries)"
+            else:
+                columns = "content, 0.0"
+                order = "ts DESC"
+            rows = conn.execute(
+                f"SELECT session_id, role, ts, {columns} FROM entries WHERE {' AND '.join(where)} "
+                f"ORDER BY {order} LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+
+        results = []
+        for row_session_id, row_role, ts, text, rank in rows:
+            snippet = text if match_terms else _manual_snippet(text, short_terms)
+            results.append({
+                "session_id": row_session_id,
+                "role": row_role,
+                "ts": ts,
+                "snippet": _highlight(snippet),
+                "score": round(-rank, 4),  # bm25 越小越相关，取反后越大越相关
+            })
+        return results
+
+    async def search(self, query: str, **filters) -> list[dict]:
+        """
+        全文搜索（参数同 search_sync）
+
+        Returns:
+            list[dict]: 搜索结果
+        """
+        return await asyncio.to_thread(self.search_sync, query, **filters)
+
+    def stats(self) -> dict:
+        """
+        获取索引统计
+
+        Returns:
+            dict: 是否启用、分词器、待写入和本次运行已写入的记录数
+        """
+        return {
+            "enabled": config.SEARCH_ENABLED,
+            "tokenizer": self.tokenizer,
+            "pending": len(self._pending),
+            "indexed": self.indexed,
+        }
+
+
+# 全局搜索索引实例
+search_index = SearchIndex()
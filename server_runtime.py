@@ -0,0 +1,117 @@
+"""
+服务器运行时模块
+根据配置选择 uvicorn 的事件循环、HTTP 解析器、WebSocket 实现等，并报告实际生效的快速路径
+"""
+
+import importlib.util
+import platform
+import sys
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOOP_CHOICES = ("auto", "asyncio", "uvloop")
+HTTP_CHOICES = ("auto", "h11", "httptools")
+WS_CHOICES = ("auto", "none", "websockets", "wsproto")
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _uvloop_supported() -> bool:
+    # 与 uvicorn 的 auto 规则一致：Windows 和 PyPy 上不使用 uvloop
+    return sys.platform != "win32" and platform.python_implementation() != "PyPy" and _installed("uvloop")
+
+
+def resolve_runtime() -> dict:
+    """
+    解析配置，得到实际使用的实现（auto 按 uvicorn 的规则展开，未安装的实现回退到默认值）
+
+    Returns:
+        dict: loop、http、ws、workers 等实际生效的设置
+    """
+    loop = config.SERVER_LOOP if config.SERVER_LOOP in LOOP_CHOICES else "auto"
+    if loop in ("auto", "uvloop"):
+        if _uvloop_supported():
+            loop = "uvloop"
+        else:
+            if loop == "uvloop":
+                logger.warning("uvloop requested but not available, falling back to asyncio")
+            loop = "asyncio"
+
+    http = config.SERVER_HTTP if config.SERVER_HTTP in HTTP_CHOICES else "auto"
+    if http in ("auto", "httptools"):
+        if _installed("httptools"):
+            http = "httptools"
+        else:
+            if http == "httptools":
+                logger.warning("httptools requested but not installed, falling back to h11")
+            http = "h11"
+
+    ws = config.SERVER_WS if config.SERVER_WS in WS_CHOICES else "auto"
+    if ws == "auto" or (ws != "none" and not _installed(ws)):
+        if ws not in ("auto", "none"):
+            logger.warning(f"{ws} requested but not installed, selecting an available WebSocket implementation")
+        ws = next((impl for impl in ("websockets", "wsproto") if _installed(impl)), "none")
+
+    # 会话和 iFlow 进程都保存在进程内，多个 worker 之间无法共享，暂时只允许单 worker
+    workers = config.SERVER_WORKERS
+    if workers > 1:
+        logger.warning(f"SERVER_WORKERS={workers} ignored: session state is process-local, running a single worker")
+        workers = 1
+
+    return {
+        "loop": loop,
+        "http": http,
+        "ws": ws,
+        "ws_per_message_deflate": config.SERVER_WS_PER_MESSAGE_DEFLATE,
+        "ws_ping_interval": config.WS_PING_INTERVAL,
+        "ws_ping_timeout": config.WS_PING_TIMEOUT,
+        "workers": workers,
+        "timeout_keep_alive": config.SERVER_TIMEOUT_KEEP_ALIVE,
+        "backlog": config.SERVER_BACKLOG,
+    }
+
+
+def uvicorn_options(runtime: dict) -> dict:
+    """
+    将运行时设置转换为 uvicorn.run 的参数
+
+    Args:
+        runtime: resolve_runtime 的返回值
+
+    Returns:
+        dict: uvicorn.run 的关键字参数
+    """
+    return {
+        "loop": runtime["loop"],
+        "http": runtime["http"],
+        "ws": runtime["ws"],
+        "ws_per_message_deflate": runtime["ws_per_message_deflate"],
+        "ws_ping_interval": runtime["ws_ping_interval"],
+        "ws_ping_timeout": runtime["ws_ping_timeout"],
+        "workers": runtime["workers"],
+        "timeout_keep_alive": runtime["timeout_keep_alive"],
+        "backlog": runtime["backlog"],
+    }
+
+
+def report_runtime(runtime: dict) -> None:
+    """
+    启动时输出实际生效的运行时设置
+
+    Args:
+        runtime: resolve_runtime 的返回值
+    """
+    fast_paths = [name for name, active in (
+        ("uvloop", runtime["loop"] == "uvloop"),
+        ("httptools", runtime["http"] == "httptools"),
+    ) if active]
+    logger.info(
+        f"Server runtime: loop={runtime['loop']}, http={runtime['http']}, ws={runtime['ws']} "
+        f"(per-message-deflate {'on' if runtime['ws_per_message_deflate'] else 'off'}), "
+        f"workers={runtime['workers']}, keep-alive={runtime['timeout_keep_alive']}s, backlog={runtime['backlog']}"
+    )
+    logger.info(f"Fast paths active: {', '.join(fast_paths) if fast_paths else 'none'}")
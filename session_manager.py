@@ -4,18 +4,26 @@
 """
 
 import uuid
+import base64
+import bisect
+import itertools
 import logging
 from datetime import datetime
 from typing import Dict, Optional
 import config
+from fs_browser import directory_index
 
-logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# 全局递增的版本号来源，保证重置单例后版本号也不会重复
+_version_counter = itertools.count(1)
+
 
 class Session:
     """会话类"""
 
+    __slots__ = ("session_id", "title", "working_dir", "model", "created_at", "last_activity", "_dict_cache")
+
     def __init__(self, session_id: str, title: str, working_dir: str, model: str = None):
         self.session_id = session_id
         self.title = title
@@ -24,16 +32,63 @@ class Session:
         self.created_at = datetime.now()
         self.last_activity = datetime.now()
 
+    def __setattr__(self, name, value):
+        # 任何字段变化都会使缓存的序列化结果失效
+        object.__setattr__(self, name, value)
+        if name != "_dict_cache":
+            object.__setattr__(self, "_dict_cache", None)
+
     def to_dict(self) -> dict:
-        """转换为字典"""
-        return {
-            "session_id": self.session_id,
-            "title": self.title,
-            "working_dir": self.working_dir,
-            "model": self.model,
-            "created_at": self.created_at.isoformat(),
-            "last_activity": self.last_activity.isoformat(),
-        }
+        """转换为字典（内部缓存序列化结果直到会话字段变化，每次返回浅拷贝，调用方可自由修改）"""
+        if self._dict_cache is None:
+            self._dict_cache = {
+                "session_id": self.session_id,
+                "title": self.title,
+                "working_dir": self.working_dir,
+                "model": self.model,
+                "created_at": self.created_at.isoformat(),
+                "last_activity": self.last_activity.isoformat(),
+            }
+        return dict(self._dict_cache)
+
+    def index_key(self) -> tuple[float, str]:
+        """按最近活动时间排序的索引键"""
+        return (self.last_activity.timestamp(), self.session_id)
+
+
+def encode_cursor(key: tuple[float, str]) -> str:
+    """
+    将索引键编码为不透明的分页游标
+
+    Args:
+        key: (时间戳, 会话 ID)
+
+    Returns:
+        str: 游标字符串
+    """
+    raw = f"{key[0]!r}|{key[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    """
+    解码分页游标
+
+    Args:
+        cursor: 游标字符串
+
+    Returns:
+        tuple[float, str]: (时间戳, 会话 ID)
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, session_id = raw.split("|", 1)
+        return (float(timestamp), session_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
 
 
 class SessionManager:
@@ -41,12 +96,52 @@ class SessionManager:
 
     _instance: Optional["SessionManager"] = None
     _sessions: Dict[str, Session] = {}
+    _version: int = 0
+    # 按 (last_activity, session_id) 升序维护的索引
+    _activity_index: list[tuple[float, str]] = []
+    _index_keys: Dict[str, tuple[float, str]] = {}
+    _indexed_sessions: Optional[Dict[str, Session]] = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
 
+    @property
+    def version(self) -> int:
+        """会话集合的版本号，任何会话变化都会改变该值"""
+        return self._version
+
+    @property
+    def session_count(self) -> int:
+        """当前会话数"""
+        return len(self._sessions)
+
+    def _touch(self) -> None:
+        """标记会话集合已变化"""
+        self._version = next(_version_counter)
+
+    def _ensure_index(self) -> None:
+        """会话字典被整体替换或与索引不一致时重建索引"""
+        if self._indexed_sessions is self._sessions and len(self._index_keys) == len(self._sessions):
+            return
+        self._index_keys = {sid: session.index_key() for sid, session in self._sessions.items()}
+        self._activity_index = sorted(self._index_keys.values())
+        self._indexed_sessions = self._sessions
+
+    def _index_add(self, session: Session) -> None:
+        key = session.index_key()
+        self._index_keys[session.session_id] = key
+        bisect.insort(self._activity_index, key)
+
+    def _index_remove(self, session_id: str) -> None:
+        key = self._index_keys.pop(session_id, None)
+        if key is None:
+            return
+        position = bisect.bisect_left(self._activity_index, key)
+        if position < len(self._activity_index) and self._activity_index[position] == key:
+            del self._activity_index[position]
+
     def create_session(self, title: str, working_dir: str, model: str = None) -> Session:
         """
         创建新会话
@@ -63,13 +158,44 @@ class SessionManager:
         if not self._validate_working_dir(working_dir):
             raise ValueError(f"Working directory not allowed: {working_dir}")
 
+        if not directory_index.is_dir(working_dir):
+            raise ValueError(f"Working directory does not exist: {working_dir}")
+
+        return self._create(title, working_dir, model)
+
+    async def create_session_async(self, title: str, working_dir: str, model: str = None) -> Session:
+        """
+        创建新会话（工作目录校验在线程中执行，供异步路由调用）
+
+        Args:
+            title: 会话标题
+            working_dir: 工作目录
+            model: 模型名称（可选，默认使用配置的默认模型）
+
+        Returns:
+            Session: 新创建的会话
+        """
+        # 白名单检查需要解析符号链接（逐级 lstat），不在事件循环中执行
+        if not await directory_index.is_allowed_async(working_dir):
+            raise ValueError(f"Working directory not allowed: {working_dir}")
+
+        if not await directory_index.is_dir_async(working_dir):
+            raise ValueError(f"Working directory does not exist: {working_dir}")
+
+        return self._create(title, working_dir, model)
+
+    def _create(self, title: str, working_dir: str, model: Optional[str]) -> Session:
+        """校验模型并登记会话（工作目录已校验）"""
         # 验证模型
         if model and model not in config.IFLOW_AVAILABLE_MODELS:
             raise ValueError(f"Model not available: {model}")
 
         session_id = str(uuid.uuid4())
         session = Session(session_id, title, working_dir, model)
+        self._ensure_index()
         self._sessions[session_id] = session
+        self._index_add(session)
+        self._touch()
 
         logger.info(f"Created session: {session_id} with working dir: {working_dir}, model: {model}")
         return session
@@ -86,14 +212,83 @@ class SessionManager:
         """
         return self._sessions.get(session_id)
 
-    def list_sessions(self) -> list[dict]:
+    def list_sessions(self, **filters) -> list[dict]:
         """
-        列出所有会话
+        列出所有会话（默认最近活动在前）
+
+        Args:
+            **filters: 传递给 list_sessions_page 的过滤条件
 
         Returns:
             list[dict]: 会话列表
         """
-        return [session.to_dict() for session in self._sessions.values()]
+        return self.list_sessions_page(**filters)["sessions"]
+
+    def list_sessions_page(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        working_dir: Optional[str] = None,
+        model: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+        order: str = "desc",
+    ) -> dict:
+        """
+        按最近活动时间分页列出会话
+
+        Args:
+            limit: 每页数量（None 表示不分页）
+            cursor: 上一页返回的 next_cursor
+            working_dir: 按工作目录过滤
+            model: 按模型过滤
+            title_prefix: 按标题前缀过滤（不区分大小写）
+            order: "desc"（最近活动在前，默认）或 "asc"（最早活动在前）
+
+        Returns:
+            dict: 包含 sessions 和 next_cursor 的字典
+
+        Raises:
+            ValueError: 游标或排序参数无效
+        """
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Invalid order: {order}")
+        if limit is not None and limit < 1:
+            raise ValueError(f"Invalid limit: {limit}")
+
+        self._ensure_index()
+        index = self._activity_index
+        descending = order == "desc"
+
+        # 用二分查找定位游标位置
+        if cursor:
+            key = decode_cursor(cursor)
+            position = bisect.bisect_left(index, key) - 1 if descending else bisect.bisect_right(index, key)
+        else:
+            position = len(index) - 1 if descending else 0
+
+        title_prefix = title_prefix.lower() if title_prefix else None
+        step = -1 if descending else 1
+        results = []
+        last_key = None
+        next_cursor = None
+        while 0 <= position < len(index):
+            key = index[position]
+            position += step
+            session = self._sessions[key[1]]
+            if working_dir is not None and session.working_dir != working_dir:
+                continue
+            if model is not None and session.model != model:
+                continue
+            if title_prefix is not None and not session.title.lower().startswith(title_prefix):
+                continue
+            if limit is not None and len(results) >= limit:
+                # 还有更多匹配项，游标指向本页最后一条
+                next_cursor = encode_cursor(last_key)
+                break
+            results.append(session.to_dict())
+            last_key = key
+
+        return {"sessions": results, "next_cursor": next_cursor}
 
     def delete_session(self, session_id: str) -> bool:
         """
@@ -106,7 +301,10 @@ class SessionManager:
             bool: 是否删除成功
         """
         if session_id in self._sessions:
+            self._ensure_index()
             del self._sessions[session_id]
+            self._index_remove(session_id)
+            self._touch()
             logger.info(f"Deleted session: {session_id}")
             return True
         return False
@@ -120,7 +318,11 @@ class SessionManager:
         """
         session = self.get_session(session_id)
         if session:
+            self._ensure_index()
+            self._index_remove(session_id)
             session.last_activity = datetime.now()
+            self._index_add(session)
+            self._touch()
 
     def _validate_working_dir(self, working_dir: str) -> bool:
         """
@@ -132,18 +334,8 @@ class SessionManager:
         Returns:
             bool: 是否允许
         """
-        # 如果没有配置白名单，允许所有目录
-        if config.ALLOWED_WORKING_DIRS is None:
-            return True
-
-        # 检查是否在白名单中
-        normalized_dir = working_dir.replace("/", "\\")
-        for allowed_dir in config.ALLOWED_WORKING_DIRS:
-            normalized_allowed = allowed_dir.replace("/", "\\")
-            if normalized_dir == normalized_allowed or normalized_dir.startswith(normalized_allowed + "\\"):
-                return True
-
-        return False
+        # 使用规范化后的前缀树检查（未配置白名单时允许所有目录）
+        return directory_index.is_allowed(working_dir)
 
 
 # 全局会话管理器实例
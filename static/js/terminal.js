@@ -1,18 +1,301 @@
 // iflow2web 终端逻辑
 
+// 增量流式 Markdown 渲染器：只解析新到达的尾部，已完成的块渲染一次后不再改动
+class StreamingMarkdown {
+    constructor(container) {
+        this.container = container;
+        this.buffer = ''; // 尚未形成完整行的尾部文本
+        this.block = null; // 当前未完成的块
+        this.tailEl = null; // 没有打开的块时，用于预览不完整行的元素
+        this.done = false;
+    }
+
+    feed(text) {
+        this.buffer += text;
+        const lastNewline = this.buffer.lastIndexOf('\n');
+        if (lastNewline !== -1) {
+            const lines = this.buffer.slice(0, lastNewline).split('\n');
+            this.buffer = this.buffer.slice(lastNewline + 1);
+            lines.forEach(line => this.processLine(line));
+        }
+        this.renderOpenBlock();
+    }
+
+    finish() {
+        if (this.done) {
+            return;
+        }
+        if (this.buffer) {
+            const line = this.buffer;
+            this.buffer = '';
+            this.processLine(line);
+        }
+        this.closeBlock();
+        this.removeTail();
+        this.done = true;
+    }
+
+    processLine(line) {
+        this.removeTail();
+        const block = this.block;
+
+        // 代码块内部：只有结束围栏会结束代码块
+        if (block && block.type === 'code') {
+            if (/^\s*```/.test(line)) {
+                this.closeBlock();
+            } else {
+                block.pendingCode += line + '\n';
+            }
+            return;
+        }
+
+        const fence = line.match(/^\s*```\s*([\w+#.-]*)/);
+        if (fence) {
+            this.closeBlock();
+            this.openBlock('code', fence[1].toLowerCase());
+            return;
+        }
+
+        if (!line.trim()) {
+            this.closeBlock();
+            return;
+        }
+
+        const heading = line.match(/^(#{1,6})\s+(.*)$/);
+        if (heading) {
+            this.closeBlock();
+            this.openBlock(`h${heading[1].length}`);
+            this.block.lines.push(heading[2]);
+            this.closeBlock();
+            return;
+        }
+
+        if (/^\s*([-*_])(\s*\1){2,}\s*$/.test(line)) {
+            this.closeBlock();
+            this.openBlock('hr');
+            this.closeBlock();
+            return;
+        }
+
+        const listItem = line.match(/^\s*([-*+]|\d+[.)])\s+(.*)$/);
+        if (listItem) {
+            const type = /\d/.test(listItem[1]) ? 'ol' : 'ul';
+            if (!block || block.type !== type) {
+                this.closeBlock();
+                this.openBlock(type);
+            }
+            this.block.lines.push(listItem[2]);
+            return;
+        }
+
+        const quote = line.match(/^\s*>\s?(.*)$/);
+        if (quote) {
+            if (!block || block.type !== 'blockquote') {
+                this.closeBlock();
+                this.openBlock('blockquote');
+            }
+            this.block.lines.push(quote[1]);
+            return;
+        }
+
+        // 缩进的续行归入上一个列表项
+        if (block && (block.type === 'ul' || block.type === 'ol') && /^\s+/.test(line)) {
+            block.lines[block.lines.length - 1] += ' ' + line.trim();
+            return;
+        }
+
+        if (!block || block.type !== 'p') {
+            this.closeBlock();
+            this.openBlock('p');
+        }
+        this.block.lines.push(line);
+    }
+
+    openBlock(type, lang = '') {
+        const block = { type, lang, lines: [], pendingCode: '', el: null, codeEl: null, tailNode: null };
+        if (type === 'code') {
+            block.el = document.createElement('pre');
+            block.codeEl = document.createElement('code');
+            if (lang) {
+                block.codeEl.dataset.lang = lang;
+            }
+            block.tailNode = document.createTextNode('');
+            block.codeEl.appendChild(block.tailNode);
+            block.el.appendChild(block.codeEl);
+        } else {
+            block.el = document.createElement(type === 'blockquote' ? 'blockquote' : type);
+        }
+        this.container.appendChild(block.el);
+        this.block = block;
+    }
+
+    closeBlock() {
+        const block = this.block;
+        if (!block) {
+            return;
+        }
+        this.block = null;
+        if (block.type === 'code') {
+            this.flushCode(block);
+            block.tailNode.remove();
+            StreamingMarkdown.scheduleHighlight(block.codeEl, block.lang);
+        } else {
+            this.renderBlock(block, block.lines);
+        }
+    }
+
+    flushCode(block) {
+        // 完整的代码行只追加一次文本节点
+        if (block.pendingCode) {
+            block.codeEl.insertBefore(document.createTextNode(block.pendingCode), block.tailNode);
+            block.pendingCode = '';
+        }
+    }
+
+    renderOpenBlock() {
+        const block = this.block;
+        if (block && block.type === 'code') {
+            this.flushCode(block);
+            block.tailNode.data = this.buffer;
+        } else if (block) {
+            // 只重新渲染当前打开的块，已完成的块保持不变
+            this.renderBlock(block, this.buffer ? block.lines.concat(this.buffer) : block.lines);
+        } else if (this.buffer) {
+            if (!this.tailEl) {
+                this.tailEl = document.createElement('p');
+                this.container.appendChild(this.tailEl);
+            }
+            this.tailEl.innerHTML = StreamingMarkdown.renderInline(this.buffer);
+        }
+    }
+
+    removeTail() {
+        if (this.tailEl) {
+            this.tailEl.remove();
+            this.tailEl = null;
+        }
+    }
+
+    renderBlock(block, lines) {
+        switch (block.type) {
+            case 'ul':
+            case 'ol':
+                block.el.innerHTML = lines.map(line => `<li>${StreamingMarkdown.renderInline(line)}</li>`).join('');
+                break;
+            case 'hr':
+                break;
+            default:
+                block.el.innerHTML = lines.map(line => StreamingMarkdown.renderInline(line)).join('<br>');
+        }
+    }
+
+    static escapeHtml(text) {
+        return text.replace(/[&<>"']/g, ch => ({
+            '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;',
+        })[ch]);
+    }
+
+    static renderInline(text) {
+        const codeSpans = [];
+        let html = StreamingMarkdown.escapeHtml(text).replace(/`([^`]+)`/g, (_, code) => {
+            codeSpans.push(code);
+            return `\u0000${codeSpans.length - 1}\u0000`;
+        });
+        html = html
+            .replace(/\*\*([^*]+)\*\*/g, '<strong>$1</strong>')
+            .replace(/(^|[^*\w])\*([^*\s][^*]*)\*/g, '$1<em>$2</em>')
+            .replace(/\[([^\]]+)\]\((https?:\/\/[^\s)]+)\)/g, '<a href="$2" target="_blank" rel="noopener noreferrer">$1</a>');
+        return html.replace(/\u0000(\d+)\u0000/g, (_, i) => `<code>${codeSpans[i]}</code>`);
+    }
+
+    static scheduleHighlight(codeEl, lang) {
+        // 语法高亮推迟到浏览器空闲时执行，不占用流式渲染的帧预算
+        const run = () => {
+            if (codeEl.isConnected) {
+                StreamingMarkdown.highlight(codeEl, lang);
+            }
+        };
+        if (window.requestIdleCallback) {
+            window.requestIdleCallback(run, { timeout: 2000 });
+        } else {
+            setTimeout(run, 50);
+        }
+    }
+
+    static highlight(codeEl, lang) {
+        const code = codeEl.textContent;
+        if (code.length > StreamingMarkdown.MAX_HIGHLIGHT_LENGTH) {
+            return;
+        }
+        const hashComments = StreamingMarkdown.HASH_COMMENT_LANGS.has(lang);
+        const pattern = new RegExp([
+            hashComments ? '(#[^\\n]*)' : '(\\/\\/[^\\n]*|\\/\\*[\\s\\S]*?\\*\\/)',
+            '("(?:[^"\\\\\\n]|\\\\.)*"|\'(?:[^\'\\\\\\n]|\\\\.)*\'|`(?:[^`\\\\]|\\\\.)*`)',
+            '(\\b\\d+(?:\\.\\d+)?\\b)',
+            `(\\b(?:${StreamingMarkdown.KEYWORDS.join('|')})\\b)`,
+        ].join('|'), 'g');
+
+        let html = '';
+        let last = 0;
+        code.replace(pattern, (match, comment, string, number, keyword, offset) => {
+            html += StreamingMarkdown.escapeHtml(code.slice(last, offset));
+            const cls = comment ? 'hl-comment' : string ? 'hl-string' : number ? 'hl-number' : 'hl-keyword';
+            html += `<span class="${cls}">${StreamingMarkdown.escapeHtml(match)}</span>`;
+            last = offset + match.length;
+            return match;
+        });
+        html += StreamingMarkdown.escapeHtml(code.slice(last));
+        codeEl.innerHTML = html;
+    }
+}
+
+StreamingMarkdown.MAX_HIGHLIGHT_LENGTH = 20000;
+StreamingMarkdown.HASH_COMMENT_LANGS = new Set([
+    'python', 'py', 'sh', 'bash', 'shell', 'zsh', 'yaml', 'yml', 'toml', 'ruby', 'rb', 'perl', 'r',
+    'dockerfile', 'makefile', 'powershell', 'ps1', 'ini', 'conf',
+]);
+StreamingMarkdown.KEYWORDS = [
+    'and', 'as', 'async', 'await', 'break', 'case', 'catch', 'class', 'const', 'continue', 'def', 'del',
+    'do', 'elif', 'else', 'enum', 'except', 'export', 'extends', 'false', 'False', 'finally', 'fn', 'for',
+    'from', 'func', 'function', 'go', 'if', 'impl', 'import', 'in', 'interface', 'is', 'lambda', 'let',
+    'match', 'mut', 'new', 'nil', 'None', 'not', 'null', 'or', 'package', 'pass', 'pub', 'raise', 'return',
+    'self', 'static', 'struct', 'switch', 'this', 'throw', 'true', 'True', 'try', 'type', 'typeof', 'use',
+    'var', 'void', 'while', 'with', 'yield',
+];
+
 class Terminal {
     constructor() {
         this.ws = null;
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 10;
         this.reconnectDelay = 2000;
-        this.currentAssistantMessage = null;
         this.isConnected = false;
         this.isProcessing = false;
         this.currentSessionId = null;
         this.sessions = [];
         this.messageQueue = []; // 消息队列
         this.pendingMessages = new Map(); // 待确认的消息
+        this.retryAt = 0; // 被限流时可以再次发送的时间
+        this.retryTimer = null;
+
+        // 渲染管线：收到的帧先缓冲，每个动画帧统一刷新一次
+        this.pendingFrames = [];
+        this.pendingStreamText = '';
+        this.currentStreamEntry = null;
+        this.renderScheduled = false;
+        this.scrollPending = false;
+        this.forceScroll = false;
+
+        // 子 Agent 面板：agent_id -> 面板记录，折叠时服务端只发送状态帧，展开时订阅其输出
+        this.agentPanes = new Map();
+
+        // 虚拟滚动：entries 保存全部消息的紧凑记录，只有 [windowStart, windowEnd) 挂载在 DOM 中
+        this.entries = [];
+        this.windowStart = 0;
+        this.windowEnd = 0;
+        this.messageList = null;
+        this.scrollObserver = null;
+        this.scrollbackBatch = 50;
 
         this.init();
     }
@@ -20,8 +303,38 @@ class Terminal {
     init() {
         this.setupDOM();
         this.setupEventListeners();
-        this.loadModels();
-        this.loadSessions();
+
+        // 优先使用页面内联的引导数据，只有缺失时才单独请求
+        const bootstrap = this.readBootstrap();
+        if (bootstrap) {
+            this.applyModels(bootstrap.models);
+            this.applySessions(bootstrap.sessions);
+        } else {
+            this.loadModels().then(() => this.loadSessions());
+        }
+    }
+
+    readBootstrap() {
+        const element = document.getElementById('bootstrap-data');
+        if (!element) {
+            return null;
+        }
+        try {
+            const data = JSON.parse(element.textContent);
+            if (data.config?.default_working_dir) {
+                this.defaultWorkingDir = data.config.default_working_dir;
+            }
+            return data;
+        } catch (error) {
+            console.error('Failed to parse bootstrap data:', error);
+            return null;
+        }
+    }
+
+    getDefaultWorkingDir() {
+        return this.defaultWorkingDir
+            || document.querySelector('[data-default-working-dir]')?.dataset.defaultWorkingDir
+            || '.';
     }
 
     setupDOM() {
@@ -32,9 +345,14 @@ class Terminal {
         this.statusIndicator = document.querySelector('.status-indicator');
         this.sessionsList = document.querySelector('.sessions-list');
         this.newSessionBtn = document.getElementById('new-session-btn');
+        this.searchInput = document.getElementById('session-search');
+        this.searchResults = document.getElementById('search-results');
+        this.searchTimer = null;
         this.modal = document.getElementById('session-modal');
         this.modalTitleInput = document.getElementById('session-title');
         this.modalWorkingDirInput = document.getElementById('session-working-dir');
+        this.workingDirSuggestions = document.getElementById('working-dir-suggestions');
+        this.workingDirCompleteTimer = null;
         this.modalModelSelect = document.getElementById('session-model');
         this.modalCancelBtn = document.getElementById('modal-cancel');
         this.modalCreateBtn = document.getElementById('modal-create');
@@ -43,6 +361,10 @@ class Terminal {
         this.sidebarToggle = document.getElementById('sidebar-toggle');
         this.sidebar = document.querySelector('.sidebar');
         this.sidebarOverlay = document.getElementById('sidebar-overlay');
+
+        // DOM 中最多保留的消息数（可在服务器配置 TERMINAL_MAX_DOM_MESSAGES）
+        const maxDomMessages = parseInt(document.body.dataset.maxDomMessages, 10);
+        this.maxDomMessages = Math.max(2 * this.scrollbackBatch, maxDomMessages || 300);
     }
 
     setupEventListeners() {
@@ -64,6 +386,17 @@ class Terminal {
         this.modalCancelBtn.addEventListener('click', () => this.hideNewSessionModal());
         this.modalCreateBtn.addEventListener('click', () => this.createNewSession());
 
+        // 工作目录自动补全
+        this.modalWorkingDirInput.addEventListener('input', () => this.scheduleWorkingDirComplete());
+
+        // 对话记录全文搜索
+        this.searchInput.addEventListener('input', () => this.scheduleSearch());
+        this.searchInput.addEventListener('keydown', (e) => {
+            if (e.key === 'Escape') {
+                this.clearSearch();
+            }
+        });
+
         // 点击模态框背景关闭
         this.modal.addEventListener('click', (e) => {
             if (e.target === this.modal) {
@@ -81,31 +414,30 @@ class Terminal {
                 this.ws.close();
             }
         });
-
-        // 自动滚动到底部
-        this.terminalContainer.addEventListener('DOMNodeInserted', () => {
-            this.scrollToBottom();
-        });
     }
 
     async loadModels() {
         try {
             const response = await fetch('/api/models');
-            const data = await response.json();
-            this.models = data.available_models;
-            this.defaultModel = data.default_model;
-            this.renderModelOptions();
+            this.applyModels(await response.json());
         } catch (error) {
             console.error('Failed to load models:', error);
         }
     }
 
+    applyModels(data) {
+        this.models = data.available_models;
+        this.defaultModel = data.default_model;
+        this.modelStats = data.model_stats || {};
+        this.renderModelOptions();
+    }
+
     renderModelOptions() {
         this.modalModelSelect.innerHTML = '<option value="" disabled selected>选择模型</option>';
         this.models.forEach(model => {
             const option = document.createElement('option');
             option.value = model;
-            option.textContent = model;
+            option.textContent = this.formatModelLabel(model);
             if (model === this.defaultModel) {
                 option.selected = true;
             }
@@ -113,26 +445,42 @@ class Terminal {
         });
     }
 
+    formatModelLabel(model) {
+        // 附带最近观测到的首字延迟和错误率，便于避开变慢的后端
+        const stats = this.modelStats && this.modelStats[model];
+        if (!stats || stats.ttft_p50 == null) {
+            return model;
+        }
+        let label = `${model} · 首字 ${stats.ttft_p50.toFixed(1)}s`;
+        if (stats.error_rate) {
+            label += ` · 错误 ${Math.round(stats.error_rate * 100)}%`;
+        }
+        return label;
+    }
+
     async loadSessions() {
         try {
             const response = await fetch('/api/sessions');
             const data = await response.json();
-            this.sessions = data.sessions;
-            this.renderSessions();
-
-            // 如果没有会话，创建默认会话
-            if (this.sessions.length === 0) {
-                const defaultDir = document.querySelector('[data-default-working-dir]')?.dataset.defaultWorkingDir || '.';
-                await this.createSession('Default Session', defaultDir);
-            } else {
-                // 自动选择第一个会话
-                this.selectSession(this.sessions[0].session_id);
-            }
+            await this.applySessions(data.sessions);
         } catch (error) {
             console.error('Failed to load sessions:', error);
         }
     }
 
+    async applySessions(sessions) {
+        this.sessions = sessions;
+        this.renderSessions();
+
+        // 如果没有会话，创建默认会话
+        if (this.sessions.length === 0) {
+            await this.createSession('Default Session', this.getDefaultWorkingDir());
+        } else {
+            // 自动选择最近活动的会话（列表按最近活动在前）
+            this.selectSession(this.sessions[0].session_id);
+        }
+    }
+
     renderSessions() {
         this.sessionsList.innerHTML = '';
         this.sessions.forEach(session => {
@@ -144,12 +492,13 @@ class Terminal {
                 <div class="session-info">${this.escapeHtml(session.working_dir)}</div>
                 <div class="session-info">模型: ${this.escapeHtml(session.model)}</div>
                 <div class="session-actions">
+                    <a class="session-export-btn" href="/api/sessions/${encodeURIComponent(session.session_id)}/export?format=markdown" download>导出</a>
                     <button class="session-delete-btn" data-action="delete">删除</button>
                 </div>
             `;
 
             sessionElement.addEventListener('click', (e) => {
-                if (!e.target.classList.contains('session-delete-btn')) {
+                if (!e.target.closest('.session-actions')) {
                     this.selectSession(session.session_id);
                 }
             });
@@ -178,7 +527,11 @@ class Terminal {
                 body: JSON.stringify({ title, working_dir: workingDir, model }),
             });
             const session = await response.json();
-            this.sessions.push(session);
+            if (!response.ok) {
+                alert(session.detail?.message || session.detail || 'Failed to create session');
+                return;
+            }
+            this.sessions.unshift(session);
             this.renderSessions();
             this.selectSession(session.session_id);
             this.hideNewSessionModal();
@@ -206,6 +559,7 @@ class Terminal {
                     if (this.ws) {
                         this.ws.close();
                     }
+                    this.resetRenderState();
                     this.terminalContent.innerHTML = '';
                 }
             }
@@ -218,13 +572,112 @@ class Terminal {
     showNewSessionModal() {
         this.modal.classList.add('show');
         this.modalTitleInput.value = '';
-        this.modalWorkingDirInput.value = document.querySelector('[data-default-working-dir]')?.dataset.defaultWorkingDir || '.';
+        this.modalWorkingDirInput.value = this.getDefaultWorkingDir();
         if (this.defaultModel) {
             this.modalModelSelect.value = this.defaultModel;
         }
+        // 刷新模型列表，获取最新的性能统计和（按策略选择的）默认模型
+        this.loadModels();
         this.modalTitleInput.focus();
     }
 
+    scheduleSearch() {
+        // 防抖，输入停顿后再搜索
+        clearTimeout(this.searchTimer);
+        this.searchTimer = setTimeout(() => this.searchTranscripts(), 300);
+    }
+
+    clearSearch() {
+        clearTimeout(this.searchTimer);
+        this.searchInput.value = '';
+        this.searchResults.innerHTML = '';
+        this.searchResults.hidden = true;
+    }
+
+    async searchTranscripts() {
+        const query = this.searchInput.value.trim();
+        if (!query) {
+            this.clearSearch();
+            return;
+        }
+
+        try {
+            const response = await fetch(`/api/search?q=${encodeURIComponent(query)}&limit=20`);
+            const data = await response.json();
+            // 输入已变化时丢弃过期结果
+            if (query !== this.searchInput.value.trim()) {
+                return;
+            }
+            this.renderSearchResults(response.ok ? data.results : []);
+        } catch (error) {
+            console.error('Failed to search transcripts:', error);
+        }
+    }
+
+    renderSearchResults(results) {
+        this.searchResults.innerHTML = '';
+        this.searchResults.hidden = false;
+        if (results.length === 0) {
+            this.searchResults.innerHTML = '<div class="search-empty">没有找到匹配的对话</div>';
+            return;
+        }
+        results.forEach(result => {
+            const item = document.createElement('div');
+            item.className = 'search-result';
+            const time = new Date(result.ts * 1000).toLocaleString();
+            // snippet 已由服务器转义，只包含 <mark> 标签
+            item.innerHTML = `
+                <div class="session-title">${this.escapeHtml(result.title || result.session_id)}</div>
+                <div class="session-info">${result.role === 'user' ? '用户' : '助手'} · ${this.escapeHtml(time)}</div>
+                <div class="search-snippet">${result.snippet}</div>
+            `;
+            item.addEventListener('click', () => {
+                this.clearSearch();
+                if (this.sessions.some(session => session.session_id === result.session_id)) {
+                    this.selectSession(result.session_id);
+                }
+            });
+            this.searchResults.appendChild(item);
+        });
+    }
+
+    scheduleWorkingDirComplete() {
+        // 防抖，避免每次按键都请求服务器
+        clearTimeout(this.workingDirCompleteTimer);
+        this.workingDirCompleteTimer = setTimeout(() => this.completeWorkingDir(), 150);
+    }
+
+    async completeWorkingDir() {
+        const prefix = this.modalWorkingDirInput.value;
+        if (!prefix) {
+            this.workingDirSuggestions.innerHTML = '';
+            return;
+        }
+
+        try {
+            const response = await fetch(`/api/fs?prefix=${encodeURIComponent(prefix)}`);
+            const data = await response.json();
+            // 输入已变化时丢弃过期结果
+            if (prefix !== this.modalWorkingDirInput.value) {
+                return;
+            }
+            this.workingDirSuggestions.innerHTML = '';
+            (data.suggestions || []).forEach(suggestion => {
+                const option = document.createElement('option');
+                if (suggestion.selectable) {
+                    option.value = suggestion.path;
+                } else {
+                    // 白名单目录的上级目录不能直接选用，选中后继续向下补全
+                    option.value = suggestion.path.replace(/[\\/]?$/, '/');
+                    option.label = `${suggestion.path}（仅可浏览）`;
+                }
+                this.workingDirSuggestions.appendChild(option);
+            });
+        } catch (error) {
+            console.error('Failed to complete working dir:', error);
+        }
+    }
+
     hideNewSessionModal() {
         this.modal.classList.remove('show');
     }
@@ -269,19 +722,12 @@ class Terminal {
                 if (this.terminalContent.querySelector('.init-message')) {
                     this.terminalContent.innerHTML = '<div class="init-message">正在连接会话，请稍候...</div>';
                 }
-                this.ws.send(JSON.stringify({ session_id: this.currentSessionId }));
+                this.ws.send(JSON.stringify({ session_id: this.currentSessionId, agent_streams: 'on_demand' }));
             };
 
             this.ws.onmessage = (event) => {
                 const data = JSON.parse(event.data);
 
-                if (data.type === 'error') {
-                    console.error('Session error:', data.content);
-                    this.appendMessage(data.content, 'error');
-                    // 不更新连接状态，因为可能是临时错误
-                    return;
-                }
-
                 if (data.type === 'pong') {
                     this.reconnectAttempts = 0;
                     this.updateConnectionStatus('connected');
@@ -291,7 +737,7 @@ class Terminal {
                     return;
                 }
 
-                this.handleMessage(data);
+                this.enqueueFrame(data);
             };
 
             this.ws.onerror = (error) => {
@@ -327,12 +773,67 @@ class Terminal {
         }
     }
 
+    enqueueFrame(data) {
+        this.pendingFrames.push(data);
+        this.scheduleRender();
+    }
+
+    scheduleRender() {
+        if (this.renderScheduled) {
+            return;
+        }
+        this.renderScheduled = true;
+        // 后台标签页不会触发 requestAnimationFrame，改用低频定时器避免缓冲无限增长
+        if (document.hidden) {
+            setTimeout(() => this.flushRender(), 250);
+        } else {
+            requestAnimationFrame(() => this.flushRender());
+        }
+    }
+
+    flushRender() {
+        this.renderScheduled = false;
+
+        // 在修改 DOM 之前读取滚动位置，避免强制同步布局
+        const stickToBottom = this.forceScroll || this.isNearBottom();
+
+        const frames = this.pendingFrames;
+        this.pendingFrames = [];
+        for (const data of frames) {
+            this.handleMessage(data);
+        }
+        this.flushStreamText();
+
+        if ((frames.length > 0 || this.scrollPending) && stickToBottom) {
+            this.scrollToBottom();
+        }
+        this.scrollPending = false;
+        this.forceScroll = false;
+    }
+
+    requestScroll(force = false) {
+        this.scrollPending = true;
+        this.forceScroll = this.forceScroll || force;
+        this.scheduleRender();
+    }
+
+    isNearBottom() {
+        const container = this.terminalContainer;
+        return container.scrollHeight - container.scrollTop - container.clientHeight < 80;
+    }
+
     handleMessage(data) {
-        // 收到任何响应消息时隐藏处理中指示器
-        if (data.type !== 'user') {
+        // 收到任何响应消息时隐藏处理中指示器（文件变更推送与当前请求无关）
+        if (data.type !== 'user' && data.type !== 'files_changed') {
             this.hideProcessingIndicator();
         }
 
+        // 子 Agent 的输出进入各自的面板
+        if (data.agent_id && (data.type === 'assistant' || data.type === 'tool' || data.type === 'plan')) {
+            this.appendAgentFrame(data);
+            return;
+        }
+
         switch (data.type) {
             case 'user':
                 // 用户消息回显
@@ -357,6 +858,16 @@ class Terminal {
                 this.appendMessage(data.content, 'plan', data);
                 break;
 
+            case 'agent':
+                // 子 Agent 状态（started / activity / finished）
+                this.updateAgentPane(data);
+                break;
+
+            case 'agent_backlog':
+                // 展开子 Agent 时补发的缓冲输出
+                this.appendAgentBacklog(data);
+                break;
+
             case 'finish':
                 // 任务完成
                 this.finalizeStreamMessage();
@@ -365,12 +876,26 @@ class Terminal {
                 break;
 
             case 'error':
-                // 错误消息
+                // 错误消息（限流、熔断、资源超限等错误帧之后不会再有 finish，在这里结束处理状态）
+                console.error('Session error:', data.content);
                 this.appendMessage(data.content, 'error', data);
                 this.isProcessing = false;
+                if (data.retry_after) {
+                    this.holdInput(data.retry_after);
+                }
                 this.updateInputState();
                 break;
 
+            case 'recovered':
+                // iFlow 进程崩溃后已自动重启
+                this.appendMessage(data.content, 'recovered', data);
+                break;
+
+            case 'files_changed':
+                // 工作目录文件变更
+                this.appendFilesChanged(data);
+                break;
+
             default:
                 console.warn('Unknown message type:', data.type);
         }
@@ -394,9 +919,17 @@ class Terminal {
             return;
         }
 
+        if (this.retryAt > Date.now()) {
+            this.appendMessage(`请求过于频繁，请在 ${Math.ceil((this.retryAt - Date.now()) / 1000)} 秒后重试`, 'error');
+            return;
+        }
+
         // 显示用户消息
         this.appendMessage(message, 'user');
 
+        // 子 Agent ID 每轮都不同，服务端在新一轮开始时清空订阅
+        this.agentPanes.clear();
+
         // 保存消息到队列（用于重试）
         const messageId = Date.now().toString();
         this.messageQueue.push({
@@ -431,39 +964,499 @@ class Terminal {
     }
 
     appendMessage(content, type, details = null) {
-        const messageElement = document.createElement('div');
-        messageElement.className = `message ${type}`;
-        messageElement.textContent = content;
+        // 先写入缓冲的流式文本，保证显示顺序
+        this.flushStreamText();
 
-        // 添加详细信息
-        if (details && this.hasDetails(details)) {
-            const detailsElement = this.createDetailsElement(type, details);
-            messageElement.appendChild(detailsElement);
+        // 用户发送消息时回到最新位置
+        if (type === 'user' && this.messageList && !this.isFollowingTail()) {
+            this.jumpToLatest();
         }
 
-        this.terminalContent.appendChild(messageElement);
+        this.addEntry({
+            type,
+            text: content,
+            details: details && this.hasDetails(details) ? details : null,
+            el: null,
+            textEl: null,
+        });
+        this.requestScroll(type === 'user');
     }
 
     appendStreamMessage(content, type, details = null) {
-        if (!this.currentAssistantMessage) {
-            this.currentAssistantMessage = document.createElement('div');
-            this.currentAssistantMessage.className = `message ${type}`;
-            this.currentAssistantMessage.textContent = content;
-
-            // 添加详细信息
-            if (details && this.hasDetails(details)) {
-                this.currentAssistantDetails = this.createDetailsElement(type, details);
-                this.currentAssistantMessage.appendChild(this.currentAssistantDetails);
+        if (!this.currentStreamEntry) {
+            this.flushStreamText();
+            this.currentStreamEntry = {
+                type,
+                text: '',
+                details: details && this.hasDetails(details) ? details : null,
+                streaming: true,
+                el: null,
+                textEl: null,
+                md: null,
+            };
+            this.addEntry(this.currentStreamEntry);
+        }
+
+        // 同一动画帧内的分块合并为一次 DOM 追加
+        this.pendingStreamText += content;
+    }
+
+    flushStreamText() {
+        const entry = this.currentStreamEntry;
+        if (!this.pendingStreamText || !entry) {
+            return;
+        }
+        entry.text += this.pendingStreamText;
+        // 条目已被移出 DOM 时只更新记录，重新挂载时再渲染
+        if (entry.md) {
+            entry.md.feed(this.pendingStreamText);
+        } else if (entry.textEl) {
+            entry.textEl.appendChild(document.createTextNode(this.pendingStreamText));
+        }
+        this.pendingStreamText = '';
+    }
+
+    // ===== 子 Agent 面板 =====
+
+    getAgentPane(data) {
+        let pane = this.agentPanes.get(data.agent_id);
+        if (!pane) {
+            this.flushStreamText();
+            pane = {
+                type: 'agent',
+                agentId: data.agent_id,
+                agentInfo: data.agent_info || null,
+                text: '',
+                body: '',
+                expanded: false,
+                finished: false,
+                pending: 0,
+                dropped: 0,
+                details: null,
+                el: null,
+                textEl: null,
+                bodyEl: null,
+                md: null,
+            };
+            this.agentPanes.set(data.agent_id, pane);
+            this.addEntry(pane);
+            this.requestScroll(false);
+        }
+        return pane;
+    }
+
+    formatAgentFrame(data) {
+        // 面板正文统一按 Markdown 渲染，工具调用和计划作为独立的引用段落
+        switch (data.type) {
+            case 'assistant':
+                return data.content || '';
+            case 'tool':
+                return `\n\n> ${data.tool_name}: ${data.status}\n\n`;
+            case 'plan':
+                return `\n\n> ${data.content}\n\n`;
+            default:
+                return '';
+        }
+    }
+
+    appendAgentFrame(data) {
+        const pane = this.getAgentPane(data);
+        const text = this.formatAgentFrame(data);
+        pane.body += text;
+        // 折叠或未挂载时只更新记录，展开或重新挂载时再渲染
+        if (pane.md) {
+            pane.md.feed(text);
+        }
+        this.requestScroll(false);
+    }
+
+    appendAgentBacklog(data) {
+        const pane = this.getAgentPane(data);
+        if (data.dropped) {
+            pane.dropped += data.dropped;
+            this.appendAgentFrame({ type: 'plan', agent_id: data.agent_id, content: `（超出缓冲上限，省略了 ${data.dropped} 段较早的输出）` });
+        }
+        data.frames.forEach(frame => this.appendAgentFrame(frame));
+        pane.pending = 0;
+        this.renderAgentHeader(pane);
+    }
+
+    updateAgentPane(data) {
+        const pane = this.getAgentPane(data);
+        pane.agentInfo = data.agent_info || pane.agentInfo;
+        pane.pending = data.subscribed ? 0 : data.pending;
+        if (data.event === 'finished') {
+            pane.finished = true;
+            if (pane.md) {
+                pane.md.finish();
             }
+        }
+        this.renderAgentHeader(pane);
+    }
 
-            this.terminalContent.appendChild(this.currentAssistantMessage);
-        } else {
-            this.currentAssistantMessage.childNodes[0].textContent += content;
+    toggleAgentPane(pane) {
+        pane.expanded = !pane.expanded;
+        // 本轮仍在进行时向服务端订阅或取消订阅；上一轮的面板只在本地展开
+        if (this.agentPanes.get(pane.agentId) === pane && this.ws && this.ws.readyState === WebSocket.OPEN) {
+            this.ws.send(JSON.stringify({
+                type: pane.expanded ? 'agent_subscribe' : 'agent_unsubscribe',
+                agent_id: pane.agentId,
+            }));
+        }
+        this.renderAgentBody(pane);
+        this.renderAgentHeader(pane);
+    }
+
+    renderAgentHeader(pane) {
+        if (!pane.textEl) {
+            return;
+        }
+        const index = pane.agentInfo?.agent_index;
+        const name = index !== null && index !== undefined ? `子 Agent #${index + 1}` : `子 Agent ${pane.agentId}`;
+        const state = pane.finished ? '已完成' : '运行中';
+        const pending = !pane.expanded && pane.pending > 0 ? `，${pane.pending} 段输出未展开` : '';
+        pane.textEl.textContent = `${pane.expanded ? '▾' : '▸'} ${name}（${state}${pending}）`;
+    }
+
+    renderAgentBody(pane) {
+        if (!pane.bodyEl) {
+            return;
+        }
+        pane.bodyEl.hidden = !pane.expanded;
+        if (pane.expanded && !pane.md) {
+            pane.md = new StreamingMarkdown(pane.bodyEl);
+            pane.md.feed(pane.body);
+            if (pane.finished) {
+                pane.md.finish();
+            }
+        } else if (!pane.expanded && pane.md) {
+            // 折叠后丢弃渲染结果，展开时按记录重新渲染
+            pane.md = null;
+            pane.bodyEl.textContent = '';
+        }
+    }
+
+    createAgentElement(pane) {
+        const element = document.createElement('div');
+        element.className = 'message agent';
+        const header = document.createElement('button');
+        header.className = 'agent-header';
+        header.addEventListener('click', () => this.toggleAgentPane(pane));
+        const body = document.createElement('div');
+        body.className = 'message-text markdown agent-body';
+        element.appendChild(header);
+        element.appendChild(body);
+
+        pane.el = element;
+        pane.textEl = header;
+        pane.bodyEl = body;
+        this.renderAgentHeader(pane);
+        this.renderAgentBody(pane);
+        return element;
+    }
+
+    appendFilesChanged(data) {
+        this.addEntry({
+            type: 'files',
+            text: `${data.total} 个文件已变更${data.truncated ? `（显示前 ${data.files.length} 个）` : ''}`,
+            files: data.files,
+            sessionId: this.currentSessionId,
+            details: null,
+            el: null,
+            textEl: null,
+        });
+        this.requestScroll(false);
+    }
+
+    createFilesElement(entry) {
+        const list = document.createElement('ul');
+        list.className = 'file-changes';
+        entry.files.forEach(file => {
+            const item = document.createElement('li');
+            const badge = document.createElement('span');
+            badge.className = `file-change ${file.change}`;
+            badge.textContent = { added: 'A', modified: 'M', deleted: 'D' }[file.change] || '?';
+            const link = document.createElement('button');
+            link.className = 'file-path';
+            link.textContent = file.path;
+            link.addEventListener('click', () => this.toggleFileDiff(entry, file, item));
+            item.appendChild(badge);
+            item.appendChild(link);
+            list.appendChild(item);
+        });
+        return list;
+    }
+
+    async toggleFileDiff(entry, file, item) {
+        const existing = item.querySelector('.file-diff');
+        if (existing) {
+            existing.remove();
+            return;
         }
+        const pre = document.createElement('pre');
+        pre.className = 'file-diff';
+        item.appendChild(pre);
+
+        // 差异按需加载，加载后缓存在记录中，重新挂载时无需再次请求
+        if (file.diff === undefined) {
+            pre.textContent = '加载中...';
+            try {
+                const response = await fetch(`/api/sessions/${entry.sessionId}/diff?path=${encodeURIComponent(file.path)}`);
+                const data = await response.json();
+                if (!response.ok) {
+                    pre.textContent = data.detail || '无法加载差异';
+                    return;
+                }
+                file.diff = data.binary ? '(二进制文件)' : (data.diff || '(无差异)') + (data.truncated ? '\n...(已截断)' : '');
+            } catch (error) {
+                pre.textContent = '无法加载差异';
+                return;
+            }
+        }
+        this.renderDiff(pre, file.diff);
+    }
+
+    renderDiff(pre, diff) {
+        const fragment = document.createDocumentFragment();
+        diff.split('\n').forEach(line => {
+            const span = document.createElement('span');
+            if (line.startsWith('+') && !line.startsWith('+++')) {
+                span.className = 'diff-add';
+            } else if (line.startsWith('-') && !line.startsWith('---')) {
+                span.className = 'diff-del';
+            } else if (line.startsWith('@@')) {
+                span.className = 'diff-hunk';
+            }
+            span.textContent = line + '\n';
+            fragment.appendChild(span);
+        });
+        pre.textContent = '';
+        pre.appendChild(fragment);
+    }
+
+    resetRenderState() {
+        // 清空终端内容前丢弃未渲染的缓冲和滚动记录
+        this.pendingFrames = [];
+        this.pendingStreamText = '';
+        this.currentStreamEntry = null;
+        this.agentPanes = new Map();
+        if (this.scrollObserver) {
+            this.scrollObserver.disconnect();
+            this.scrollObserver = null;
+        }
+        this.messageList = null;
+        this.entries = [];
+        this.windowStart = 0;
+        this.windowEnd = 0;
     }
 
     finalizeStreamMessage() {
-        this.currentAssistantMessage = null;
+        this.flushStreamText();
+        const entry = this.currentStreamEntry;
+        if (entry) {
+            entry.streaming = false;
+            if (entry.md) {
+                entry.md.finish();
+            }
+        }
+        this.currentStreamEntry = null;
+    }
+
+    // ===== 虚拟滚动：只挂载可见区域附近的消息，其余保存在 entries 数组中 =====
+
+    setupScrollback() {
+        this.topSentinel = document.createElement('div');
+        this.topSentinel.className = 'scrollback-sentinel';
+        this.messageList = document.createElement('div');
+        this.messageList.className = 'message-list';
+        this.bottomSentinel = document.createElement('div');
+        this.bottomSentinel.className = 'scrollback-sentinel';
+        this.bottomSentinel.addEventListener('click', () => this.jumpToLatest());
+
+        this.terminalContent.appendChild(this.topSentinel);
+        this.terminalContent.appendChild(this.messageList);
+        this.terminalContent.appendChild(this.bottomSentinel);
+
+        // 哨兵进入可视区域（含预加载边距）时挂载更早/更新的消息
+        this.scrollObserver = new IntersectionObserver((observed) => {
+            observed.forEach(item => {
+                if (!item.isIntersecting) {
+                    return;
+                }
+                if (item.target === this.topSentinel) {
+                    this.loadOlder();
+                } else if (item.target === this.bottomSentinel) {
+                    this.loadNewer();
+                }
+            });
+        }, { root: this.terminalContainer, rootMargin: '400px 0px' });
+        this.scrollObserver.observe(this.topSentinel);
+        this.scrollObserver.observe(this.bottomSentinel);
+        this.updateSentinels();
+    }
+
+    ensureScrollback() {
+        // 终端内容被替换（例如初始化提示）后重新建立消息列表，已有记录保留为未挂载状态
+        if (!this.messageList || !this.messageList.isConnected) {
+            const entries = this.entries;
+            const streamEntry = this.currentStreamEntry;
+            const pendingText = this.pendingStreamText;
+            const agentPanes = this.agentPanes;
+            this.resetRenderState();
+            entries.forEach(entry => this.unmountEntry(entry));
+            this.entries = entries;
+            this.windowStart = entries.length;
+            this.windowEnd = entries.length;
+            this.currentStreamEntry = streamEntry;
+            this.pendingStreamText = pendingText;
+            this.agentPanes = agentPanes;
+            this.setupScrollback();
+        }
+    }
+
+    isFollowingTail() {
+        return this.windowEnd === this.entries.length;
+    }
+
+    addEntry(entry) {
+        this.ensureScrollback();
+        this.entries.push(entry);
+        if (this.windowEnd === this.entries.length - 1) {
+            this.messageList.appendChild(this.renderEntry(entry));
+            this.windowEnd++;
+            this.trimTop();
+        }
+        this.updateSentinels();
+    }
+
+    renderEntry(entry) {
+        if (entry.type === 'agent') {
+            return this.createAgentElement(entry);
+        }
+
+        const messageElement = document.createElement('div');
+        messageElement.className = `message ${entry.type}`;
+
+        // AI 回复按 Markdown 增量渲染，其他消息保持纯文本
+        let textElement;
+        if (entry.type === 'assistant') {
+            textElement = document.createElement('div');
+            textElement.className = 'message-text markdown';
+            entry.md = new StreamingMarkdown(textElement);
+            entry.md.feed(entry.text);
+            if (!entry.streaming) {
+                entry.md.finish();
+            }
+        } else {
+            textElement = document.createElement('span');
+            textElement.className = 'message-text';
+            textElement.textContent = entry.text;
+        }
+        messageElement.appendChild(textElement);
+
+        if (entry.files) {
+            messageElement.appendChild(this.createFilesElement(entry));
+        }
+
+        // 添加详细信息
+        if (entry.details) {
+            messageElement.appendChild(this.createDetailsElement(entry.type, entry.details));
+        }
+
+        entry.el = messageElement;
+        entry.textEl = textElement;
+        return messageElement;
+    }
+
+    unmountEntry(entry) {
+        if (entry.el) {
+            entry.el.remove();
+        }
+        entry.el = null;
+        entry.textEl = null;
+        entry.md = null;
+        if (entry.bodyEl) {
+            entry.bodyEl = null;
+        }
+    }
+
+    trimTop() {
+        // 移除顶部的消息时补偿滚动位置，避免视图跳动
+        const container = this.terminalContainer;
+        const before = container.scrollHeight;
+        let removed = false;
+        while (this.windowEnd - this.windowStart > this.maxDomMessages) {
+            this.unmountEntry(this.entries[this.windowStart++]);
+            removed = true;
+        }
+        if (removed && !this.isNearBottom()) {
+            container.scrollTo({ top: container.scrollTop - (before - container.scrollHeight), behavior: 'instant' });
+        }
+    }
+
+    trimBottom() {
+        while (this.windowEnd - this.windowStart > this.maxDomMessages) {
+            this.unmountEntry(this.entries[--this.windowEnd]);
+        }
+    }
+
+    loadOlder() {
+        if (this.windowStart === 0) {
+            return;
+        }
+        const container = this.terminalContainer;
+        const before = container.scrollHeight;
+        const start = Math.max(0, this.windowStart - this.scrollbackBatch);
+        const fragment = document.createDocumentFragment();
+        for (let i = start; i < this.windowStart; i++) {
+            fragment.appendChild(this.renderEntry(this.entries[i]));
+        }
+        this.messageList.insertBefore(fragment, this.messageList.firstChild);
+        this.windowStart = start;
+
+        // 在顶部插入内容后保持当前可见内容不动
+        container.scrollTo({ top: container.scrollTop + (container.scrollHeight - before), behavior: 'instant' });
+        this.trimBottom();
+        this.updateSentinels();
+    }
+
+    loadNewer() {
+        if (this.isFollowingTail()) {
+            return;
+        }
+        const end = Math.min(this.entries.length, this.windowEnd + this.scrollbackBatch);
+        const fragment = document.createDocumentFragment();
+        for (let i = this.windowEnd; i < end; i++) {
+            fragment.appendChild(this.renderEntry(this.entries[i]));
+        }
+        this.messageList.appendChild(fragment);
+        this.windowEnd = end;
+        this.trimTop();
+        this.updateSentinels();
+    }
+
+    jumpToLatest() {
+        for (let i = this.windowStart; i < this.windowEnd; i++) {
+            this.unmountEntry(this.entries[i]);
+        }
+        this.windowEnd = this.entries.length;
+        this.windowStart = Math.max(0, this.windowEnd - this.maxDomMessages);
+        const fragment = document.createDocumentFragment();
+        for (let i = this.windowStart; i < this.windowEnd; i++) {
+            fragment.appendChild(this.renderEntry(this.entries[i]));
+        }
+        this.messageList.appendChild(fragment);
+        this.updateSentinels();
+        this.requestScroll(true);
+    }
+
+    updateSentinels() {
+        const older = this.windowStart;
+        const newer = this.entries.length - this.windowEnd;
+        this.topSentinel.textContent = older > 0 ? `↑ ${older} 条更早的消息` : '';
+        this.bottomSentinel.textContent = newer > 0 ? `↓ ${newer} 条新消息（点击跳转到最新）` : '';
+        this.topSentinel.classList.toggle('active', older > 0);
+        this.bottomSentinel.classList.toggle('active', newer > 0);
     }
 
     showWelcomeMessage() {
@@ -477,7 +1470,9 @@ class Terminal {
                 <p>Type your message and press Enter to send</p>
             </div>
         `;
+        this.resetRenderState();
         this.terminalContent.innerHTML = welcomeHtml;
+        this.setupScrollback();
     }
 
     updateConnectionStatus(status) {
@@ -504,9 +1499,34 @@ class Terminal {
         this.updateInputState();
     }
 
+    holdInput(retryAfter) {
+        // 被限流时在 retry_after 秒内禁用发送按钮并显示倒计时
+        this.retryAt = Date.now() + retryAfter * 1000;
+        clearInterval(this.retryTimer);
+        this.retryTimer = setInterval(() => {
+            if (Date.now() >= this.retryAt) {
+                clearInterval(this.retryTimer);
+                this.retryTimer = null;
+                this.retryAt = 0;
+            }
+            this.updateSendButton();
+        }, 250);
+    }
+
+    updateSendButton() {
+        const waiting = this.retryAt > Date.now();
+        this.sendButton.disabled = !this.isConnected || this.isProcessing || waiting;
+        if (!this.sendButtonLabel) {
+            this.sendButtonLabel = this.sendButton.textContent;
+        }
+        this.sendButton.textContent = waiting
+            ? `${Math.ceil((this.retryAt - Date.now()) / 1000)}s`
+            : this.sendButtonLabel;
+    }
+
     updateInputState() {
         this.messageInput.disabled = !this.isConnected || this.isProcessing;
-        this.sendButton.disabled = !this.isConnected || this.isProcessing;
+        this.updateSendButton();
 
         if (this.isConnected && !this.isProcessing) {
             this.messageInput.focus();
@@ -530,7 +1550,7 @@ class Terminal {
             <span class="processing-text">正在处理...</span>
         `;
         this.terminalContent.appendChild(indicator);
-        this.scrollToBottom();
+        this.requestScroll(true);
     }
 
     hideProcessingIndicator() {
@@ -0,0 +1,152 @@
+"""
+静态资源模块
+启动时为静态文件生成内容哈希文件名，并预压缩 gzip / brotli 版本，以长期缓存头提供服务
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Optional
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli  # 可选依赖，未安装时只提供 gzip 版本
+except ImportError:
+    brotli = None
+
+# 值得压缩的文本类型
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+
+# 带哈希文件名的资源永不变化，可以被浏览器永久缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class Asset:
+    """单个静态资源及其预压缩版本"""
+
+    __slots__ = ("path", "hashed_path", "media_type", "etag", "variants")
+
+    def __init__(self, path: str, hashed_path: str, media_type: str, etag: str, variants: dict[str, bytes]):
+        self.path = path
+        self.hashed_path = hashed_path
+        self.media_type = media_type
+        self.etag = etag
+        self.variants = variants  # 编码 -> 内容（"identity"、"gzip"、"br"）
+
+    def negotiate(self, accept_encoding: str) -> tuple[str, bytes]:
+        """
+        根据 Accept-Encoding 选择最合适的版本
+
+        Args:
+            accept_encoding: 请求头 Accept-Encoding 的值
+
+        Returns:
+            tuple[str, bytes]: (编码, 内容)
+        """
+        accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+
+class AssetManifest:
+    """资源清单 - 原始路径到带哈希路径的映射"""
+
+    def __init__(self, source_dir: str = "static", url_prefix: str = "/assets"):
+        self.source_dir = source_dir
+        self.url_prefix = url_prefix
+        self._by_path: dict[str, Asset] = {}
+        self._by_hashed_path: dict[str, Asset] = {}
+        self.built = False
+        self.version = 0
+
+    def build(self) -> None:
+        """
+        扫描静态目录，计算哈希并预压缩（同步，启动时在线程中调用）
+        """
+        by_path = {}
+        by_hashed_path = {}
+        for root, _, files in os.walk(self.source_dir):
+            for name in sorted(files):
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, self.source_dir).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    content = f.read()
+                asset = self._make_asset(rel_path, content)
+                by_path[rel_path] = asset
+                by_hashed_path[asset.hashed_path] = asset
+
+        self._by_path = by_path
+        self._by_hashed_path = by_hashed_path
+        self.built = True
+        self.version += 1
+        logger.info(f"Built static asset manifest: {len(by_path)} files, brotli {'enabled' if brotli else 'unavailable'}")
+
+    def _make_asset(self, rel_path: str, content: bytes) -> Asset:
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        stem, ext = os.path.splitext(rel_path)
+        hashed_path = f"{stem}.{digest}{ext}"
+        media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+
+        variants = {"identity": content}
+        if media_type.startswith(COMPRESSIBLE_TYPES) and len(content) >= config.STATIC_COMPRESS_MIN_SIZE:
+            # mtime=0 保证相同内容生成相同的压缩结果
+            gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(gzipped) < len(content):
+                variants["gzip"] = gzipped
+            if brotli is not None:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    variants["br"] = compressed
+
+        return Asset(rel_path, hashed_path, media_type, f'"{digest}"', variants)
+
+    def url(self, path: str) -> str:
+        """
+        获取资源的 URL（模板中使用）
+
+        Args:
+            path: 相对于静态目录的路径，如 "js/terminal.js"
+
+        Returns:
+            带哈希的 URL；清单未构建或资源不存在时回退到 /static 路径
+        """
+        asset = self._by_path.get(path)
+        if asset is None:
+            return f"/static/{path}"
+        return f"{self.url_prefix}/{asset.hashed_path}"
+
+    def get(self, hashed_path: str) -> Optional[Asset]:
+        """
+        按带哈希的路径查找资源
+
+        Args:
+            hashed_path: 带哈希的相对路径
+
+        Returns:
+            Asset，不存在时返回 None
+        """
+        return self._by_hashed_path.get(hashed_path)
+
+    def manifest(self) -> dict[str, str]:
+        """
+        获取清单映射
+
+        Returns:
+            dict[str, str]: 原始路径 -> 带哈希路径
+        """
+        return {path: asset.hashed_path for path, asset in self._by_path.items()}
+
+
+# 全局资源清单实例
+asset_manifest = AssetManifest()
@@ -0,0 +1,261 @@
+"""
+iFlow 消息流录制与回放模块
+把 IFlowSession.send_message 收到的 SDK 消息及其时间间隔录制成紧凑的 JSONL 文件，
+并提供可替代 IFlowClient 的回放客户端，按原速、倍速或最快速度重放，用于离线基准测试和回归测试
+"""
+
+import asyncio
+import dataclasses
+import enum
+import gzip
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Optional
+from iflow_sdk import types as sdk_types
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRACE_FORMAT = "iflow-trace"
+TRACE_VERSION = 1
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def encode_message(value: Any) -> Any:
+    """
+    把 SDK 消息（dataclass、枚举及其嵌套结构）编码为 JSON 兼容的值
+
+    Args:
+        value: SDK 消息或字段值
+
+    Returns:
+        Any: 可直接 json.dumps 的值，dataclass 记录为 {"_t": 类名, ...}，枚举记录为 {"_e": 类名, "v": 值}
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        encoded = {"_t": type(value).__name__}
+        for field in dataclasses.fields(value):
+            item = getattr(value, field.name, None)
+            if item is not None:  # 省略空字段，保持文件紧凑
+                encoded[field.name] = encode_message(item)
+        return encoded
+    if isinstance(value, enum.Enum):
+        return {"_e": type(value).__name__, "v": value.value}
+    if isinstance(value, dict):
+        return {key: encode_message(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_message(item) for item in value]
+    if isinstance(value, Path):
+        return str(value)
+    return value
+
+
+def decode_message(value: Any) -> Any:
+    """
+    把 encode_message 的结果还原为 SDK 对象
+
+    Args:
+        value: 编码后的值
+
+    Returns:
+        Any: SDK 消息或字段值
+
+    Raises:
+        ValueError: 记录的类型在当前 SDK 中不存在
+    """
+    if isinstance(value, list):
+        return [decode_message(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "_e" in value:
+        return _sdk_class(value["_e"])(value["v"])
+    if "_t" in value:
+        cls = _sdk_class(value["_t"])
+        # SDK 消息的 __init__ 会自行设置 type 等字段，这里绕过构造函数直接还原所有字段
+        obj = cls.__new__(cls)
+        for field in dataclasses.fields(cls):
+            setattr(obj, field.name, decode_message(value.get(field.name)))
+        return obj
+    return {key: decode_message(item) for key, item in value.items()}
+
+
+def _sdk_class(name: str) -> type:
+    cls = getattr(sdk_types, name, None)
+    if not isinstance(cls, type):
+        raise ValueError(f"Unknown SDK type in trace: {name}")
+    return cls
+
+
+def _open(path: str, mode: str):
+    """.gz 结尾的文件使用 gzip 压缩"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Trace:
+    """
+    一轮对话的消息流：header 记录元数据，events 为 (距上一条消息的秒数, SDK 消息) 列表
+
+    文件格式为 JSONL：第一行是 header，之后每行一条 [间隔毫秒, 编码后的消息]，
+    第一条消息的间隔从发送提示词开始计算
+    """
+
+    def __init__(self, header: dict = None, events: list[tuple[float, Any]] = None):
+        self.header = header or {}
+        self.events = events or []
+
+    @property
+    def duration(self) -> float:
+        """原始总时长（秒）"""
+        return sum(delay for delay, _ in self.events)
+
+    def save(self, path: str) -> None:
+        """
+        写入文件（同步，在线程中调用）
+
+        Args:
+            path: 文件路径，.gz 结尾时压缩
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        header = {"format": TRACE_FORMAT, "version": TRACE_VERSION, **self.header}
+        with _open(path, "w") as f:
+            f.write(json.dumps(header, ensure_ascii=False, separators=(",", ":")) + "\n")
+            for delay, msg in self.events:
+                line = [round(delay * 1000, 3), encode_message(msg)]
+                f.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    @classmethod
+    def load(cls, path: str) -> "Trace":
+        """
+        读取文件（同步）
+
+        Args:
+            path: 文件路径
+
+        Returns:
+            Trace: 消息流
+
+        Raises:
+            ValueError: 文件格式或版本不受支持
+        """
+        with _open(path, "r") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != TRACE_FORMAT or header.get("version") != TRACE_VERSION:
+                raise ValueError(f"Unsupported trace file: {path}")
+            events = []
+            for line in f:
+                if line.strip():
+                    delay_ms, msg = json.loads(line)
+                    events.append((delay_ms / 1000, decode_message(msg)))
+        return cls(header, events)
+
+
+class TraceRecorder:
+    """录制一轮对话中收到的 SDK 消息和时间间隔"""
+
+    def __init__(self, session_id: str, prompt: str, model: str = None):
+        self.trace = Trace({
+            "session_id": session_id,
+            "model": model,
+            "prompt_chars": len(prompt),
+            "recorded_at": time.time(),
+        })
+        self._last = time.perf_counter()
+
+    def record(self, msg: Any) -> None:
+        """
+        记录一条消息
+
+        Args:
+            msg: SDK 消息
+        """
+        now = time.perf_counter()
+        self.trace.events.append((now - self._last, msg))
+        self._last = now
+
+    async def save(self, directory: str = None) -> Optional[str]:
+        """
+        保存到录制目录，文件名为 <会话 ID>-<时间戳>.jsonl.gz
+
+        Args:
+            directory: 目录，默认使用 TRACE_DIR
+
+        Returns:
+            str: 文件路径，没有消息时不保存并返回 None
+        """
+        if not self.trace.events:
+            return None
+        directory = directory or config.TRACE_DIR
+        name = _SAFE_NAME.sub("_", str(self.trace.header.get("session_id") or "session"))
+        path = os.path.join(directory, f"{name}-{int(self.trace.header['recorded_at'] * 1000)}.jsonl.gz")
+        try:
+            await asyncio.to_thread(self.trace.save, path)
+        except OSError as e:
+            logger.warning(f"Failed to save stream trace {path}: {e}")
+            return None
+        logger.debug(f"Saved stream trace with {len(self.trace.events)} messages to {path}")
+        return path
+
+
+class ReplayClient:
+    """
+    回放录制的消息流，接口与 IFlowClient 一致（每次 send_message 后从头回放一遍）
+
+    Args:
+        trace: 消息流
+        speed: 回放倍速，1 为原速，0 表示不等待（最快速度）
+    """
+
+    def __init__(self, trace: Trace, speed: float = 1.0):
+        self.trace = trace
+        self.speed = speed
+        self.prompts: list[str] = []
+        self._connected = False
+        self._pending = False
+
+    async def __aenter__(self) -> "ReplayClient":
+        self._connected = True
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._connected = False
+
+    async def send_message(self, prompt: str) -> None:
+        self.prompts.append(prompt)
+        self._pending = True
+
+    async def interrupt(self) -> None:
+        self._pending = False
+
+    async def receive_messages(self) -> AsyncGenerator[Any, None]:
+        if not self._pending:
+            return
+        self._pending = False
+        for delay, msg in self.trace.events:
+            if self.speed > 0 and delay > 0:
+                await asyncio.sleep(delay / self.speed)
+            yield msg
+
+
+def replay_client_factory(path: str, speed: float = 1.0) -> Callable[..., ReplayClient]:
+    """
+    创建可替代 IFlowClient 类的工厂（忽略 IFlowOptions），用于离线基准测试和测试
+
+    Args:
+        path: 录制文件路径
+        speed: 回放倍速，0 表示最快速度
+
+    Returns:
+        Callable: factory(options) -> ReplayClient
+    """
+    trace = Trace.load(path)
+
+    def factory(options=None) -> ReplayClient:
+        return ReplayClient(trace, speed)
+
+    return factory
@@ -11,6 +11,39 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+@pytest.fixture(autouse=True)
+def isolated_transcripts(tmp_path, monkeypatch):
+    """
+    对话记录写入临时目录，避免测试写入用户目录
+    """
+    from transcript_store import transcript_store
+    monkeypatch.setattr(transcript_store, "base_dir", str(tmp_path / "transcripts"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_search_index(tmp_path, monkeypatch):
+    """
+    搜索索引写入临时数据库
+    """
+    from search_index import search_index
+    search_index.close()
+    monkeypatch.setattr(search_index, "path", str(tmp_path / "search.db"))
+    monkeypatch.setattr(search_index, "_pending", [])
+    monkeypatch.setattr(search_index, "_flush_task", None)
+    monkeypatch.setattr(search_index, "_flush_handle", None)
+    yield search_index
+    search_index.close()
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """
+    每个测试使用空的令牌桶，避免测试之间互相消耗限额
+    """
+    from rate_limiter import rate_limiter
+    rate_limiter.reset()
+
+
 @pytest.fixture
 def temp_working_dir(tmp_path):
     """
@@ -42,4 +75,27 @@ def sample_message_data():
     return {
         "type": "user_message",
         "content": "Hello, iFlow!",
-    }
\ No newline at end of file
+    }
+
+
+@pytest.fixture(autouse=True)
+def isolated_usage(tmp_path, monkeypatch):
+    """
+    用量统计从零开始并写入临时文件
+    """
+    from usage_stats import usage_tracker
+    monkeypatch.setattr(usage_tracker, "path", str(tmp_path / "usage.json"))
+    usage_tracker.reset()
+    yield usage_tracker
+    usage_tracker.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_model_performance():
+    """
+    每个测试从空的模型性能样本开始
+    """
+    from model_stats import model_performance
+    model_performance.reset()
+    yield model_performance
+    model_performance.reset()
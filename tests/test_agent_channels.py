@@ -0,0 +1,103 @@
+"""
+agent_channels.py 单元测试
+"""
+
+from agent_channels import AgentRouter
+
+
+def sub_frame(content: str, agent_id: str = "sub-1", frame_type: str = "assistant") -> dict:
+    return {"type": frame_type, "content": content, "agent_id": agent_id, "agent_info": {"agent_index": 0}, "is_stream": True}
+
+
+class TestAgentRouter:
+    """AgentRouter 类测试"""
+
+    def test_legacy_passthrough(self):
+        """测试未启用按需发送时所有帧原样发送"""
+        router = AgentRouter(on_demand=False)
+        frame = sub_frame("a")
+
+        assert router.route(frame) == [frame]
+
+    def test_main_agent_frames(self):
+        """测试主 Agent 的帧直接发送"""
+        router = AgentRouter(on_demand=True)
+        frame = {"type": "assistant", "content": "hi", "is_stream": True}
+
+        assert router.route(frame) == [frame]
+
+    def test_unsubscribed_agent_is_buffered(self):
+        """测试未订阅的子 Agent 只发送状态帧，输出在服务端缓冲"""
+        router = AgentRouter(on_demand=True, status_interval=3600)
+
+        first = router.route(sub_frame("a"))
+        assert [f["type"] for f in first] == ["agent"]
+        assert first[0]["event"] == "started"
+        assert first[0]["subscribed"] is False
+        assert router.route(sub_frame("b")) == []
+        assert router.route(sub_frame("Tool: read", frame_type="tool")) == []
+
+        backlog = router.subscribe("sub-1")
+        assert len(backlog) == 1
+        # 相邻的文本分块合并为一帧
+        assert [(f["type"], f["content"]) for f in backlog[0]["frames"]] == [("assistant", "ab"), ("tool", "Tool: read")]
+        # 订阅后直接发送
+        live = sub_frame("c")
+        assert router.route(live) == [live]
+
+    def test_activity_status(self):
+        """测试按间隔发送待发送帧数"""
+        router = AgentRouter(on_demand=True, status_interval=0)
+        router.route(sub_frame("a"))
+
+        status = router.route(sub_frame("b"))
+
+        assert status[0]["event"] == "activity"
+        assert status[0]["pending"] == 1
+
+    def test_buffer_limit(self):
+        """测试超出缓冲上限时丢弃最早的帧并报告丢弃数"""
+        router = AgentRouter(on_demand=True, max_chars=12, status_interval=3600)
+        for index in range(5):
+            router.route(sub_frame(f"tool-{index}", frame_type="tool"))
+
+        backlog = router.subscribe("sub-1")[0]
+
+        assert [f["content"] for f in backlog["frames"]] == ["tool-3", "tool-4"]
+        assert backlog["dropped"] == 3
+
+    def test_buffered_frames_are_copies(self):
+        """测试合并不会修改原帧（原帧可能被响应缓存记录）"""
+        router = AgentRouter(on_demand=True, status_interval=3600)
+        first = sub_frame("a")
+        router.route(first)
+        router.route(sub_frame("b"))
+
+        assert first["content"] == "a"
+
+    def test_unsubscribe_and_finish(self):
+        """测试折叠后重新缓冲，结束帧前报告各子 Agent 的状态"""
+        router = AgentRouter(on_demand=True, status_interval=3600)
+        router.route(sub_frame("a"))
+        router.subscribe("sub-1")
+        router.unsubscribe("sub-1")
+        assert router.route(sub_frame("b")) == []
+
+        finish = {"type": "finish", "content": "Task finished"}
+        frames = router.route(finish)
+
+        assert frames[-1] is finish
+        assert frames[0]["event"] == "finished"
+        assert frames[0]["pending"] == 1
+
+    def test_subscribe_before_start_and_new_turn(self):
+        """测试提前订阅的子 Agent 出现后直接发送，新一轮清空通道和订阅"""
+        router = AgentRouter(on_demand=True)
+        assert router.subscribe("sub-1") == []
+        frames = router.route(sub_frame("a"))
+        assert frames[0]["subscribed"] is True
+        assert frames[1]["content"] == "a"
+
+        router.begin_turn()
+        assert router.channels == {}
+        assert router.route(sub_frame("b"))[0]["subscribed"] is False
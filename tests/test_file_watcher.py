@@ -0,0 +1,197 @@
+"""
+file_watcher.py 单元测试
+"""
+
+import asyncio
+import shutil
+import subprocess
+import pytest
+from unittest.mock import AsyncMock, patch
+from file_watcher import (
+    ChangeSet,
+    FileWatchRegistry,
+    WorkingTreeWatcher,
+    diff_snapshots,
+    file_diff,
+    resolve_in_root,
+    snapshot_tree,
+)
+
+
+@pytest.fixture
+def watch_config():
+    """
+    提供较短的监听间隔
+    """
+    with patch('file_watcher.config') as mock_config:
+        mock_config.FILE_WATCH_ENABLED = True
+        mock_config.FILE_WATCH_FORCE_POLLING = False
+        mock_config.FILE_WATCH_DEBOUNCE_MS = 50
+        mock_config.FILE_WATCH_POLL_INTERVAL = 0.05
+        mock_config.FILE_WATCH_MAX_SCAN = 1000
+        mock_config.FILE_WATCH_MAX_FILES = 2
+        mock_config.FILE_DIFF_MAX_BYTES = 10000
+        yield mock_config
+
+
+async def wait_for_frame(notify, timeout=5.0):
+    """等待监听器推送消息"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not notify.await_count:
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("no files_changed frame received")
+        await asyncio.sleep(0.02)
+    return notify.await_args.args[1]
+
+
+class TestChangeSet:
+    """ChangeSet 类测试"""
+
+    def test_added_then_modified_stays_added(self):
+        """测试新建后修改仍记为新建"""
+        changes = ChangeSet()
+        changes.add("a.py", "added")
+        changes.add("a.py", "modified")
+
+        assert changes.drain() == {"a.py": "added"}
+
+    def test_added_then_deleted_cancels(self):
+        """测试新建后删除相互抵消"""
+        changes = ChangeSet()
+        changes.add("a.py", "added")
+        changes.add("a.py", "deleted")
+
+        assert changes.drain() == {}
+
+    def test_deleted_then_added_is_modified(self):
+        """测试删除后重建记为修改"""
+        changes = ChangeSet()
+        changes.add("a.py", "deleted")
+        changes.add("a.py", "added")
+
+        assert changes.drain() == {"a.py": "modified"}
+
+
+class TestSnapshots:
+    """目录扫描测试"""
+
+    def test_snapshot_skips_ignored_dirs(self, tmp_path):
+        """测试跳过 .git、node_modules 等目录"""
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src" / "main.py").write_text("x")
+        (tmp_path / "node_modules").mkdir()
+        (tmp_path / "node_modules" / "lib.js").write_text("x")
+
+        assert list(snapshot_tree(str(tmp_path), max_files=100)) == ["src/main.py"]
+
+    def test_diff_snapshots(self):
+        """测试比较两次扫描结果"""
+        old = {"a": (1, 1), "b": (1, 1)}
+        new = {"a": (2, 1), "c": (1, 1)}
+
+        assert sorted(diff_snapshots(old, new)) == [("a", "modified"), ("b", "deleted"), ("c", "added")]
+
+
+class TestWorkingTreeWatcher:
+    """WorkingTreeWatcher 类测试"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("force_polling", [True, False])
+    async def test_pushes_changes(self, watch_config, tmp_path, force_polling):
+        """测试文件变更被合并推送"""
+        (tmp_path / "old.txt").write_text("x")
+        notify = AsyncMock()
+        watcher = WorkingTreeWatcher("s1", str(tmp_path), notify, force_polling=force_polling)
+        watcher.start()
+        await asyncio.sleep(0.3)
+
+        (tmp_path / "new.txt").write_text("hello")
+        frame = await wait_for_frame(notify)
+        await watcher.stop()
+
+        assert frame["type"] == "files_changed"
+        assert {"path": "new.txt", "change": "added"} in frame["files"]
+        assert watcher.mode == ("polling" if force_polling else "native")
+
+    @pytest.mark.asyncio
+    async def test_truncates_large_change_sets(self, watch_config, tmp_path):
+        """测试变更文件过多时截断列表"""
+        notify = AsyncMock()
+        watcher = WorkingTreeWatcher("s1", str(tmp_path), notify, force_polling=True)
+        for name in ("a", "b", "c"):
+            watcher._changes.add(name, "added")
+
+        await watcher._emit()
+
+        frame = notify.await_args.args[1]
+        assert len(frame["files"]) == 2
+        assert frame["total"] == 3
+        assert frame["truncated"] is True
+
+
+class TestFileWatchRegistry:
+    """FileWatchRegistry 类测试"""
+
+    @pytest.mark.asyncio
+    async def test_reference_counting(self, watch_config, tmp_path):
+        """测试最后一个连接断开时才停止监听"""
+        watch_config.FILE_WATCH_FORCE_POLLING = True
+        registry = FileWatchRegistry()
+        registry.acquire("s1", str(tmp_path), AsyncMock())
+        registry.acquire("s1", str(tmp_path), AsyncMock())
+        assert registry.count == 1
+
+        await registry.release("s1")
+        assert registry.count == 1
+
+        await registry.release("s1")
+        assert registry.count == 0
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, watch_config, tmp_path):
+        """测试关闭后不启动监听"""
+        watch_config.FILE_WATCH_ENABLED = False
+        registry = FileWatchRegistry()
+        registry.acquire("s1", str(tmp_path), AsyncMock())
+
+        assert registry.count == 0
+
+
+class TestFileDiff:
+    """文件差异测试"""
+
+    def test_rejects_escape(self, tmp_path):
+        """测试拒绝工作目录之外的路径"""
+        with pytest.raises(ValueError):
+            resolve_in_root(str(tmp_path), "../outside.txt")
+
+    @pytest.mark.asyncio
+    async def test_untracked_file_shown_as_added(self, watch_config, tmp_path):
+        """测试没有 git 基线时显示文件内容"""
+        (tmp_path / "notes.txt").write_text("line1\nline2\n")
+
+        result = await file_diff(str(tmp_path), "notes.txt")
+
+        assert "+line1" in result["diff"]
+        assert result["binary"] is False
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+    async def test_git_diff(self, watch_config, tmp_path):
+        """测试已跟踪文件显示相对于 HEAD 的差异"""
+        def git(*args):
+            subprocess.run(["git", *args], cwd=tmp_path, check=True, capture_output=True)
+
+        git("init", "-q")
+        (tmp_path / "app.py").write_text("print('a')\n")
+        (tmp_path / "same.py").write_text("x = 1\n")
+        git("add", ".")
+        git("-c", "user.email=t@example.com", "-c", "user.name=t", "commit", "-qm", "init")
+        (tmp_path / "app.py").write_text("print('b')\n")
+
+        changed = await file_diff(str(tmp_path), "app.py")
+        unchanged = await file_diff(str(tmp_path), "same.py")
+
+        assert "-print('a')" in changed["diff"]
+        assert "+print('b')" in changed["diff"]
+        assert unchanged["diff"] == ""
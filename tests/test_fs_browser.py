@@ -0,0 +1,189 @@
+"""
+fs_browser.py 单元测试
+"""
+
+import os
+import pytest
+from unittest.mock import patch
+from fs_browser import PathTrie, DirectoryIndex, normalize_path
+
+
+@pytest.fixture
+def directory_index():
+    """
+    创建目录索引实例
+    """
+    return DirectoryIndex(max_dirs=2, ttl=60.0)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """
+    创建示例目录树
+    """
+    (tmp_path / "alpha").mkdir()
+    (tmp_path / "alpine").mkdir()
+    (tmp_path / "beta").mkdir()
+    (tmp_path / "notes.txt").write_text("x")
+    return tmp_path
+
+
+class TestPathTrie:
+    """PathTrie 类测试"""
+
+    def test_contains_exact_and_children(self, tmp_path):
+        """测试目录本身及子目录被允许"""
+        trie = PathTrie([str(tmp_path / "project")])
+
+        assert trie.contains(str(tmp_path / "project")) is True
+        assert trie.contains(str(tmp_path / "project" / "src")) is True
+
+    def test_rejects_sibling_with_same_prefix(self, tmp_path):
+        """测试不允许同名前缀的兄弟目录"""
+        trie = PathTrie([str(tmp_path / "project")])
+
+        assert trie.contains(str(tmp_path / "project2")) is False
+        assert trie.contains(str(tmp_path)) is False
+
+    def test_is_ancestor(self, tmp_path):
+        """测试识别白名单目录的上级目录"""
+        trie = PathTrie([str(tmp_path / "project")])
+
+        assert trie.is_ancestor(str(tmp_path)) is True
+        assert trie.is_ancestor(str(tmp_path / "project")) is False
+        assert trie.is_ancestor(str(tmp_path / "project" / "src")) is False
+        assert trie.is_ancestor(str(tmp_path / "other")) is False
+
+    def test_rejects_dotdot_escape(self, tmp_path):
+        """测试 .. 路径逃逸在规范化后被拒绝"""
+        trie = PathTrie([str(tmp_path / "project")])
+
+        assert trie.contains(str(tmp_path / "project" / ".." / "other")) is False
+
+    def test_symlink_resolved(self, tmp_path):
+        """测试符号链接解析后再检查"""
+        (tmp_path / "outside").mkdir()
+        (tmp_path / "project").mkdir()
+        link = tmp_path / "project" / "link"
+        try:
+            os.symlink(tmp_path / "outside", link)
+        except (OSError, NotImplementedError):
+            pytest.skip("symlinks not supported")
+        trie = PathTrie([str(tmp_path / "project")])
+
+        assert trie.contains(str(link)) is False
+
+
+class TestDirectoryIndex:
+    """DirectoryIndex 类测试"""
+
+    def test_list_dir_sorted_dirs_first(self, directory_index, tree):
+        """测试目录优先排序"""
+        entries = directory_index.list_dir(str(tree))
+
+        assert entries[0] == ("alpha", True)
+        assert entries[-1] == ("notes.txt", False)
+
+    def test_list_dir_cached(self, directory_index, tree):
+        """测试缓存未过期时不重复扫描"""
+        directory_index.list_dir(str(tree))
+        directory_index.list_dir(str(tree))
+
+        assert directory_index.scans == 1
+
+    def test_list_dir_rescans_on_mtime_change(self, tree):
+        """测试缓存过期且目录变化时重新扫描"""
+        index = DirectoryIndex(ttl=0.0)
+        index.list_dir(str(tree))
+        index.list_dir(str(tree))
+        assert index.scans == 1
+
+        (tree / "gamma").mkdir()
+        os.utime(tree, ns=(0, os.stat(tree).st_mtime_ns + 1_000_000_000))
+        entries = index.list_dir(str(tree))
+
+        assert index.scans == 2
+        assert ("gamma", True) in entries
+
+    def test_lru_bound(self, directory_index, tree):
+        """测试缓存目录数上限"""
+        directory_index.list_dir(str(tree / "alpha"))
+        directory_index.list_dir(str(tree / "beta"))
+        directory_index.list_dir(str(tree))
+
+        assert len(directory_index._dirs) == 2
+
+    def test_concurrent_list_dir(self, tree):
+        """测试多个线程同时读取并淘汰缓存时不出错"""
+        from concurrent.futures import ThreadPoolExecutor
+        index = DirectoryIndex(max_dirs=1, ttl=0.0)
+        paths = [str(tree / name) for name in ("alpha", "alpine", "beta")] * 200
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(index.list_dir, paths))
+
+        assert len(results) == len(paths)
+        assert len(index._dirs) == 1
+
+    @pytest.mark.asyncio
+    async def test_async_checks(self, directory_index, tree):
+        """测试在线程中执行的白名单和目录检查"""
+        assert await directory_index.is_allowed_async(str(tree / "alpha")) is True
+        assert await directory_index.is_dir_async(str(tree / "alpha")) is True
+        assert await directory_index.is_dir_async(str(tree / "notes.txt")) is False
+
+    def test_browse_dirs_only(self, directory_index, tree):
+        """测试浏览只返回目录"""
+        result = directory_index.browse(str(tree))
+
+        names = [e["name"] for e in result["entries"]]
+        assert names == ["alpha", "alpine", "beta"]
+        assert result["parent"] == os.path.dirname(str(tree))
+
+    def test_complete_prefix(self, directory_index, tree):
+        """测试自动补全"""
+        suggestions = directory_index.complete(str(tree / "alp"))
+
+        assert suggestions == [
+            {"path": str(tree / "alpha"), "selectable": True},
+            {"path": str(tree / "alpine"), "selectable": True},
+        ]
+
+    def test_complete_missing_base(self, directory_index, tree):
+        """测试父目录不存在时返回空列表"""
+        assert directory_index.complete(str(tree / "missing" / "x")) == []
+
+    def test_is_dir(self, directory_index, tree):
+        """测试目录存在性检查"""
+        assert directory_index.is_dir(str(tree / "alpha")) is True
+        assert directory_index.is_dir(str(tree / "notes.txt")) is False
+        assert directory_index.is_dir(str(tree / "missing")) is False
+
+    @patch('fs_browser.config')
+    def test_whitelist(self, mock_config, directory_index, tree):
+        """测试白名单限制补全结果"""
+        mock_config.ALLOWED_WORKING_DIRS = [str(tree / "alpha")]
+
+        assert directory_index.is_allowed(str(tree / "alpha" / "sub")) is True
+        assert directory_index.is_allowed(str(tree / "beta")) is False
+        assert directory_index.complete(str(tree / "a")) == [{"path": str(tree / "alpha"), "selectable": True}]
+
+    @patch('fs_browser.config')
+    def test_complete_suggests_whitelist_ancestors(self, mock_config, directory_index, tree):
+        """测试白名单目录的上级目录作为不可选候选返回"""
+        (tree / "beta" / "project").mkdir()
+        mock_config.ALLOWED_WORKING_DIRS = [str(tree / "beta" / "project")]
+
+        assert directory_index.complete(str(tree / "b")) == [{"path": str(tree / "beta"), "selectable": False}]
+        assert directory_index.complete(str(tree / "a")) == []
+        assert directory_index.complete(str(tree / "beta" / "p")) == [
+            {"path": str(tree / "beta" / "project"), "selectable": True},
+        ]
+
+
+class TestNormalizePath:
+    """路径规范化测试"""
+
+    def test_normalize_removes_dotdot(self, tmp_path):
+        """测试规范化去除 .. 组件"""
+        assert normalize_path(str(tmp_path / "a" / "..")) == os.path.normcase(os.path.realpath(str(tmp_path)))
@@ -16,6 +16,7 @@ def iflow_manager():
     # 清理之前的状态
     IFlowManager._instance = None
     IFlowManager._sessions = {}
+    IFlowManager._models_cache = None
     return IFlowManager()
 
 
@@ -57,6 +58,18 @@ class TestIFlowSession:
 
         assert session.model is not None
 
+    def test_session_pid(self):
+        """测试获取 iFlow 进程 ID"""
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        assert session.pid is None
+
+        session._client = Mock()
+        session._client._process_manager._process = Mock(pid=4321, returncode=None)
+        assert session.pid == 4321
+
+        session._client._process_manager._process.returncode = 0
+        assert session.pid is None
+
     @pytest.mark.asyncio
     @patch('iflow_manager.os.path.isdir')
     @patch('iflow_manager.os.path.exists')
@@ -112,6 +125,32 @@ class TestIFlowSession:
         mock_client.send_message.assert_called_once_with("Hello, iFlow!")
         assert len(responses) > 0
 
+    @pytest.mark.asyncio
+    @patch('iflow_manager.os.path.isdir')
+    @patch('iflow_manager.os.path.exists')
+    @patch('iflow_manager.IFlowClient')
+    async def test_send_message_records_usage(self, mock_client_class, mock_exists, mock_isdir):
+        """测试每轮结束后用量合并到会话和模型的累计值"""
+        from usage_stats import usage_tracker
+        mock_exists.return_value = True
+        mock_isdir.return_value = True
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.send_message = AsyncMock()
+        mock_client.receive_messages = self._mock_receive_messages()
+        mock_client_class.return_value = mock_client
+
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace", model="glm-4.7")
+        for _ in range(2):
+            async for _ in session.send_message("Hello"):
+                pass
+
+        usage = usage_tracker.session_usage("test-123")
+        assert usage["turns"] == 2
+        assert usage["chars"] == 2 * len("Hello! How can I help you?")
+        assert usage["outcomes"] == {"completed": 2}
+        assert usage_tracker.models["glm-4.7"]["turns"] == 2
+
     def _mock_receive_messages(self):
         """模拟接收消息"""
         async def generator():
@@ -136,6 +175,343 @@ class TestIFlowSession:
 
         return generator
 
+    @pytest.mark.asyncio
+    @patch('iflow_manager.os.path.isdir')
+    @patch('iflow_manager.os.path.exists')
+    @patch('iflow_manager.IFlowClient')
+    async def test_hibernate_and_rehydrate(self, mock_client_class, mock_exists, mock_isdir):
+        """测试休眠后再次发送消息时重放对话上下文"""
+        mock_exists.return_value = True
+        mock_isdir.return_value = True
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.send_message = AsyncMock()
+        mock_client.receive_messages = self._mock_receive_messages()
+        mock_client_class.return_value = mock_client
+
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        async for _ in session.send_message("第一个问题"):
+            pass
+
+        assert await session.hibernate() is True
+        assert session.hibernated is True
+        assert session._client is None
+        mock_client.__aexit__.assert_awaited_once()
+
+        async for _ in session.send_message("第二个问题"):
+            pass
+
+        prompt = mock_client.send_message.await_args.args[0]
+        assert session.hibernated is False
+        assert "用户: 第一个问题" in prompt
+        assert "助手: Hello! How can I help you?" in prompt
+        assert prompt.endswith("第二个问题")
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.os.path.isdir')
+    @patch('iflow_manager.os.path.exists')
+    @patch('iflow_manager.IFlowClient')
+    async def test_native_resume_error_falls_back(self, mock_client_class, mock_exists, mock_isdir, monkeypatch):
+        """测试原生恢复抛出异常时不计入熔断器，改用新会话并重放上下文"""
+        import config
+        from iflow_manager import CircuitBreaker
+        mock_exists.return_value = True
+        mock_isdir.return_value = True
+        monkeypatch.setattr(config, "SESSION_NATIVE_RESUME", True)
+        failing = AsyncMock()
+        failing.__aenter__ = AsyncMock(side_effect=RuntimeError("loadSession failed"))
+        fresh = AsyncMock()
+        fresh.__aenter__ = AsyncMock(return_value=fresh)
+        mock_client_class.side_effect = [failing, fresh]
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        session.hibernated = True
+        session._resume_id = "iflow-session"
+        with patch('iflow_manager.spawn_breaker', breaker):
+            await session.initialize()
+
+        assert session._client is fresh
+        assert mock_client_class.call_args_list[1].args[0].session_id is None
+        assert session.hibernated is False
+        assert session._needs_replay is True
+        assert breaker.state == "closed"
+        assert breaker.failures == 0
+
+    @pytest.mark.asyncio
+    async def test_hibernate_detaches_client_before_closing(self):
+        """测试休眠时先摘下客户端再关闭，关闭期间会话已不再持有该客户端"""
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        client = AsyncMock()
+        client._session_id = "iflow-session"
+        seen = []
+        client.__aexit__ = AsyncMock(side_effect=lambda *args: seen.append((session._client, session.hibernated)))
+        session._client = client
+
+        assert await session.hibernate() is True
+        assert seen == [(None, True)]
+        assert session._resume_id == "iflow-session"
+
+    def _stalled_client(self, first_chunk=True):
+        """模拟发送一个分块后不再响应的客户端"""
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.send_message = AsyncMock()
+
+        async def generator():
+            from iflow_sdk.types import AssistantMessage
+            if first_chunk:
+                yield AssistantMessage(chunk=Mock(text="partial"))
+            await asyncio.sleep(3600)
+            yield None
+
+        mock_client.receive_messages = generator
+        return mock_client
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.config')
+    async def test_idle_timeout_aborts_turn(self, mock_config):
+        """测试分块间隔超时时取消本轮并重启客户端"""
+        from iflow_manager import stream_timeouts
+        mock_config.IFLOW_TURN_TIMEOUT = 0
+        mock_config.IFLOW_IDLE_TIMEOUT = 0.05
+        mock_config.TRANSCRIPT_ENABLED = False
+        mock_config.TRACE_RECORD_ENABLED = False
+        stream_timeouts.clear()
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        session._client = mock_client = self._stalled_client()
+
+        responses = [r async for r in session.send_message("Hello")]
+
+        assert [r["type"] for r in responses] == ["assistant", "error", "finish"]
+        assert responses[-1]["reason"] == "idle_timeout"
+        assert responses[-1]["timed_out"] is True
+        mock_client.interrupt.assert_awaited_once()
+        mock_client.__aexit__.assert_awaited_once()
+        assert session._client is None
+        assert session._needs_replay is True
+        assert session.busy is False
+        assert stream_timeouts["idle_timeout"] == 1
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.config')
+    async def test_cancelled_turn_is_aborted(self, mock_config):
+        """测试取消进行中的一轮时中断并重启客户端，未读完的消息不会被下一轮读到"""
+        mock_config.IFLOW_TURN_TIMEOUT = 0
+        mock_config.IFLOW_IDLE_TIMEOUT = 0
+        mock_config.TRANSCRIPT_ENABLED = False
+        mock_config.TRACE_RECORD_ENABLED = False
+        mock_config.USAGE_ENABLED = False
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        session._client = mock_client = self._stalled_client()
+
+        async def consume():
+            async for _ in session.send_message("Hello"):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        mock_client.interrupt.assert_awaited_once()
+        mock_client.__aexit__.assert_awaited_once()
+        assert session._client is None
+        assert session._needs_replay is True
+        assert session.busy is False
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.config')
+    async def test_closed_stream_is_aborted(self, mock_config):
+        """测试调用方提前关闭响应流时中断本轮，读完 finish 后关闭则不中断"""
+        mock_config.IFLOW_TURN_TIMEOUT = 0
+        mock_config.IFLOW_IDLE_TIMEOUT = 0
+        mock_config.TRANSCRIPT_ENABLED = False
+        mock_config.TRACE_RECORD_ENABLED = False
+        mock_config.USAGE_ENABLED = False
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        session._client = mock_client = self._stalled_client()
+
+        stream = session.send_message("Hello")
+        assert (await stream.__anext__())["type"] == "assistant"
+        await stream.aclose()
+
+        mock_client.interrupt.assert_awaited_once()
+        assert session._needs_replay is True
+
+        session._client = finished_client = AsyncMock()
+        finished_client.receive_messages = self._mock_receive_messages()
+        session._needs_replay = False
+        stream = session.send_message("Hello")
+        async for response in stream:
+            if response["type"] == "finish":
+                break
+        await stream.aclose()
+
+        finished_client.interrupt.assert_not_awaited()
+        assert session._client is finished_client
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.config')
+    async def test_turn_deadline(self, mock_config):
+        """测试整轮截止时间先于分块间隔到达"""
+        from iflow_manager import stream_timeouts
+        mock_config.IFLOW_TURN_TIMEOUT = 0.05
+        mock_config.IFLOW_IDLE_TIMEOUT = 300
+        mock_config.TRANSCRIPT_ENABLED = False
+        mock_config.TRACE_RECORD_ENABLED = False
+        stream_timeouts.clear()
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        session._client = self._stalled_client(first_chunk=False)
+
+        responses = [r async for r in session.send_message("Hello")]
+
+        assert responses[-1]["reason"] == "turn_timeout"
+        assert stream_timeouts["turn_timeout"] == 1
+
+    def _dead_client(self):
+        """模拟 iFlow 进程已退出的客户端"""
+        dead_client = AsyncMock()
+        dead_client._connected = True
+        dead_client._process_manager = Mock(_process=Mock(returncode=1))
+        return dead_client
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.os.path.isdir')
+    @patch('iflow_manager.os.path.exists')
+    @patch('iflow_manager.IFlowClient')
+    async def test_respawn_after_crash(self, mock_client_class, mock_exists, mock_isdir):
+        """测试进程退出后自动重启并发送恢复消息"""
+        from iflow_manager import recovery_stats
+        mock_exists.return_value = True
+        mock_isdir.return_value = True
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.send_message = AsyncMock()
+        mock_client.receive_messages = self._mock_receive_messages()
+        mock_client_class.return_value = mock_client
+        recovery_stats.clear()
+
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        session._client = dead_client = self._dead_client()
+        assert session.is_healthy() is False
+
+        responses = [r async for r in session.send_message("Hello")]
+
+        assert responses[0]["type"] == "recovered"
+        assert responses[0]["restarts"] == 1
+        assert responses[-1]["type"] == "finish"
+        dead_client.__aexit__.assert_awaited_once()
+        assert session._client is mock_client
+        assert session.restarts == 1
+        assert recovery_stats["crashes"] == 1
+        assert recovery_stats["restarts"] == 1
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.asyncio.sleep', new_callable=AsyncMock)
+    @patch('iflow_manager.spawn_breaker')
+    @patch('iflow_manager.os.path.isdir')
+    @patch('iflow_manager.os.path.exists')
+    @patch('iflow_manager.IFlowClient')
+    async def test_respawn_backoff(self, mock_client_class, mock_exists, mock_isdir, mock_breaker, mock_sleep):
+        """测试启动失败时按指数退避重试"""
+        mock_exists.return_value = True
+        mock_isdir.return_value = True
+        mock_breaker.allow.return_value = True
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(side_effect=[OSError("spawn failed"), OSError("spawn failed"), mock_client])
+        mock_client_class.return_value = mock_client
+
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        await session._start_with_backoff()
+
+        assert session._client is mock_client
+        assert [c.args[0] for c in mock_sleep.await_args_list] == [1.0, 2.0]
+        assert mock_breaker.record_failure.call_count == 2
+        mock_breaker.record_success.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.os.path.isdir')
+    @patch('iflow_manager.os.path.exists')
+    @patch('iflow_manager.IFlowClient')
+    async def test_open_breaker_refuses_spawn(self, mock_client_class, mock_exists, mock_isdir):
+        """测试熔断器打开时不再启动进程"""
+        from iflow_manager import CircuitBreaker, IFlowUnavailableError
+        mock_exists.return_value = True
+        mock_isdir.return_value = True
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+        breaker.record_failure()
+
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        with patch('iflow_manager.spawn_breaker', breaker):
+            with pytest.raises(IFlowUnavailableError):
+                await session.initialize()
+        mock_client_class.assert_not_called()
+
+    def test_circuit_breaker_transitions(self):
+        """测试熔断器在关闭、打开、半开之间转换"""
+        from iflow_manager import CircuitBreaker
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.allow() is False
+        assert breaker.retry_after() > 0
+
+        import time
+        time.sleep(0.06)
+        assert breaker.state == "half_open"
+        assert breaker.allow() is True
+        assert breaker.allow() is False  # 只放行一次试探
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.trips == 2
+
+        time.sleep(0.06)
+        assert breaker.allow() is True
+        breaker.record_success()
+        assert breaker.snapshot()["state"] == "closed"
+        assert breaker.failures == 0
+
+    @pytest.mark.asyncio
+    async def test_replay_cached_records_turn(self, isolated_search_index):
+        """测试回放缓存的回复时写入会话记录、搜索索引和用量统计"""
+        from response_cache import response_cache
+        from transcript_store import transcript_store
+        from usage_stats import usage_tracker
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace", model="glm-4.7")
+        frames = [
+            {"type": "assistant", "content": "Hello", "is_stream": True},
+            {"type": "assistant", "content": " again", "is_stream": True},
+            {"type": "finish", "content": "Task finished", "is_stream": False},
+        ]
+
+        responses = [frame async for frame in session.replay_cached("Hi", response_cache.replay(frames))]
+
+        assert [frame["cached"] for frame in responses] == [True, True, True]
+        entries = await transcript_store.read("test-123")
+        assert [(e["role"], e["content"]) for e in entries] == [("user", "Hi"), ("assistant", "Hello again")]
+        assert [row[2] for row in isolated_search_index._pending] == ["user", "assistant"]
+        usage = usage_tracker.session_usage("test-123")
+        assert usage["outcomes"] == {"cached": 1}
+        assert usage["chars"] == len("Hello again")
+        # 下一轮实际对话通过重放会话记录让 iFlow 看到缓存的这一轮
+        assert session.turns == 1
+        assert session._needs_replay is True
+        assert session.busy is False
+
+    @pytest.mark.asyncio
+    async def test_hibernate_skips_busy_session(self):
+        """测试正在处理消息的会话不休眠"""
+        session = IFlowSession(session_id="test-123", working_dir="F:\\test\\workspace")
+        session._client = AsyncMock()
+        session.busy = True
+
+        assert await session.hibernate() is False
+        assert session._client is not None
+
     @pytest.mark.asyncio
     @patch('iflow_manager.IFlowClient')
     async def test_close(self, mock_client_class):
@@ -240,4 +616,91 @@ class TestIFlowManager:
         # 关闭所有会话
         await iflow_manager.close_all()
 
-        assert len(iflow_manager._sessions) == 0
\ No newline at end of file
+        assert len(iflow_manager._sessions) == 0
+    @pytest.mark.asyncio
+    async def test_available_models_cached(self, iflow_manager):
+        """测试模型列表缓存"""
+        models = {"default_model": "glm-4.7", "available_models": ["glm-4.7"]}
+        with patch.object(IFlowManager, '_fetch_available_models', AsyncMock(return_value=models)) as mock_fetch:
+            version = IFlowManager.models_version
+            assert await iflow_manager.get_available_models() == models
+            assert await iflow_manager.get_available_models() == models
+
+            mock_fetch.assert_called_once()
+            assert IFlowManager.models_version == version + 1
+
+            await iflow_manager.get_available_models(force_refresh=True)
+            assert mock_fetch.call_count == 2
+            # 内容未变化时版本号不变
+            assert IFlowManager.models_version == version + 1
+
+    def test_cached_models_fallback(self, iflow_manager):
+        """测试尚未获取模型时回退到配置"""
+        import config
+
+        assert iflow_manager.get_cached_models()["default_model"] == config.IFLOW_DEFAULT_MODEL
+
+    @pytest.mark.asyncio
+    async def test_has_history(self, iflow_manager):
+        """测试判断会话是否已有对话（本进程中的轮次或持久化的会话记录）"""
+        from transcript_store import transcript_store
+        assert await iflow_manager.has_history("fresh") is False
+
+        session = await iflow_manager.get_or_create_session("live", "F:\\test\\workspace")
+        assert await iflow_manager.has_history("live") is False
+        session.turns = 1
+        assert await iflow_manager.has_history("live") is True
+
+        await transcript_store.append("restored", "user", "Hi")
+        assert await iflow_manager.has_history("restored") is True
+
+    @pytest.mark.asyncio
+    async def test_hibernate_idle(self, iflow_manager):
+        """测试只休眠空闲超过阈值的会话"""
+        idle = IFlowSession("idle", "F:\\test\\workspace")
+        idle._client = AsyncMock()
+        idle.last_active -= 100
+        recent = IFlowSession("recent", "F:\\test\\workspace")
+        recent._client = AsyncMock()
+        iflow_manager._sessions.update({"idle": idle, "recent": recent})
+
+        assert await iflow_manager.hibernate_idle(60) == 1
+        assert idle.hibernated is True
+        assert recent.hibernated is False
+        assert iflow_manager.hibernated_count == 1
+
+    @pytest.mark.asyncio
+    async def test_hibernate_idle_needs_context_restore(self, iflow_manager, monkeypatch):
+        """测试既没有会话记录也没有原生恢复时不休眠（休眠会丢失整个对话）"""
+        import config
+        monkeypatch.setattr(config, "TRANSCRIPT_ENABLED", False)
+        monkeypatch.setattr(config, "SESSION_NATIVE_RESUME", False)
+        idle = IFlowSession("idle", "F:\\test\\workspace")
+        idle._client = AsyncMock()
+        idle.last_active -= 100
+        iflow_manager._sessions.update({"idle": idle})
+
+        assert await iflow_manager.hibernate_idle(60) == 0
+        assert idle.hibernated is False
+        await asyncio.wait_for(iflow_manager.run_hibernation(), timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_check_health(self, iflow_manager):
+        """测试健康检查只释放空闲会话中已失效的客户端"""
+        dead = IFlowSession("dead", "F:\\test\\workspace")
+        dead._client = AsyncMock()
+        dead._client._process_manager = Mock(_process=Mock(returncode=-9))
+        busy = IFlowSession("busy", "F:\\test\\workspace")
+        busy._client = AsyncMock()
+        busy._client._connected = False
+        busy.busy = True
+        alive = IFlowSession("alive", "F:\\test\\workspace")
+        alive._client = AsyncMock()
+        iflow_manager._sessions.update({"dead": dead, "busy": busy, "alive": alive})
+
+        assert await iflow_manager.check_health() == 1
+        assert dead._client is None
+        assert dead._needs_replay is True
+        assert busy._client is not None
+        assert alive._client is not None
+        assert "session_restarts" in iflow_manager.recovery_snapshot()
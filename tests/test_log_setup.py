@@ -0,0 +1,131 @@
+"""
+log_setup.py 单元测试
+"""
+
+import json
+import logging
+import queue
+import pytest
+from unittest.mock import patch
+from log_setup import JsonFormatter, DroppingQueueHandler, LogSampler, redact_body
+
+
+@pytest.fixture
+def test_logger():
+    """
+    创建记录到内存的日志记录器
+    """
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    logger = logging.getLogger("test_log_setup")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+    yield logger, records
+    logger.removeHandler(handler)
+
+
+class TestRedactBody:
+    """消息正文脱敏测试"""
+
+    @patch('log_setup.config')
+    def test_redacted_by_default(self, mock_config):
+        """测试默认只记录长度"""
+        mock_config.LOG_MESSAGE_BODIES = False
+
+        assert redact_body("secret prompt") == "<13 chars>"
+
+    @patch('log_setup.config')
+    def test_truncated_when_enabled(self, mock_config):
+        """测试开启后截断长正文"""
+        mock_config.LOG_MESSAGE_BODIES = True
+        mock_config.LOG_BODY_MAX_CHARS = 5
+
+        assert redact_body("hello") == "'hello'"
+        assert redact_body("hello world") == "'hello'...(+6 chars)"
+
+
+class TestLogSampler:
+    """LogSampler 类测试"""
+
+    def test_rate_limited(self, test_logger):
+        """测试同一键在间隔内只输出一条"""
+        logger, records = test_logger
+        sampler = LogSampler(interval=60.0)
+
+        for i in range(10):
+            sampler.log(logger, logging.DEBUG, "s1", "chunk %d", i)
+
+        assert len(records) == 1
+
+    def test_suppressed_count_reported(self, test_logger):
+        """测试被抑制的条数附加在下一条日志中"""
+        logger, records = test_logger
+        sampler = LogSampler(interval=0.0)
+        sampler.interval = 60.0
+        sampler.log(logger, logging.DEBUG, "s1", "chunk")
+        sampler.log(logger, logging.DEBUG, "s1", "chunk")
+        sampler.interval = 0.0
+        sampler.log(logger, logging.DEBUG, "s1", "chunk")
+
+        assert records[-1].getMessage() == "chunk (+1 suppressed)"
+
+    def test_keys_independent(self, test_logger):
+        """测试不同键分别限速"""
+        logger, records = test_logger
+        sampler = LogSampler(interval=60.0)
+
+        sampler.log(logger, logging.DEBUG, "s1", "chunk")
+        sampler.log(logger, logging.DEBUG, "s2", "chunk")
+
+        assert len(records) == 2
+
+    def test_disabled_level_skipped(self, test_logger):
+        """测试级别未启用时不记录也不计入限速"""
+        logger, records = test_logger
+        logger.setLevel(logging.INFO)
+        sampler = LogSampler(interval=60.0)
+
+        assert sampler.log(logger, logging.DEBUG, "s1", "chunk") is False
+        assert records == []
+        assert "s1" not in sampler._last
+
+    def test_reset(self, test_logger):
+        """测试重置后立即可以再次输出"""
+        logger, records = test_logger
+        sampler = LogSampler(interval=60.0)
+        sampler.log(logger, logging.DEBUG, "s1", "chunk")
+        sampler.reset("s1")
+        sampler.log(logger, logging.DEBUG, "s1", "chunk")
+
+        assert len(records) == 2
+
+
+class TestQueuePipeline:
+    """队列日志管道测试"""
+
+    def test_drops_when_full(self):
+        """测试队列满时丢弃而不阻塞"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+        record = logging.LogRecord("x", logging.INFO, "", 0, "msg", (), None)
+
+        handler.emit(record)
+        handler.emit(record)
+
+        assert handler.dropped == 1
+
+    def test_json_formatter(self):
+        """测试 JSON 输出包含 extra 字段"""
+        record = logging.LogRecord("app", logging.WARNING, "", 0, "hello %s", ("world",), None)
+        record.session_id = "abc"
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        assert entry["msg"] == "hello world"
+        assert entry["level"] == "WARNING"
+        assert entry["session_id"] == "abc"
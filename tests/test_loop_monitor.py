@@ -0,0 +1,64 @@
+"""
+loop_monitor.py 单元测试
+"""
+
+import asyncio
+import time
+import pytest
+from loop_monitor import LoopMonitor
+
+
+class TestLoopMonitor:
+    """LoopMonitor 类测试"""
+
+    def test_record_lag(self):
+        """测试延迟统计"""
+        monitor = LoopMonitor(interval=0.1, threshold=0.5)
+        monitor.record_lag(0.01)
+        monitor.record_lag(0.2)
+
+        snapshot = monitor.snapshot()
+        assert snapshot["samples"] == 2
+        assert snapshot["lag_last"] == 0.2
+        assert snapshot["lag_max"] == 0.2
+        assert 0.01 < snapshot["lag_avg"] < 0.2
+
+    @pytest.mark.asyncio
+    async def test_measures_lag(self):
+        """测试运行时持续采样"""
+        monitor = LoopMonitor(interval=0.01, threshold=1.0)
+        monitor.start()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+        assert monitor.samples > 0
+        assert monitor.running is False
+
+    @pytest.mark.asyncio
+    async def test_captures_blocking_stack(self):
+        """测试阻塞调用时抓取循环线程的调用栈"""
+        monitor = LoopMonitor(interval=0.01, threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.02)
+
+        def blocking_call():
+            time.sleep(0.3)
+
+        blocking_call()
+        await asyncio.sleep(0.02)
+        await monitor.stop()
+
+        assert monitor.stall_count == 1
+        assert "blocking_call" in monitor.stalls[0]["stack"]
+        assert monitor.max_lag >= 0.2
+
+    @pytest.mark.asyncio
+    async def test_start_idempotent(self):
+        """测试重复启动不会创建多个采样任务"""
+        monitor = LoopMonitor(interval=0.01, threshold=1.0)
+        monitor.start()
+        task = monitor._task
+        monitor.start()
+
+        assert monitor._task is task
+        await monitor.stop()
@@ -5,6 +5,7 @@ main.py API 集成测试
 import pytest
 from fastapi.testclient import TestClient
 import tempfile
+import json
 import os
 
 # 导入应用前需要清理单例
@@ -55,9 +56,173 @@ class TestHealthEndpoint:
         assert data["service"] == "iflow2web"
 
 
+class TestMetricsEndpoint:
+    """指标端点测试"""
+
+    def test_metrics(self, client, temp_working_dir):
+        """测试指标包含循环延迟和会话数"""
+        client.post("/api/sessions", json={"title": "Test", "working_dir": temp_working_dir})
+
+        response = client.get("/api/metrics")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["sessions"] == 1
+        assert "lag_max" in data["loop"]
+        assert "recent_stalls" in data["loop"]
+        assert "log_dropped" in data
+
+
+class TestMemoryEndpoints:
+    """内存分析端点测试"""
+
+    def test_disabled_by_default(self, client):
+        """测试未开启时端点不存在"""
+        assert client.get("/api/admin/memory").status_code == 404
+        assert client.post("/api/admin/memory/snapshot").status_code == 404
+
+    def test_report(self, client, temp_working_dir, monkeypatch):
+        """测试开启后返回子系统统计，未开启 tracemalloc 时快照返回 409"""
+        import config
+        monkeypatch.setattr(config, "MEMORY_PROFILING_ENABLED", True)
+        client.post("/api/sessions", json={"title": "Test", "working_dir": temp_working_dir})
+
+        response = client.get("/api/admin/memory")
+
+        assert response.status_code == 200
+        sessions = response.json()["subsystems"]["sessions"]
+        assert sessions["count"] == 1
+        assert sessions["bytes_per_session"] > 0
+        assert client.get("/api/admin/memory/diff").status_code == 409
+
+
+class TestSearchEndpoint:
+    """全文搜索端点测试"""
+
+    def test_search(self, client, temp_working_dir):
+        """测试搜索结果包含会话标题和高亮片段"""
+        import asyncio
+        from search_index import search_index
+        session = client.post("/api/sessions", json={"title": "Auth fix", "working_dir": temp_working_dir}).json()
+        search_index.add(session["session_id"], "assistant", "fixed the authentication bug", 1714550400.0)
+        asyncio.run(search_index.flush())
+
+        response = client.get("/api/search", params={"q": "authentication", "since": "2024-01-01"})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 1
+        assert results[0]["title"] == "Auth fix"
+        assert "<mark>authentication</mark>" in results[0]["snippet"]
+        assert client.get("/api/search", params={"q": "authentication", "since": "2030-01-01"}).json()["results"] == []
+
+    def test_search_validation(self, client):
+        """测试缺少查询词或时间格式无效时返回错误"""
+        assert client.get("/api/search").status_code == 422
+        assert client.get("/api/search", params={"q": "x", "since": "yesterday"}).status_code == 400
+        assert client.get("/api/search", params={"q": "x", "role": "tool"}).status_code == 422
+
+
+class TestExportEndpoints:
+    """对话记录导出端点测试"""
+
+    def test_export_markdown_gzip(self, client, temp_working_dir):
+        """测试导出 gzip 压缩的 Markdown"""
+        import gzip
+        from transcript_store import transcript_store
+        session = client.post("/api/sessions", json={"title": "Export me", "working_dir": temp_working_dir}).json()
+        transcript_store.append_sync(session["session_id"], [{"role": "user", "content": "你好", "ts": 1714550400.0}])
+
+        response = client.get(f"/api/sessions/{session['session_id']}/export", params={"format": "markdown", "gzip": "true"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        assert f'{session["session_id"]}.md.gz' in response.headers["content-disposition"]
+        text = gzip.decompress(response.content).decode("utf-8")
+        assert text.startswith("# Export me")
+        assert "你好" in text
+
+    def test_export_errors(self, client):
+        """测试会话不存在或格式无效"""
+        assert client.get("/api/sessions/missing/export").status_code == 404
+        assert client.get("/api/export", params={"session_id": "missing"}).status_code == 404
+        assert client.get("/api/export", params={"format": "pdf"}).status_code == 422
+
+    def test_bulk_export(self, client, temp_working_dir):
+        """测试批量导出为 zip 归档"""
+        import io
+        import zipfile
+        from transcript_store import transcript_store
+        ids = []
+        for title in ("a", "b"):
+            session = client.post("/api/sessions", json={"title": title, "working_dir": temp_working_dir}).json()
+            transcript_store.append_sync(session["session_id"], [{"role": "user", "content": title, "ts": 0}])
+            ids.append(session["session_id"])
+
+        response = client.get("/api/export", params={"session_id": ids})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert sorted(archive.namelist()) == sorted(f"{sid}.ndjson" for sid in ids)
+            lines = archive.read(f"{ids[0]}.ndjson").decode("utf-8").splitlines()
+        assert json.loads(lines[0])["title"] == "a"
+        assert json.loads(lines[1])["content"] == "a"
+
+
+class TestUsageEndpoints:
+    """用量统计端点测试"""
+
+    def test_usage(self, client, temp_working_dir):
+        """测试按会话和按模型查询用量"""
+        from usage_stats import usage_tracker, TurnUsage
+        first = client.post("/api/sessions", json={"title": "Team A", "working_dir": temp_working_dir, "model": "glm-4.7"}).json()
+        second = client.post("/api/sessions", json={"title": "Team B", "working_dir": temp_working_dir, "model": "qwen3-coder-plus"}).json()
+        usage_tracker.record_turn(first["session_id"], "glm-4.7", TurnUsage())
+        usage_tracker.record_turn(first["session_id"], "glm-4.7", TurnUsage())
+        usage_tracker.record_turn(second["session_id"], "qwen3-coder-plus", TurnUsage())
+
+        data = client.get("/api/usage").json()
+
+        assert data["totals"]["turns"] == 3
+        assert data["models"]["glm-4.7"]["turns"] == 2
+        assert [s["title"] for s in data["sessions"]] == ["Team A", "Team B"]
+        filtered = client.get("/api/usage", params={"model": "qwen3-coder-plus"}).json()["sessions"]
+        assert [s["session_id"] for s in filtered] == [second["session_id"]]
+        assert client.get(f"/api/sessions/{first['session_id']}/usage").json()["turns"] == 2
+        assert client.get("/api/sessions/missing/usage").status_code == 404
+        assert client.get("/api/usage", params={"sort": "cost"}).status_code == 422
+
+        client.delete(f"/api/sessions/{first['session_id']}")
+        assert first["session_id"] not in usage_tracker.sessions
+
+
 class TestModelsEndpoint:
     """模型端点测试"""
 
+    def test_models_include_stats_and_selected_default(self, client, temp_working_dir, monkeypatch):
+        """测试模型列表附带性能统计，latency 策略下新会话使用延迟最低的模型"""
+        import config
+        from model_stats import model_performance
+        from usage_stats import TurnUsage
+        monkeypatch.setattr(config, "MODEL_SELECTION_POLICY", "latency")
+        for model, ttft in ((config.IFLOW_DEFAULT_MODEL, 4.0), ("qwen3-coder-plus", 0.5)):
+            for _ in range(config.MODEL_SELECTION_MIN_SAMPLES):
+                turn = TurnUsage()
+                turn.first_token_at = turn.started + ttft
+                turn.finished_at = turn.started + ttft + 1.0
+                turn.chars = 10
+                model_performance.record(model, turn)
+
+        data = client.get("/api/models").json()
+
+        assert data["selection_policy"] == "latency"
+        assert data["model_stats"]["qwen3-coder-plus"]["ttft_p50"] == 0.5
+        assert data["default_model"] == "qwen3-coder-plus"
+        assert data["configured_default_model"] == config.IFLOW_DEFAULT_MODEL
+        session = client.post("/api/sessions", json={"title": "auto", "working_dir": temp_working_dir}).json()
+        assert session["model"] == "qwen3-coder-plus"
+
     def test_get_models(self, client):
         """测试获取模型列表"""
         response = client.get("/api/models")
@@ -69,6 +234,22 @@ class TestModelsEndpoint:
         assert isinstance(data["available_models"], list)
         assert len(data["available_models"]) > 0
 
+    def test_get_models_rate_limited(self, client, monkeypatch):
+        """测试超出限额时返回 429 和 Retry-After"""
+        from rate_limiter import rate_limiter, parse_rate, MODELS
+        monkeypatch.setitem(rate_limiter.limits, MODELS, parse_rate("2/60"))
+
+        assert client.get("/api/models").status_code == 200
+        assert client.get("/api/models").status_code == 200
+        response = client.get("/api/models")
+
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) == 30
+        detail = response.json()["detail"]
+        assert detail["error"] == "rate_limited"
+        assert detail["scope"] == MODELS
+        assert client.get("/api/metrics").json()["rate_limits"]["scopes"][MODELS]["limited"] == 1
+
 
 class TestSessionsEndpoints:
     """会话端点测试"""
@@ -143,6 +324,44 @@ class TestSessionsEndpoints:
         assert len(data["sessions"]) == 1
         assert data["sessions"][0]["title"] == "Test Session"
 
+    def test_list_sessions_paginated(self, client, temp_working_dir):
+        """测试分页列出会话"""
+        for i in range(3):
+            client.post("/api/sessions", json={"title": f"Session {i}", "working_dir": temp_working_dir})
+
+        response = client.get("/api/sessions", params={"limit": 2, "order": "desc"})
+
+        data = response.json()
+        assert [s["title"] for s in data["sessions"]] == ["Session 2", "Session 1"]
+        assert data["next_cursor"]
+
+        response = client.get("/api/sessions", params={"limit": 2, "order": "desc", "cursor": data["next_cursor"]})
+        assert [s["title"] for s in response.json()["sessions"]] == ["Session 0"]
+
+    def test_list_sessions_default_order(self, client, temp_working_dir):
+        """测试默认按最近活动在前列出会话"""
+        for i in range(3):
+            client.post("/api/sessions", json={"title": f"Session {i}", "working_dir": temp_working_dir})
+
+        titles = [s["title"] for s in client.get("/api/sessions").json()["sessions"]]
+
+        assert titles == ["Session 2", "Session 1", "Session 0"]
+
+    def test_list_sessions_not_modified(self, client, temp_working_dir):
+        """测试会话未变化时返回 304"""
+        etag = client.get("/api/sessions").headers["etag"]
+
+        assert client.get("/api/sessions", headers={"If-None-Match": etag}).status_code == 304
+
+        client.post("/api/sessions", json={"title": "New", "working_dir": temp_working_dir})
+        assert client.get("/api/sessions", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_list_sessions_invalid_cursor(self, client):
+        """测试无效游标"""
+        response = client.get("/api/sessions", params={"cursor": "bogus"})
+
+        assert response.status_code == 400
+
     def test_get_session(self, client, temp_working_dir):
         """测试获取会话详情"""
         # 创建会话
@@ -160,6 +379,20 @@ class TestSessionsEndpoints:
         data = response.json()
         assert data["session_id"] == session_id
         assert data["title"] == "Test Session"
+        assert data["resources"] is None  # iFlow 进程尚未启动
+
+    def test_get_file_diff(self, client, temp_working_dir):
+        """测试按需获取文件差异"""
+        with open(os.path.join(temp_working_dir, "hello.txt"), "w") as f:
+            f.write("hello\n")
+        session_id = client.post("/api/sessions", json={"title": "Test", "working_dir": temp_working_dir}).json()["session_id"]
+
+        response = client.get(f"/api/sessions/{session_id}/diff", params={"path": "hello.txt"})
+        assert response.status_code == 200
+        assert "+hello" in response.json()["diff"]
+
+        response = client.get(f"/api/sessions/{session_id}/diff", params={"path": "../secret.txt"})
+        assert response.status_code == 403
 
     def test_get_nonexistent_session(self, client):
         """测试获取不存在的会话"""
@@ -195,6 +428,48 @@ class TestSessionsEndpoints:
         assert response.status_code == 404
 
 
+class TestFsEndpoint:
+    """目录浏览端点测试"""
+
+    def test_browse_directory(self, client, temp_working_dir):
+        """测试浏览目录"""
+        os.mkdir(os.path.join(temp_working_dir, "src"))
+
+        response = client.get("/api/fs", params={"path": temp_working_dir})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [e["name"] for e in data["entries"]] == ["src"]
+
+    def test_complete_prefix(self, client, temp_working_dir):
+        """测试路径自动补全"""
+        os.mkdir(os.path.join(temp_working_dir, "project"))
+
+        response = client.get("/api/fs", params={"prefix": os.path.join(temp_working_dir, "pro")})
+
+        assert response.status_code == 200
+        assert response.json()["suggestions"] == [
+            {"path": os.path.join(temp_working_dir, "project"), "selectable": True},
+        ]
+
+    def test_browse_missing_directory(self, client, temp_working_dir):
+        """测试浏览不存在的目录"""
+        response = client.get("/api/fs", params={"path": os.path.join(temp_working_dir, "missing")})
+
+        assert response.status_code == 404
+
+    def test_create_session_missing_directory(self, client, temp_working_dir):
+        """测试创建会话时校验目录存在"""
+        session_data = {
+            "title": "Test Session",
+            "working_dir": os.path.join(temp_working_dir, "missing")
+        }
+
+        response = client.post("/api/sessions", json=session_data)
+
+        assert response.status_code == 400
+
+
 class TestRootEndpoint:
     """根端点测试"""
 
@@ -205,6 +480,201 @@ class TestRootEndpoint:
         assert response.status_code == 200
         assert response.headers["content-type"].startswith("text/html")
 
+    def test_root_inlines_bootstrap(self, client, temp_working_dir):
+        """测试页面内联引导数据"""
+        client.post("/api/sessions", json={"title": "Boot <Session>", "working_dir": temp_working_dir})
+
+        html = client.get("/").text
+        start = html.index('<script id="bootstrap-data" type="application/json">') + len('<script id="bootstrap-data" type="application/json">')
+        data = json.loads(html[start:html.index("</script>", start)])
+
+        assert data["sessions"][0]["title"] == "Boot <Session>"
+        assert "available_models" in data["models"]
+        assert "default_working_dir" in data["config"]
+        assert "<Session>" not in html
+
+    def test_root_etag_not_modified(self, client):
+        """测试未变化时返回 304"""
+        etag = client.get("/").headers["etag"]
+
+        response = client.get("/", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+
+    def test_root_etag_changes_with_sessions(self, client, temp_working_dir):
+        """测试会话变化后 ETag 失效"""
+        etag = client.get("/").headers["etag"]
+        client.post("/api/sessions", json={"title": "New", "working_dir": temp_working_dir})
+
+        response = client.get("/", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+
+class TestAssetsEndpoint:
+    """带哈希静态资源端点测试"""
+
+    def test_hashed_asset_served_with_immutable_cache(self, client):
+        """测试页面引用带哈希的资源，并以长期缓存头返回"""
+        from static_assets import asset_manifest
+        asset_manifest.build()
+
+        url = asset_manifest.url("js/terminal.js")
+        assert url in client.get("/").text
+
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert "immutable" in response.headers["cache-control"]
+        assert response.headers["content-encoding"] == "gzip"
+        assert "class Terminal" in response.text
+
+    def test_hashed_asset_not_modified(self, client):
+        """测试 ETag 条件请求"""
+        from static_assets import asset_manifest
+        asset_manifest.build()
+        url = asset_manifest.url("css/terminal.css")
+        etag = client.get(url).headers["etag"]
+
+        response = client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+
+    def test_unknown_asset(self, client):
+        """测试不存在的资源"""
+        response = client.get("/assets/js/missing.000000000000.js")
+
+        assert response.status_code == 404
+
+
+class TestAgentStreams:
+    """子 Agent 按需发送的端到端测试"""
+
+    def _fake_session(self, gate):
+        """主 Agent 回复一句，子 Agent 先输出两块，等待 gate 后再输出一块"""
+        import asyncio
+        info = {"agent_id": "sub-1", "task_id": "task", "agent_index": 0}
+
+        class FakeSession:
+            async def send_message(self, message):
+                yield {"type": "assistant", "content": "hi", "is_stream": True}
+                yield {"type": "assistant", "content": "a1", "agent_id": "sub-1", "agent_info": info, "is_stream": True}
+                yield {"type": "assistant", "content": "a2", "agent_id": "sub-1", "agent_info": info, "is_stream": True}
+                await asyncio.to_thread(gate.wait, 5)
+                yield {"type": "assistant", "content": "a3", "agent_id": "sub-1", "agent_info": info, "is_stream": True}
+                yield {"type": "finish", "content": "Task finished", "is_stream": False}
+
+        return FakeSession()
+
+    def test_subscribe_mid_stream(self, client, temp_working_dir, monkeypatch):
+        """测试未展开的子 Agent 不发送输出，展开后补发缓冲并实时发送"""
+        import threading
+        from unittest.mock import AsyncMock
+        import websocket_handler
+        gate = threading.Event()
+        monkeypatch.setattr(websocket_handler.iflow_manager, "get_or_create_session",
+                            AsyncMock(return_value=self._fake_session(gate)))
+        session = client.post("/api/sessions", json={"title": "agents", "working_dir": temp_working_dir}).json()
+
+        with client.websocket_connect("/ws") as ws:
+            ws.send_json({"session_id": session["session_id"], "agent_streams": "on_demand"})
+            assert ws.receive_json()["type"] == "pong"
+            ws.send_json({"type": "user_message", "content": "go", "bypass_cache": True})
+            assert ws.receive_json()["type"] == "user"
+            assert ws.receive_json()["content"] == "hi"
+            started = ws.receive_json()
+            assert (started["type"], started["event"], started["agent_id"]) == ("agent", "started", "sub-1")
+
+            ws.send_json({"type": "agent_subscribe", "agent_id": "sub-1"})
+            backlog = ws.receive_json()
+            assert backlog["type"] == "agent_backlog"
+            assert [f["content"] for f in backlog["frames"]] == ["a1a2"]
+            gate.set()
+
+            live = ws.receive_json()
+            assert (live["content"], live["agent_id"]) == ("a3", "sub-1")
+            assert ws.receive_json()["event"] == "finished"
+            assert ws.receive_json()["type"] == "finish"
+
+    def test_legacy_clients_receive_everything(self, client, temp_working_dir, monkeypatch):
+        """测试未声明按需发送的客户端照常收到所有帧"""
+        import threading
+        from unittest.mock import AsyncMock
+        import websocket_handler
+        gate = threading.Event()
+        gate.set()
+        monkeypatch.setattr(websocket_handler.iflow_manager, "get_or_create_session",
+                            AsyncMock(return_value=self._fake_session(gate)))
+        session = client.post("/api/sessions", json={"title": "legacy", "working_dir": temp_working_dir}).json()
+
+        with client.websocket_connect("/ws") as ws:
+            ws.send_json({"session_id": session["session_id"]})
+            assert ws.receive_json()["type"] == "pong"
+            ws.send_json({"type": "user_message", "content": "go", "bypass_cache": True})
+            frames = [ws.receive_json() for _ in range(6)]
+
+        assert [f.get("content") for f in frames] == ["go", "hi", "a1", "a2", "a3", "Task finished"]
+
+
+class TestResponseCacheTurns:
+    """响应缓存的端到端测试"""
+
+    @pytest.fixture
+    def cache_enabled(self, monkeypatch):
+        """启用响应缓存并固定工作区指纹"""
+        from unittest.mock import AsyncMock
+        import websocket_handler
+        monkeypatch.setattr(websocket_handler.response_cache, "is_enabled_for", lambda mode: True)
+        monkeypatch.setattr(websocket_handler, "compute_fingerprint", AsyncMock(return_value="fingerprint"))
+        websocket_handler.response_cache.clear()
+        yield websocket_handler.response_cache
+        websocket_handler.response_cache.clear()
+
+    def _turn(self, client, session_id, content):
+        with client.websocket_connect("/ws") as ws:
+            ws.send_json({"session_id": session_id})
+            assert ws.receive_json()["type"] == "pong"
+            ws.send_json({"type": "user_message", "content": content})
+            frames = [ws.receive_json()]
+            while frames[-1]["type"] != "finish":
+                frames.append(ws.receive_json())
+        return frames[1:]
+
+    def test_cache_only_first_turn(self, client, temp_working_dir, monkeypatch, cache_enabled):
+        """测试只缓存会话的第一轮，缓存命中的一轮同样写入会话记录"""
+        from iflow_manager import IFlowSession, IFlowManager
+        from transcript_store import transcript_store
+        monkeypatch.setattr(IFlowManager, "_sessions", {})
+        live_turns = []
+
+        async def fake_send(self, message):
+            self.turns += 1
+            live_turns.append(message)
+            await self._record("user", message)
+            yield {"type": "assistant", "content": f"answer {len(live_turns)}", "is_stream": True}
+            await self._record("assistant", f"answer {len(live_turns)}")
+            yield {"type": "finish", "content": "Task finished", "is_stream": False}
+
+        monkeypatch.setattr(IFlowSession, "send_message", fake_send)
+        first = client.post("/api/sessions", json={"title": "first", "working_dir": temp_working_dir}).json()
+        second = client.post("/api/sessions", json={"title": "second", "working_dir": temp_working_dir}).json()
+
+        assert self._turn(client, first["session_id"], "explain")[0]["content"] == "answer 1"
+        assert self._turn(client, first["session_id"], "explain that again")[0]["content"] == "answer 2"
+
+        # 另一个会话的第一轮命中缓存，并写入该会话的记录
+        cached = self._turn(client, second["session_id"], "explain")
+        assert cached[0]["content"] == "answer 1"
+        assert cached[0]["cached"] is True
+        entries = transcript_store.read_sync(second["session_id"])
+        assert [(e["role"], e["content"]) for e in entries] == [("user", "explain"), ("assistant", "answer 1")]
+
+        # 追问不使用缓存（即使提示词与其他会话的某一轮相同）
+        follow_up = self._turn(client, second["session_id"], "explain that again")
+        assert "cached" not in follow_up[0]
+        assert live_turns == ["explain", "explain that again", "explain that again"]
+
 
 @pytest.mark.integration
 class TestWebsocketEndpoint:
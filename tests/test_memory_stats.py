@@ -0,0 +1,96 @@
+"""
+memory_stats.py 单元测试
+"""
+
+import pytest
+import sys
+import threading
+from memory_stats import MemoryProfiler, deep_sizeof, subsystem_usage
+from session_manager import Session
+from iflow_manager import IFlowSession
+
+
+class TestDeepSizeof:
+    """对象大小估算测试"""
+
+    def test_containers(self):
+        """测试递归统计容器内容，共享对象只计算一次"""
+        shared = "x" * 1000
+        size, count = deep_sizeof({"a": [shared, shared]})
+        assert size >= sys.getsizeof(shared)
+        assert size < 2 * sys.getsizeof(shared)
+        assert count == 4  # dict、键、列表、字符串
+
+    def test_project_objects_with_slots(self):
+        """测试展开本项目对象（包括 __slots__ 字段），跳过指定属性"""
+        session = IFlowSession("s1", "/tmp")
+        session._client = ["y" * 10000]
+
+        full, _ = deep_sizeof(session)
+        skipped, _ = deep_sizeof(session, skip=("_client",))
+
+        assert full - skipped > 10000
+
+    def test_foreign_objects_not_expanded(self):
+        """测试第三方对象只计算自身大小"""
+        lock = threading.Lock()
+        assert deep_sizeof(lock) == (sys.getsizeof(lock), 1)
+
+
+class TestSlots:
+    """紧凑会话对象测试"""
+
+    def test_no_instance_dict(self):
+        """测试会话对象不再带有 __dict__"""
+        assert not hasattr(Session("s1", "t", "/tmp"), "__dict__")
+        assert not hasattr(IFlowSession("s1", "/tmp"), "__dict__")
+
+    def test_session_cache_still_invalidated(self):
+        """测试 __slots__ 下序列化缓存仍会在字段变化时失效"""
+        session = Session("s1", "t", "/tmp")
+        assert session.to_dict()["title"] == "t"
+        session.title = "new"
+        assert session.to_dict()["title"] == "new"
+
+
+class TestSubsystemUsage:
+    """子系统统计测试"""
+
+    def test_report_keys(self):
+        """测试包含所有子系统"""
+        usage = subsystem_usage()
+        assert set(usage) == {"sessions", "connections", "buffers", "queues", "caches"}
+        assert "bytes_per_session" in usage["sessions"]
+
+
+class TestMemoryProfiler:
+    """tracemalloc 快照测试"""
+
+    @pytest.mark.asyncio
+    async def test_requires_tracing(self):
+        """测试未开启 tracemalloc 时报错"""
+        profiler = MemoryProfiler()
+        profiler.stop()
+        with pytest.raises(RuntimeError):
+            await profiler.take_baseline()
+        with pytest.raises(RuntimeError):
+            await profiler.diff()
+
+    @pytest.mark.asyncio
+    async def test_baseline_and_diff(self):
+        """测试与基线比较时能找到新增的分配"""
+        profiler = MemoryProfiler()
+        profiler.start(frames=1)
+        try:
+            await profiler.take_baseline()
+            retained = [bytearray(1024) for _ in range(200)]  # noqa: F841
+            diff = await profiler.diff(limit=5)
+            report = await profiler.report(limit=5)
+        finally:
+            profiler.stop()
+
+        assert diff["bytes_diff"] > 200 * 1024
+        assert any("test_memory_stats.py" in entry["location"] for entry in diff["top"])
+        assert report["tracing"] is True
+        assert report["traced"]["current_bytes"] > 0
+        assert "tests/test_memory_stats.py" in report["modules"]
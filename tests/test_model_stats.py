@@ -0,0 +1,138 @@
+"""
+model_stats.py 单元测试
+"""
+
+import time
+import pytest
+from unittest.mock import patch
+from model_stats import ModelPerformance, select_default_model
+from usage_stats import TurnUsage
+
+
+def turn(ttft: float = 1.0, duration: float = 2.0, chars: int = 100, outcome: str = "end_turn") -> TurnUsage:
+    """构造已结束的一轮：ttft 秒后出现首字，duration 秒后结束"""
+    usage = TurnUsage()
+    now = time.monotonic()
+    usage.started = now - duration
+    usage.first_token_at = usage.started + ttft if ttft is not None else None
+    usage.finished_at = now
+    usage.chars = chars
+    usage.outcome = outcome
+    return usage
+
+
+@pytest.fixture
+def performance():
+    """
+    创建性能统计（窗口 10 轮，不过期）
+    """
+    return ModelPerformance(window=10, max_age=0)
+
+
+@pytest.fixture
+def selection_config():
+    """
+    选择策略使用固定的阈值
+    """
+    with patch('model_stats.config') as mock_config:
+        mock_config.MODEL_SELECTION_MIN_SAMPLES = 3
+        mock_config.MODEL_SELECTION_MAX_ERROR_RATE = 0.2
+        yield mock_config
+
+
+class TestModelPerformance:
+    """ModelPerformance 类测试"""
+
+    def test_stats(self, performance):
+        """测试首字延迟百分位、输出速度和错误率"""
+        for ttft in (1.0, 2.0, 3.0, 4.0):
+            performance.record("glm-4.7", turn(ttft=ttft, duration=ttft + 1.0, chars=100))
+        performance.record("glm-4.7", turn(ttft=None, chars=0, outcome="idle_timeout"))
+
+        stats = performance.stats("glm-4.7")
+
+        assert stats["samples"] == 5
+        assert stats["ttft_p50"] == 2.0
+        assert stats["ttft_p90"] == 4.0
+        assert stats["throughput_p50"] == 100.0
+        assert stats["error_rate"] == 0.2
+
+    def test_window(self, performance):
+        """测试只保留最近的轮次"""
+        for _ in range(10):
+            performance.record("m", turn(outcome="error"))
+        for _ in range(10):
+            performance.record("m", turn())
+
+        assert performance.stats("m")["error_rate"] == 0.0
+
+    def test_max_age(self):
+        """测试过期样本不参与统计"""
+        performance = ModelPerformance(window=10, max_age=60)
+        old = turn()
+        old.finished_at -= 120
+        performance.record("m", old)
+
+        assert performance.stats("m")["samples"] == 0
+        assert performance.snapshot() == {}
+
+    def test_unknown_model(self, performance):
+        """测试没有样本的模型"""
+        assert performance.stats("missing") == {
+            "samples": 0, "ttft_p50": None, "ttft_p90": None, "throughput_p50": None, "error_rate": None,
+        }
+
+
+class TestSelectDefaultModel:
+    """select_default_model 测试"""
+
+    MODELS = ["glm-4.7", "fast", "flaky"]
+
+    def _record(self, performance, model, count=3, **kwargs):
+        for _ in range(count):
+            performance.record(model, turn(**kwargs))
+
+    def test_static(self, performance, selection_config):
+        """测试 static 策略始终使用配置的默认模型"""
+        self._record(performance, "fast", ttft=0.1)
+        self._record(performance, "glm-4.7", ttft=5.0)
+
+        assert select_default_model(self.MODELS, "glm-4.7", performance, "static") == "glm-4.7"
+
+    def test_latency(self, performance, selection_config):
+        """测试 latency 策略选择首字延迟最低的健康模型"""
+        self._record(performance, "glm-4.7", ttft=3.0)
+        self._record(performance, "fast", ttft=1.0)
+        self._record(performance, "flaky", ttft=0.1, outcome="error")
+
+        assert select_default_model(self.MODELS, "glm-4.7", performance, "latency") == "fast"
+
+    def test_latency_margin(self, performance, selection_config):
+        """测试差距不明显时保持配置的默认模型"""
+        self._record(performance, "glm-4.7", ttft=1.0)
+        self._record(performance, "fast", ttft=0.9)
+
+        assert select_default_model(self.MODELS, "glm-4.7", performance, "latency") == "glm-4.7"
+
+    def test_default_without_samples(self, performance, selection_config):
+        """测试配置的默认模型样本不足时不切换，以便重新测量"""
+        self._record(performance, "glm-4.7", count=2, ttft=9.0)
+        self._record(performance, "fast", ttft=0.1)
+
+        assert select_default_model(self.MODELS, "glm-4.7", performance, "latency") == "glm-4.7"
+
+    def test_error_rate(self, performance, selection_config):
+        """测试 error_rate 策略只在默认模型出错过多时切换"""
+        self._record(performance, "glm-4.7", ttft=1.0)
+        self._record(performance, "fast", ttft=0.5)
+        assert select_default_model(self.MODELS, "glm-4.7", performance, "error_rate") == "glm-4.7"
+
+        self._record(performance, "glm-4.7", count=3, outcome="turn_timeout")
+        assert select_default_model(self.MODELS, "glm-4.7", performance, "error_rate") == "fast"
+
+    def test_only_available_models(self, performance, selection_config):
+        """测试不会选择不在可用列表中的模型"""
+        self._record(performance, "glm-4.7", ttft=3.0)
+        self._record(performance, "retired", ttft=0.1)
+
+        assert select_default_model(self.MODELS, "glm-4.7", performance, "latency") == "glm-4.7"
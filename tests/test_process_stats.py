@@ -0,0 +1,131 @@
+"""
+process_stats.py 单元测试
+"""
+
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from process_stats import ResourceMonitor, kill_sampled, process_tree, sample_tree, proc_available
+
+pytestmark = pytest.mark.skipif(not proc_available(), reason="/proc not available")
+
+
+@pytest.fixture
+def child_process():
+    """
+    启动一个子进程
+    """
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    yield process
+    process.kill()
+    process.wait()
+
+
+@pytest.fixture
+def limits():
+    """
+    提供资源限制配置
+    """
+    with patch('process_stats.config') as mock_config:
+        mock_config.PROCESS_SAMPLE_INTERVAL = 5.0
+        mock_config.SESSION_MAX_RSS_MB = 0
+        mock_config.SESSION_MAX_CPU_SECONDS = 0
+        yield mock_config
+
+
+class TestSampling:
+    """进程树采样测试"""
+
+    def test_process_tree_includes_children(self, child_process):
+        """测试进程树包含子进程"""
+        pids = process_tree(os.getpid())
+
+        assert pids[0] == os.getpid()
+        assert child_process.pid in pids
+
+    def test_sample_tree(self, child_process):
+        """测试采样结果"""
+        sample = sample_tree(os.getpid())
+
+        assert sample["rss_bytes"] > 0
+        assert sample["open_fds"] > 0
+        assert sample["cpu_seconds"] >= 0
+        assert child_process.pid in sample["pids"]
+
+    def test_missing_process(self, child_process):
+        """测试进程不存在时返回 None"""
+        child_process.kill()
+        child_process.wait()
+
+        assert sample_tree(child_process.pid) is None
+
+    def test_kill_sampled_checks_start_time(self, child_process):
+        """测试启动时间与采样不一致（PID 已被复用）时不发送信号"""
+        procs = sample_tree(child_process.pid)["_procs"]
+        pid, start_time = procs[0]
+
+        assert kill_sampled([(pid, start_time + 1)]) == 0
+        assert child_process.poll() is None
+
+        assert kill_sampled(procs) == 1
+        assert child_process.wait(timeout=5) != 0
+
+
+class TestResourceMonitor:
+    """ResourceMonitor 类测试"""
+
+    def test_limit_exceeded(self, limits):
+        """测试资源限制检查"""
+        sample = {"rss_bytes": 300 * 1024 * 1024, "cpu_seconds": 10.0}
+        assert ResourceMonitor.limit_exceeded(sample) is None
+
+        limits.SESSION_MAX_RSS_MB = 200
+        assert "memory" in ResourceMonitor.limit_exceeded(sample)
+
+        limits.SESSION_MAX_RSS_MB = 0
+        limits.SESSION_MAX_CPU_SECONDS = 5
+        assert "CPU" in ResourceMonitor.limit_exceeded(sample)
+
+    @pytest.mark.asyncio
+    async def test_sample_all(self, limits, child_process):
+        """测试按会话采样并计算 CPU 占用率"""
+        monitor = ResourceMonitor()
+        session = Mock(pid=child_process.pid)
+        with patch('process_stats.iflow_manager') as mock_manager:
+            mock_manager.active_sessions.return_value = {"s1": session, "s2": Mock(pid=None)}
+            await monitor.sample_all()
+            await monitor.sample_all()
+
+        usage = monitor.get_usage("s1")
+        assert usage["pids"] == [child_process.pid]
+        assert "cpu_percent" in usage
+        assert "_sampled_at" not in usage
+        assert monitor.get_usage("s2") is None
+        assert monitor.snapshot()["total_rss_bytes"] == usage["rss_bytes"]
+
+    @pytest.mark.asyncio
+    async def test_kill_and_notify(self, limits, child_process):
+        """测试超限时终止进程树并通知客户端"""
+        limits.SESSION_MAX_RSS_MB = 1
+        notify = AsyncMock()
+        monitor = ResourceMonitor()
+        monitor._notify = notify
+        with patch('process_stats.iflow_manager') as mock_manager:
+            mock_manager.active_sessions.return_value = {"s1": Mock(pid=child_process.pid)}
+            # 关闭客户端之前进程树已被终止（不会在对话进行中等待客户端关闭）
+            killed_before_close = []
+            mock_manager.close_session = AsyncMock(
+                side_effect=lambda session_id: killed_before_close.append(child_process.wait(timeout=5) != 0)
+            )
+            await monitor.sample_all()
+
+        mock_manager.close_session.assert_awaited_once_with("s1")
+        assert child_process.wait(timeout=5) != 0
+        assert killed_before_close == [True]
+        assert monitor.killed == 1
+        assert monitor.get_usage("s1") is None
+        session_id, message = notify.await_args.args
+        assert session_id == "s1"
+        assert message["reason"] == "resource_limit"
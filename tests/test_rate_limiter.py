@@ -0,0 +1,100 @@
+"""
+rate_limiter.py 单元测试
+"""
+
+import pytest
+from unittest.mock import Mock, patch
+from rate_limiter import RateLimiter, TokenBucket, parse_rate, client_identity, PROMPT, MODELS
+
+
+class TestParseRate:
+    """限流配置解析测试"""
+
+    def test_parse(self):
+        """测试解析次数/秒数"""
+        assert parse_rate("20/60") == (20, 20 / 60)
+        assert parse_rate("5") == (5, 5.0)
+
+    def test_disabled(self):
+        """测试空配置和 0 表示不限制"""
+        assert parse_rate("") is None
+        assert parse_rate("0/60") is None
+
+    def test_invalid(self):
+        """测试格式错误"""
+        with pytest.raises(ValueError):
+            parse_rate("abc")
+        with pytest.raises(ValueError):
+            parse_rate("10/0")
+
+
+class TestTokenBucket:
+    """令牌桶测试"""
+
+    def test_burst_and_refill(self):
+        """测试桶容量内放行，之后按速率补充"""
+        bucket = TokenBucket(capacity=2, refill_rate=1.0, now=0.0)
+        assert bucket.take(0.0) == 0
+        assert bucket.take(0.0) == 0
+        assert bucket.take(0.0) == pytest.approx(1.0)
+        assert bucket.take(0.5) == pytest.approx(0.5)
+        assert bucket.take(1.0) == 0
+        assert bucket.is_full(10.0) is True
+
+
+class TestRateLimiter:
+    """限流器测试"""
+
+    def test_per_client_buckets(self):
+        """测试不同客户端和作用域互不影响"""
+        limiter = RateLimiter({PROMPT: "1/60", MODELS: "1/60"})
+        assert limiter.acquire(PROMPT, "ip:a") == 0
+        assert limiter.acquire(PROMPT, "ip:a") == pytest.approx(60, abs=0.1)
+        assert limiter.acquire(PROMPT, "ip:b") == 0
+        assert limiter.acquire(MODELS, "ip:a") == 0
+
+        stats = limiter.snapshot()["scopes"][PROMPT]
+        assert stats["allowed"] == 2
+        assert stats["limited"] == 1
+
+    def test_unlimited_scope(self):
+        """测试未配置限额的作用域总是放行"""
+        limiter = RateLimiter({PROMPT: "0"})
+        assert all(limiter.acquire(PROMPT, "ip:a") == 0 for _ in range(100))
+        assert limiter.acquire("unknown", "ip:a") == 0
+
+    @patch('rate_limiter.config')
+    def test_disabled(self, mock_config):
+        """测试关闭限流"""
+        mock_config.RATE_LIMIT_ENABLED = False
+        limiter = RateLimiter({PROMPT: "1/60"}, max_buckets=10)
+        assert limiter.acquire(PROMPT, "ip:a") == 0
+        assert limiter.acquire(PROMPT, "ip:a") == 0
+
+    def test_prune_buckets(self):
+        """测试令牌桶数达到上限时回收"""
+        limiter = RateLimiter({PROMPT: "5/1"}, max_buckets=4)
+        for i in range(10):
+            limiter.acquire(PROMPT, f"ip:{i}")
+        assert len(limiter._buckets) <= 4
+
+
+class TestClientIdentity:
+    """客户端身份测试"""
+
+    def _connection(self, headers=None, host="10.0.0.1"):
+        return Mock(headers=headers or {}, client=Mock(host=host))
+
+    @patch('rate_limiter.config')
+    def test_ip(self, mock_config):
+        """测试默认按 IP 区分"""
+        mock_config.RATE_LIMIT_KEY = "ip"
+        assert client_identity(self._connection({"X-Client-Id": "abc"})) == "ip:10.0.0.1"
+
+    @patch('rate_limiter.config')
+    def test_header(self, mock_config):
+        """测试按请求头区分，缺少请求头时回退到 IP"""
+        mock_config.RATE_LIMIT_KEY = "header"
+        mock_config.RATE_LIMIT_HEADER = "X-Client-Id"
+        assert client_identity(self._connection({"X-Client-Id": "abc"})) == "header:abc"
+        assert client_identity(self._connection()) == "ip:10.0.0.1"
@@ -0,0 +1,169 @@
+"""
+response_cache.py 单元测试
+"""
+
+import os
+import shutil
+import subprocess
+import pytest
+from unittest.mock import patch
+from response_cache import ResponseCache, normalize_prompt, compute_fingerprint
+
+
+@pytest.fixture
+def cache():
+    """
+    创建响应缓存实例
+    """
+    return ResponseCache(max_bytes=1024, max_entries=3)
+
+
+def _frames(text: str) -> list[dict]:
+    return [
+        {"type": "assistant", "content": text, "is_stream": True},
+        {"type": "finish", "content": "Task finished", "reason": "end_turn", "is_stream": False},
+    ]
+
+
+class TestNormalizePrompt:
+    """提示词规范化测试"""
+
+    def test_collapse_whitespace(self):
+        """测试合并空白字符"""
+        assert normalize_prompt("  explain   the\n\tcode ") == "explain the code"
+
+
+class TestResponseCache:
+    """ResponseCache 类测试"""
+
+    def test_make_key_normalizes_prompt(self):
+        """测试缓存键忽略空白差异"""
+        key1 = ResponseCache.make_key("glm-4.7", "PLAN", "what  does main do", "fp")
+        key2 = ResponseCache.make_key("glm-4.7", "PLAN", "what does main do ", "fp")
+        assert key1 == key2
+
+    def test_make_key_depends_on_fingerprint_and_model(self):
+        """测试缓存键区分模型和工作区指纹"""
+        base = ResponseCache.make_key("glm-4.7", "PLAN", "hello", "fp1")
+        assert base != ResponseCache.make_key("glm-4.7", "PLAN", "hello", "fp2")
+        assert base != ResponseCache.make_key("kimi-k2", "PLAN", "hello", "fp1")
+
+    def test_get_miss_and_hit(self, cache):
+        """测试未命中与命中"""
+        assert cache.get("k") is None
+        cache.put("k", _frames("hi"))
+        assert cache.get("k") == _frames("hi")
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_lru_eviction_by_entries(self, cache):
+        """测试按条目数 LRU 淘汰"""
+        cache.put("a", _frames("a"))
+        cache.put("b", _frames("b"))
+        cache.put("c", _frames("c"))
+        cache.get("a")  # a 变为最近使用
+        cache.put("d", _frames("d"))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.evictions == 1
+
+    def test_eviction_by_bytes(self, cache):
+        """测试按字节数淘汰"""
+        cache.put("a", _frames("x" * 400))
+        cache.put("b", _frames("y" * 400))
+        assert cache.get("a") is None
+        assert cache.stats()["bytes"] <= cache.max_bytes
+
+    def test_oversized_entry_not_cached(self, cache):
+        """测试超大响应不缓存"""
+        assert cache.put("big", _frames("z" * 2048)) is False
+        assert cache.get("big") is None
+
+    @patch('response_cache.config')
+    def test_disabled_by_default(self, mock_config, cache):
+        """测试默认关闭"""
+        mock_config.RESPONSE_CACHE_ENABLED = False
+        mock_config.RESPONSE_CACHE_WRITE_MODES = []
+        assert cache.is_enabled_for("PLAN") is False
+
+    @patch('response_cache.config')
+    def test_write_modes_require_explicit_opt_in(self, mock_config, cache):
+        """测试可写模式需要显式开启"""
+        mock_config.RESPONSE_CACHE_ENABLED = True
+        mock_config.RESPONSE_CACHE_WRITE_MODES = []
+        assert cache.is_enabled_for("PLAN") is True
+        assert cache.is_enabled_for("YOLO") is False
+
+        mock_config.RESPONSE_CACHE_WRITE_MODES = ["YOLO"]
+        assert cache.is_enabled_for("YOLO") is True
+
+    @pytest.mark.asyncio
+    async def test_replay_marks_frames_cached(self, cache):
+        """测试重放帧带 cached 标记"""
+        frames = [frame async for frame in cache.replay(_frames("hi"))]
+        assert [f["type"] for f in frames] == ["assistant", "finish"]
+        assert all(f["cached"] for f in frames)
+
+
+class TestComputeFingerprint:
+    """工作区指纹测试"""
+
+    @pytest.mark.asyncio
+    async def test_fingerprint_changes_with_tree(self, temp_working_dir):
+        """测试非 git 目录的指纹随文件变化"""
+        path = os.path.join(temp_working_dir, "a.txt")
+        with open(path, "w") as f:
+            f.write("one")
+        fp1 = await compute_fingerprint(temp_working_dir)
+        assert fp1 == await compute_fingerprint(temp_working_dir)
+
+        with open(os.path.join(temp_working_dir, "b.txt"), "w") as f:
+            f.write("two")
+        assert await compute_fingerprint(temp_working_dir) != fp1
+
+    @pytest.mark.asyncio
+    async def test_fingerprint_sees_nested_edits(self, temp_working_dir):
+        """测试非 git 目录中嵌套文件的修改也会改变指纹"""
+        nested = os.path.join(temp_working_dir, "src", "pkg")
+        os.makedirs(nested)
+        path = os.path.join(nested, "mod.py")
+        with open(path, "w") as f:
+            f.write("one")
+        fp1 = await compute_fingerprint(temp_working_dir)
+
+        with open(path, "w") as f:
+            f.write("three")
+        assert await compute_fingerprint(temp_working_dir) != fp1
+
+    @pytest.mark.asyncio
+    @patch('response_cache.config')
+    async def test_fingerprint_skips_large_tree(self, mock_config, temp_working_dir):
+        """测试非 git 目录条目数超过上限时不计算指纹"""
+        mock_config.RESPONSE_CACHE_SCAN_MAX_ENTRIES = 2
+        for name in ("a.txt", "b.txt", "c.txt"):
+            with open(os.path.join(temp_working_dir, name), "w") as f:
+                f.write(name)
+        assert await compute_fingerprint(temp_working_dir) is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+    async def test_fingerprint_sees_untracked_nested_files(self, temp_working_dir):
+        """测试 git 目录中未跟踪目录内的文件修改也会改变指纹"""
+        subprocess.run(["git", "init", "-q", temp_working_dir], check=True)
+        nested = os.path.join(temp_working_dir, "new_dir")
+        os.makedirs(nested)
+        path = os.path.join(nested, "draft.txt")
+        with open(path, "w") as f:
+            f.write("one")
+        fp1 = await compute_fingerprint(temp_working_dir)
+        assert fp1 is not None
+
+        with open(path, "w") as f:
+            f.write("three")
+        assert await compute_fingerprint(temp_working_dir) != fp1
+
+    @pytest.mark.asyncio
+    async def test_fingerprint_missing_dir(self, tmp_path):
+        """测试目录不存在时返回 None"""
+        assert await compute_fingerprint(str(tmp_path / "missing")) is None
@@ -0,0 +1,133 @@
+"""
+search_index.py 单元测试
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from search_index import SearchIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    """
+    创建使用临时数据库的搜索索引
+    """
+    search_index = SearchIndex(str(tmp_path / "search.db"))
+    yield search_index
+    search_index.close()
+
+
+async def add_all(index, rows):
+    for session_id, role, content, ts in rows:
+        index.add(session_id, role, content, ts)
+    await index.flush()
+
+
+class TestSearchIndex:
+    """SearchIndex 类测试"""
+
+    @pytest.mark.asyncio
+    async def test_batched_until_flush(self, index):
+        """测试记录先进入队列，flush 后才写入数据库"""
+        index.add("s1", "user", "fix the authentication bug", 1.0)
+        assert index.stats()["pending"] == 1
+        assert await index.search("authentication") == []
+
+        assert await index.flush() == 1
+        assert index.stats()["pending"] == 0
+        results = await index.search("authentication")
+        assert [r["session_id"] for r in results] == ["s1"]
+
+    @pytest.mark.asyncio
+    async def test_background_flush(self, index):
+        """测试后台任务在间隔后自动写入"""
+        with patch('search_index.config') as mock_config:
+            mock_config.SEARCH_ENABLED = True
+            mock_config.SEARCH_BATCH_SIZE = 100
+            mock_config.SEARCH_FLUSH_INTERVAL = 0.01
+            index.add("s1", "user", "background indexing", 1.0)
+            await asyncio.sleep(0.05)
+            await index._flush_task
+
+        assert len(await index.search("indexing")) == 1
+
+    @pytest.mark.asyncio
+    async def test_ranking_and_highlight(self, index):
+        """测试按相关度排序并高亮命中，内容中的 HTML 被转义"""
+        await add_all(index, [
+            ("s1", "assistant", "unrelated text that mentions auth once", 1.0),
+            ("s2", "assistant", "auth auth auth: fixed the <auth> token refresh", 2.0),
+        ])
+
+        results = await index.search("auth")
+
+        assert [r["session_id"] for r in results] == ["s2", "s1"]
+        assert results[0]["score"] >= results[1]["score"]
+        assert "<mark>auth</mark>" in results[0]["snippet"]
+        assert "&lt;" in results[0]["snippet"]
+        assert "<auth>" not in results[0]["snippet"]
+
+    @pytest.mark.asyncio
+    async def test_all_terms_required(self, index):
+        """测试多个词时所有词都需要出现，查询语法字符被当作普通文本"""
+        await add_all(index, [
+            ("s1", "user", "login page crashes", 1.0),
+            ("s2", "user", "login works fine", 2.0),
+        ])
+
+        assert [r["session_id"] for r in await index.search("login crashes")] == ["s1"]
+        assert await index.search('"login" OR NEAR(') == []
+
+    @pytest.mark.asyncio
+    async def test_chinese_and_short_terms(self, index):
+        """测试中文子串搜索，以及少于 3 个字符的词退回到子串匹配"""
+        await add_all(index, [
+            ("s1", "assistant", "已经修复了登录鉴权的问题", 1.0),
+            ("s2", "assistant", "修改了样式", 2.0),
+        ])
+
+        assert [r["session_id"] for r in await index.search("登录鉴权")] == ["s1"]
+        short = await index.search("鉴权")
+        assert [r["session_id"] for r in short] == ["s1"]
+        assert "<mark>鉴权</mark>" in short[0]["snippet"]
+
+    @pytest.mark.asyncio
+    async def test_filters(self, index):
+        """测试会话、角色和时间过滤"""
+        await add_all(index, [
+            ("s1", "user", "deploy the service", 100.0),
+            ("s1", "assistant", "deploy finished", 200.0),
+            ("s2", "user", "deploy again", 300.0),
+        ])
+
+        assert len(await index.search("deploy", session_id="s1")) == 2
+        assert [r["ts"] for r in await index.search("deploy", role="assistant")] == [200.0]
+        assert sorted(r["ts"] for r in await index.search("deploy", since=150.0, until=300.0)) == [200.0]
+        assert len(await index.search("deploy", limit=1, offset=2)) == 1
+
+    @pytest.mark.asyncio
+    async def test_delete_session(self, index):
+        """测试删除会话的索引记录，包括尚未写入的记录"""
+        await add_all(index, [("s1", "user", "remove me please", 1.0)])
+        index.add("s1", "assistant", "remove me too", 2.0)
+
+        await index.delete_session("s1")
+        await index.flush()
+
+        assert await index.search("remove") == []
+
+    @pytest.mark.asyncio
+    async def test_backfill_from_transcripts(self, index):
+        """测试启动时为已有会话记录建立索引，已索引的会话不重复索引"""
+        from transcript_store import transcript_store
+        transcript_store.append_sync("s1", [{"role": "user", "content": "old transcript content", "ts": 5.0}])
+
+        assert index.backfill_sync() == 1
+        assert index.backfill_sync() == 0
+        results = await index.search("transcript")
+        assert results[0]["ts"] == 5.0
+
+    def test_empty_query(self, index):
+        """测试空查询返回空结果"""
+        assert index.search_sync("   ") == []
@@ -0,0 +1,76 @@
+"""
+server_runtime.py 单元测试
+"""
+
+import pytest
+from unittest.mock import patch
+from server_runtime import resolve_runtime, uvicorn_options
+
+
+@pytest.fixture
+def runtime_config():
+    """
+    提供运行时配置
+    """
+    with patch('server_runtime.config') as mock_config:
+        mock_config.SERVER_LOOP = "auto"
+        mock_config.SERVER_HTTP = "auto"
+        mock_config.SERVER_WS = "auto"
+        mock_config.SERVER_WS_PER_MESSAGE_DEFLATE = False
+        mock_config.WS_PING_INTERVAL = 20
+        mock_config.WS_PING_TIMEOUT = 60
+        mock_config.SERVER_WORKERS = 1
+        mock_config.SERVER_TIMEOUT_KEEP_ALIVE = 5
+        mock_config.SERVER_BACKLOG = 2048
+        yield mock_config
+
+
+class TestResolveRuntime:
+    """resolve_runtime 函数测试"""
+
+    def test_auto_uses_installed_fast_paths(self, runtime_config):
+        """测试 auto 在已安装时选择快速实现"""
+        with patch('server_runtime._installed', return_value=True), \
+                patch('server_runtime._uvloop_supported', return_value=True):
+            runtime = resolve_runtime()
+
+        assert runtime["loop"] == "uvloop"
+        assert runtime["http"] == "httptools"
+        assert runtime["ws"] == "websockets"
+
+    def test_falls_back_when_not_installed(self, runtime_config):
+        """测试请求的实现未安装时回退"""
+        runtime_config.SERVER_LOOP = "uvloop"
+        runtime_config.SERVER_HTTP = "httptools"
+        runtime_config.SERVER_WS = "wsproto"
+        with patch('server_runtime._installed', side_effect=lambda m: m == "websockets"), \
+                patch('server_runtime._uvloop_supported', return_value=False):
+            runtime = resolve_runtime()
+
+        assert runtime["loop"] == "asyncio"
+        assert runtime["http"] == "h11"
+        assert runtime["ws"] == "websockets"
+
+    def test_explicit_choice_respected(self, runtime_config):
+        """测试显式选择默认实现"""
+        runtime_config.SERVER_LOOP = "asyncio"
+        runtime_config.SERVER_HTTP = "h11"
+
+        runtime = resolve_runtime()
+
+        assert runtime["loop"] == "asyncio"
+        assert runtime["http"] == "h11"
+
+    def test_workers_clamped(self, runtime_config):
+        """测试会话状态在进程内时只运行一个 worker"""
+        runtime_config.SERVER_WORKERS = 4
+
+        assert resolve_runtime()["workers"] == 1
+
+    def test_uvicorn_options(self, runtime_config):
+        """测试转换为 uvicorn 参数"""
+        options = uvicorn_options(resolve_runtime())
+
+        assert options["ws_per_message_deflate"] is False
+        assert options["backlog"] == 2048
+        assert options["ws_ping_timeout"] == 60
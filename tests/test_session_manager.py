@@ -119,15 +119,35 @@ class TestSessionManager:
             )
 
     def test_create_session_invalid_directory(self, session_manager):
-        """测试创建会话使用无效目录（如果配置了白名单）"""
-        # 由于当前配置允许所有目录，这个测试主要用于验证白名单功能
-        # 如果将来配置了白名单，这个测试会变得有用
-        session = session_manager.create_session(
-            title="Test Session",
-            working_dir="F:\\invalid\\path"
-        )
+        """测试创建会话使用不存在的目录（创建时即校验）"""
+        with pytest.raises(ValueError, match="does not exist"):
+            session_manager.create_session(
+                title="Test Session",
+                working_dir="F:\\invalid\\path"
+            )
+
+    def test_create_session_outside_whitelist(self, session_manager, temp_working_dir, monkeypatch):
+        """测试创建会话使用白名单外的目录"""
+        monkeypatch.setattr(config, "ALLOWED_WORKING_DIRS", [temp_working_dir + "-other"])
+
+        with pytest.raises(ValueError, match="not allowed"):
+            session_manager.create_session(
+                title="Test Session",
+                working_dir=temp_working_dir
+            )
+
+    @pytest.mark.asyncio
+    async def test_create_session_async(self, session_manager, temp_working_dir, monkeypatch):
+        """测试异步创建会话（工作目录在线程中校验）"""
+        session = await session_manager.create_session_async("Async", temp_working_dir)
+        assert session_manager.get_session(session.session_id) is session
 
-        assert session is not None
+        with pytest.raises(ValueError, match="does not exist"):
+            await session_manager.create_session_async("Missing", temp_working_dir + "-missing")
+
+        monkeypatch.setattr(config, "ALLOWED_WORKING_DIRS", [temp_working_dir + "-other"])
+        with pytest.raises(ValueError, match="not allowed"):
+            await session_manager.create_session_async("Outside", temp_working_dir)
 
     def test_get_session(self, session_manager, temp_working_dir):
         """测试获取会话"""
@@ -161,8 +181,8 @@ class TestSessionManager:
         sessions = session_manager.list_sessions()
 
         assert len(sessions) == 2
-        assert sessions[0]["title"] == "Session 1"
-        assert sessions[1]["title"] == "Session 2"
+        assert sessions[0]["title"] == "Session 2"
+        assert sessions[1]["title"] == "Session 1"
 
     def test_delete_session(self, session_manager, temp_working_dir):
         """测试删除会话"""
@@ -203,4 +223,114 @@ class TestSessionManager:
         """测试验证工作目录（无白名单）"""
         # 当前配置允许所有目录
         assert session_manager._validate_working_dir("F:\\any\\path") is True
-        assert session_manager._validate_working_dir("C:\\another\\path") is True
\ No newline at end of file
+        assert session_manager._validate_working_dir("C:\\another\\path") is True
+    def test_version_changes_on_mutation(self, session_manager, temp_working_dir):
+        """测试会话变化时版本号变化"""
+        v0 = session_manager.version
+        session = session_manager.create_session(title="Test Session", working_dir=temp_working_dir)
+        v1 = session_manager.version
+        session_manager.update_activity(session.session_id)
+        v2 = session_manager.version
+        session_manager.delete_session(session.session_id)
+
+        assert len({v0, v1, v2, session_manager.version}) == 4
+
+
+class TestSessionListing:
+    """会话索引、分页和过滤测试"""
+
+    @pytest.fixture
+    def populated(self, session_manager, temp_working_dir, tmp_path):
+        """
+        创建多个会话，并按顺序更新活动时间
+        """
+        other_dir = tmp_path / "other"
+        other_dir.mkdir()
+        sessions = []
+        for i in range(5):
+            working_dir = temp_working_dir if i % 2 == 0 else str(other_dir)
+            model = "glm-4.7" if i < 3 else "kimi-k2"
+            sessions.append(session_manager.create_session(f"Task {i}", working_dir, model))
+        return sessions
+
+    def test_ordered_by_last_activity(self, session_manager, populated):
+        """测试按最近活动时间排序"""
+        session_manager.update_activity(populated[0].session_id)
+
+        titles = [s["title"] for s in session_manager.list_sessions(order="asc")]
+        assert titles[-1] == "Task 0"
+
+        titles_desc = [s["title"] for s in session_manager.list_sessions(order="desc")]
+        assert titles_desc[0] == "Task 0"
+
+    def test_default_order_most_recent_first(self, session_manager, populated):
+        """测试默认按最近活动在前排序（前端默认选择第一个会话）"""
+        session_manager.update_activity(populated[1].session_id)
+
+        titles = [s["title"] for s in session_manager.list_sessions()]
+        assert titles == ["Task 1", "Task 4", "Task 3", "Task 2", "Task 0"]
+
+    def test_cursor_pagination(self, session_manager, populated):
+        """测试游标分页覆盖全部会话且不重复"""
+        seen = []
+        cursor = None
+        while True:
+            page = session_manager.list_sessions_page(limit=2, cursor=cursor, order="desc")
+            seen.extend(s["session_id"] for s in page["sessions"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert len(seen) == 5
+        assert len(set(seen)) == 5
+
+    def test_filters(self, session_manager, populated, temp_working_dir):
+        """测试按工作目录、模型和标题前缀过滤"""
+        assert len(session_manager.list_sessions(working_dir=temp_working_dir)) == 3
+        assert len(session_manager.list_sessions(model="kimi-k2")) == 2
+        assert len(session_manager.list_sessions(title_prefix="task 1")) == 1
+
+    def test_filtered_pagination(self, session_manager, populated):
+        """测试过滤与分页组合"""
+        page = session_manager.list_sessions_page(limit=1, model="glm-4.7")
+        assert len(page["sessions"]) == 1
+        assert page["next_cursor"] is not None
+
+        rest = session_manager.list_sessions_page(limit=5, model="glm-4.7", cursor=page["next_cursor"])
+        assert len(rest["sessions"]) == 2
+        assert rest["next_cursor"] is None
+
+    def test_invalid_cursor(self, session_manager, populated):
+        """测试无效游标"""
+        with pytest.raises(ValueError):
+            session_manager.list_sessions_page(cursor="not-a-cursor")
+
+    def test_serialized_entry_cached_until_change(self, session_manager, populated):
+        """测试序列化结果缓存，会话变化后失效"""
+        session = populated[0]
+        first = session.to_dict()
+        cached = session._dict_cache
+        assert session.to_dict() == first
+        assert session._dict_cache is cached
+
+        session_manager.update_activity(session.session_id)
+        assert session._dict_cache is None
+        assert session.to_dict() != first
+
+    def test_serialized_entry_not_shared(self, session_manager, populated):
+        """测试修改返回的字典不会影响缓存"""
+        session = populated[0]
+        data = session.to_dict()
+        data["title"] = "changed"
+        data["resources"] = {}
+
+        assert session.to_dict()["title"] == session.title
+        assert "resources" not in session.to_dict()
+
+    def test_delete_removes_from_index(self, session_manager, populated):
+        """测试删除会话后索引同步更新"""
+        session_manager.delete_session(populated[2].session_id)
+
+        ids = [s["session_id"] for s in session_manager.list_sessions()]
+        assert populated[2].session_id not in ids
+        assert len(ids) == 4
@@ -0,0 +1,81 @@
+"""
+static_assets.py 单元测试
+"""
+
+import gzip
+import pytest
+from static_assets import AssetManifest
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    """
+    创建临时静态目录
+    """
+    (tmp_path / "js").mkdir()
+    (tmp_path / "css").mkdir()
+    (tmp_path / "js" / "app.js").write_text("console.log('hello');\n" * 200)
+    (tmp_path / "css" / "tiny.css").write_text("a{}")
+    return tmp_path
+
+
+@pytest.fixture
+def manifest(static_dir):
+    """
+    创建并构建资源清单
+    """
+    manifest = AssetManifest(source_dir=str(static_dir))
+    manifest.build()
+    return manifest
+
+
+class TestAssetManifest:
+    """AssetManifest 类测试"""
+
+    def test_hashed_names(self, manifest):
+        """测试文件名包含内容哈希"""
+        hashed = manifest.manifest()["js/app.js"]
+
+        assert hashed.startswith("js/app.")
+        assert hashed.endswith(".js")
+        assert hashed != "js/app.js"
+
+    def test_hash_changes_with_content(self, static_dir, manifest):
+        """测试内容变化时哈希变化"""
+        before = manifest.manifest()["js/app.js"]
+        (static_dir / "js" / "app.js").write_text("changed")
+        manifest.build()
+
+        assert manifest.manifest()["js/app.js"] != before
+
+    def test_url(self, manifest):
+        """测试模板中使用的 URL"""
+        assert manifest.url("js/app.js") == "/assets/" + manifest.manifest()["js/app.js"]
+
+    def test_url_fallback_when_not_built(self):
+        """测试清单未构建时回退到 /static"""
+        assert AssetManifest().url("js/terminal.js") == "/static/js/terminal.js"
+
+    def test_gzip_variant(self, manifest):
+        """测试预压缩的 gzip 版本"""
+        asset = manifest.get(manifest.manifest()["js/app.js"])
+        encoding, content = asset.negotiate("gzip, deflate")
+
+        assert encoding == "gzip"
+        assert gzip.decompress(content) == asset.variants["identity"]
+
+    def test_small_files_not_compressed(self, manifest):
+        """测试小文件不压缩"""
+        asset = manifest.get(manifest.manifest()["css/tiny.css"])
+
+        assert asset.negotiate("gzip, br") == ("identity", b"a{}")
+
+    def test_identity_without_accept_encoding(self, manifest):
+        """测试客户端不支持压缩时返回原始内容"""
+        asset = manifest.get(manifest.manifest()["js/app.js"])
+
+        assert asset.negotiate("")[0] == "identity"
+
+    def test_unknown_asset(self, manifest):
+        """测试查找不存在的资源"""
+        assert manifest.get("js/missing.abc.js") is None
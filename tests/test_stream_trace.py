@@ -0,0 +1,162 @@
+"""
+stream_trace.py 单元测试
+"""
+
+import pytest
+import time
+from unittest.mock import patch
+from iflow_sdk.types import (
+    AgentInfo,
+    AssistantMessage,
+    AssistantMessageChunk,
+    Icon,
+    PlanEntry,
+    PlanMessage,
+    StopReason,
+    TaskFinishMessage,
+    ToolCallMessage,
+    ToolCallStatus,
+)
+from stream_trace import (
+    Trace,
+    TraceRecorder,
+    ReplayClient,
+    encode_message,
+    decode_message,
+    replay_client_factory,
+)
+
+
+def sample_messages():
+    """一轮对话的典型 SDK 消息"""
+    return [
+        PlanMessage(entries=[PlanEntry(content="读取文件", priority="high", status="pending")]),
+        ToolCallMessage(id="t1", label="read", icon=Icon(type="emoji", value="📄"),
+                        status=ToolCallStatus.COMPLETED, tool_name="read_file", args={"path": "a.py"}),
+        AssistantMessage(chunk=AssistantMessageChunk(text="你好"),
+                         agent_id="subagent-task-1-0-1", agent_info=AgentInfo(agent_id="subagent-task-1-0-1", agent_index=0)),
+        AssistantMessage(chunk=AssistantMessageChunk(text="!")),
+        TaskFinishMessage(stop_reason=StopReason.END_TURN),
+    ]
+
+
+class TestEncoding:
+    """消息编码测试"""
+
+    def test_round_trip(self):
+        """测试编码后还原为相等的 SDK 对象"""
+        for msg in sample_messages():
+            decoded = decode_message(encode_message(msg))
+            assert type(decoded) is type(msg)
+            assert decoded == msg
+
+    def test_enum_restored(self):
+        """测试枚举字段还原为枚举"""
+        decoded = decode_message(encode_message(TaskFinishMessage(stop_reason=StopReason.END_TURN)))
+        assert decoded.stop_reason is StopReason.END_TURN
+
+    def test_unknown_type(self):
+        """测试未知类型报错"""
+        with pytest.raises(ValueError):
+            decode_message({"_t": "NoSuchMessage"})
+
+
+class TestTraceFile:
+    """录制文件测试"""
+
+    @pytest.mark.parametrize("name", ["trace.jsonl", "trace.jsonl.gz"])
+    def test_save_and_load(self, tmp_path, name):
+        """测试保存后读取得到相同的消息和间隔"""
+        trace = Trace({"session_id": "s1"}, [(0.25, msg) for msg in sample_messages()])
+        path = str(tmp_path / name)
+        trace.save(path)
+
+        loaded = Trace.load(path)
+
+        assert loaded.header["session_id"] == "s1"
+        assert [msg for _, msg in loaded.events] == sample_messages()
+        assert loaded.duration == pytest.approx(1.25)
+
+    def test_reject_other_files(self, tmp_path):
+        """测试拒绝格式不符的文件"""
+        path = tmp_path / "other.jsonl"
+        path.write_text('{"role": "user"}\n')
+        with pytest.raises(ValueError):
+            Trace.load(str(path))
+
+    @pytest.mark.asyncio
+    async def test_recorder(self, tmp_path):
+        """测试录制器记录消息间隔并保存"""
+        recorder = TraceRecorder("s1/..", "prompt")
+        for msg in sample_messages():
+            recorder.record(msg)
+
+        path = await recorder.save(str(tmp_path))
+
+        assert path.startswith(str(tmp_path))
+        assert "/.." not in path
+        assert len(Trace.load(path).events) == 5
+
+    @pytest.mark.asyncio
+    async def test_recorder_skips_empty(self, tmp_path):
+        """测试没有消息时不保存"""
+        assert await TraceRecorder("s1", "prompt").save(str(tmp_path)) is None
+
+
+class TestReplayClient:
+    """回放客户端测试"""
+
+    async def _replay(self, client):
+        await client.send_message("hi")
+        return [msg async for msg in client.receive_messages()]
+
+    @pytest.mark.asyncio
+    async def test_replay_speed(self):
+        """测试按倍速回放"""
+        trace = Trace(events=[(0.1, msg) for msg in sample_messages()[:2]])
+
+        started = time.perf_counter()
+        messages = await self._replay(ReplayClient(trace, speed=4))
+        elapsed = time.perf_counter() - started
+
+        assert messages == sample_messages()[:2]
+        assert 0.04 <= elapsed < 0.2
+
+    @pytest.mark.asyncio
+    async def test_replay_max_speed(self):
+        """测试 speed=0 时不等待"""
+        trace = Trace(events=[(10.0, msg) for msg in sample_messages()])
+
+        started = time.perf_counter()
+        messages = await self._replay(ReplayClient(trace, speed=0))
+
+        assert len(messages) == 5
+        assert time.perf_counter() - started < 1
+
+    @pytest.mark.asyncio
+    @patch('iflow_manager.os.path.isdir')
+    @patch('iflow_manager.os.path.exists')
+    async def test_record_then_replay_session(self, mock_exists, mock_isdir, tmp_path, monkeypatch):
+        """测试录制真实会话的消息流后，回放得到相同的前端消息"""
+        import config
+        from iflow_manager import IFlowSession
+        mock_exists.return_value = True
+        mock_isdir.return_value = True
+        monkeypatch.setattr(config, "TRACE_DIR", str(tmp_path))
+
+        source = Trace(events=[(0.0, msg) for msg in sample_messages()])
+        monkeypatch.setattr(config, "TRACE_RECORD_ENABLED", True)
+        with patch('iflow_manager.IFlowClient', lambda options: ReplayClient(source, speed=0)):
+            session = IFlowSession("s1", str(tmp_path))
+            original = [r async for r in session.send_message("Hello")]
+
+        recorded = list(tmp_path.glob("s1-*.jsonl.gz"))
+        assert len(recorded) == 1
+
+        monkeypatch.setattr(config, "TRACE_RECORD_ENABLED", False)
+        with patch('iflow_manager.IFlowClient', replay_client_factory(str(recorded[0]), speed=0)):
+            session = IFlowSession("s2", str(tmp_path))
+            replayed = [r async for r in session.send_message("Hello")]
+
+        assert replayed == original
+        assert [r["type"] for r in replayed] == ["plan", "tool", "assistant", "assistant", "finish"]
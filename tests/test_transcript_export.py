@@ -0,0 +1,97 @@
+"""
+transcript_export.py 单元测试
+"""
+
+import gzip
+import io
+import json
+import os
+import zipfile
+import transcript_export
+from transcript_export import ndjson_lines, markdown_lines, gzip_chunks, export_session, export_archive
+from transcript_store import transcript_store
+
+SESSION = {
+    "session_id": "s1",
+    "title": "Demo",
+    "working_dir": "/tmp/demo",
+    "model": "glm-4.7",
+    "created_at": "2024-05-01T12:00:00",
+}
+
+
+class TestRenderers:
+    """渲染函数测试"""
+
+    def test_ndjson(self):
+        """测试 NDJSON 第一行是会话信息，之后每行一条消息"""
+        lines = list(ndjson_lines(SESSION, [{"role": "user", "content": "hi\nthere", "ts": 1.0}]))
+
+        assert json.loads(lines[0]) == {"type": "session", **SESSION}
+        assert json.loads(lines[1]) == {"type": "message", "role": "user", "content": "hi\nthere", "ts": 1.0}
+        assert all(line.endswith("\n") and line.count("\n") == 1 for line in lines)
+
+    def test_markdown(self):
+        """测试 Markdown 包含标题、会话信息和角色小节"""
+        text = "".join(markdown_lines(SESSION, [
+            {"role": "user", "content": "你好", "ts": 1714550400.0},
+            {"role": "assistant", "content": "Hello!\n"},
+        ]))
+
+        assert text.startswith("# Demo\n")
+        assert "- 会话 ID: `s1`" in text
+        assert "## 用户 · 2024-05-01" in text
+        assert "## 助手\n\nHello!\n" in text
+
+    def test_gzip_chunks(self):
+        """测试流式 gzip 可以完整解压"""
+        chunks = [b"line %d\n" % i for i in range(1000)]
+
+        assert gzip.decompress(b"".join(gzip_chunks(chunks, level=1))) == b"".join(chunks)
+
+
+class TestExport:
+    """导出流测试"""
+
+    def test_export_session_is_chunked(self, monkeypatch):
+        """测试大记录按块输出"""
+        monkeypatch.setattr(transcript_export.config, "EXPORT_CHUNK_SIZE", 1024)
+        transcript_store.append_sync("s1", [{"role": "user", "content": "x" * 100, "ts": 0} for _ in range(100)])
+
+        chunks = list(export_session(SESSION, "ndjson"))
+
+        assert len(chunks) > 5
+        assert all(len(chunk) < 1024 + 200 for chunk in chunks)
+        assert len(b"".join(chunks).splitlines()) == 101
+
+    def test_export_missing_transcript(self):
+        """测试没有记录时只输出会话信息"""
+        lines = gzip.decompress(b"".join(export_session(SESSION, "ndjson", compress=True))).splitlines()
+
+        assert len(lines) == 1
+        assert json.loads(lines[0])["title"] == "Demo"
+
+    def test_export_archive(self):
+        """测试 zip 归档包含每个会话的文件"""
+        transcript_store.append_sync("s1", [{"role": "user", "content": "one", "ts": 0}])
+        transcript_store.append_sync("s2", [{"role": "assistant", "content": "two", "ts": 0}])
+        sessions = [SESSION, {**SESSION, "session_id": "s2", "title": "Other"}]
+
+        data = b"".join(export_archive(sessions, "markdown"))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.testzip() is None
+            assert archive.namelist() == ["s1.md", "s2.md"]
+            assert "one" in archive.read("s1.md").decode("utf-8")
+            assert archive.read("s2.md").decode("utf-8").startswith("# Other")
+
+    def test_export_archive_is_streamed(self, monkeypatch):
+        """测试归档边写边输出，而不是最后一次性输出"""
+        monkeypatch.setattr(transcript_export.config, "EXPORT_CHUNK_SIZE", 1024)
+        # 使用难以压缩的内容，保证压缩后的数据也超过 zlib 的内部缓冲
+        entries = [{"role": "user", "content": os.urandom(2000).hex(), "ts": 0} for _ in range(100)]
+        transcript_store.append_sync("s1", entries)
+
+        chunks = [chunk for chunk in export_archive([SESSION], "ndjson") if chunk]
+
+        assert len(chunks) > 3
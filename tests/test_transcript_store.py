@@ -0,0 +1,91 @@
+"""
+transcript_store.py 单元测试
+"""
+
+import pytest
+from transcript_store import TranscriptStore, build_replay_prompt
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    创建临时目录中的记录存储
+    """
+    return TranscriptStore(base_dir=str(tmp_path / "transcripts"))
+
+
+class TestTranscriptStore:
+    """TranscriptStore 类测试"""
+
+    @pytest.mark.asyncio
+    async def test_append_and_read(self, store):
+        """测试追加和读取记录"""
+        await store.append("s1", "user", "你好")
+        await store.append("s1", "assistant", "Hello!")
+
+        entries = await store.read("s1")
+
+        assert [(e["role"], e["content"]) for e in entries] == [("user", "你好"), ("assistant", "Hello!")]
+
+    @pytest.mark.asyncio
+    async def test_read_missing(self, store):
+        """测试读取不存在的记录"""
+        assert await store.read("missing") == []
+
+    def test_iter_sync(self, store):
+        """测试逐行读取记录并跳过损坏的行"""
+        store.append_sync("s1", [{"role": "user", "content": "a"}])
+        with open(store.path("s1"), "a", encoding="utf-8") as f:
+            f.write("not json\n")
+        store.append_sync("s1", [{"role": "assistant", "content": "b"}])
+
+        assert [e["content"] for e in store.iter_sync("s1")] == ["a", "b"]
+        assert list(store.iter_sync("missing")) == []
+
+    @pytest.mark.asyncio
+    async def test_delete(self, store):
+        """测试删除记录"""
+        await store.append("s1", "user", "hi")
+        await store.delete("s1")
+        await store.delete("s1")
+
+        assert await store.read("s1") == []
+
+    def test_rejects_path_traversal(self, store):
+        """测试拒绝包含路径字符的会话 ID"""
+        with pytest.raises(ValueError):
+            store.path("../etc/passwd")
+
+    def test_skips_corrupt_lines(self, store):
+        """测试跳过损坏的行"""
+        store.append_sync("s1", [{"role": "user", "content": "ok"}])
+        with open(store.path("s1"), "a", encoding="utf-8") as f:
+            f.write("{not json\n")
+
+        assert len(store.read_sync("s1")) == 1
+
+
+class TestBuildReplayPrompt:
+    """build_replay_prompt 函数测试"""
+
+    def test_no_history(self):
+        """测试没有历史记录时返回原消息"""
+        assert build_replay_prompt([], "next") == "next"
+
+    def test_includes_history(self):
+        """测试包含历史记录并以新消息结尾"""
+        entries = [{"role": "user", "content": "写个函数"}, {"role": "assistant", "content": "好的"}]
+
+        prompt = build_replay_prompt(entries, "继续", max_chars=1000)
+
+        assert "用户: 写个函数\n助手: 好的" in prompt
+        assert prompt.endswith("继续")
+
+    def test_keeps_most_recent_within_limit(self):
+        """测试超出上限时保留最近的记录"""
+        entries = [{"role": "user", "content": f"message {i} " + "x" * 50} for i in range(100)]
+
+        prompt = build_replay_prompt(entries, "next", max_chars=500)
+
+        assert "message 99" in prompt
+        assert "message 0 " not in prompt
@@ -0,0 +1,126 @@
+"""
+usage_stats.py 单元测试
+"""
+
+import json
+import pytest
+from unittest.mock import Mock
+from iflow_sdk.types import AssistantMessage, ToolCallMessage, TaskFinishMessage, StopReason, Icon
+from usage_stats import TurnUsage, UsageTracker
+
+
+def assistant(text: str) -> AssistantMessage:
+    chunk = Mock()
+    chunk.text = text
+    return AssistantMessage(chunk=chunk)
+
+
+def tool_call(call_id: str, tool_name: str, status: str = "pending") -> ToolCallMessage:
+    return ToolCallMessage(id=call_id, label=tool_name, icon=Icon(type="emoji", value="🔧"), tool_name=tool_name, status=status)
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    """
+    创建写入临时文件的用量统计
+    """
+    return UsageTracker(path=str(tmp_path / "usage.json"))
+
+
+class TestTurnUsage:
+    """TurnUsage 类测试"""
+
+    def test_observe(self):
+        """测试累计文本、工具调用和结束原因"""
+        turn = TurnUsage()
+        turn.observe(assistant("你好"))
+        turn.observe(assistant("!"))
+        turn.observe(tool_call("t1", "read_file"))
+        turn.observe(tool_call("t1", "read_file", "completed"))
+        turn.observe(tool_call("t2", "read_file"))
+        turn.observe(tool_call("t3", "run_shell"))
+        turn.observe(TaskFinishMessage(stop_reason=StopReason.MAX_TOKENS))
+
+        assert turn.chars == 3
+        assert turn.bytes == len("你好!".encode("utf-8"))
+        assert turn.tool_calls == {"read_file": 2, "run_shell": 1}
+        assert turn.outcome == "max_tokens"
+        assert turn.time_to_first_token is not None
+
+    def test_token_usage(self):
+        """测试消息带有 usage 字段时累计 token 用量"""
+        turn = TurnUsage()
+        finish = TaskFinishMessage(stop_reason=StopReason.END_TURN)
+        finish.usage = {"input_tokens": 120, "output_tokens": 30, "model": "x"}
+        turn.observe(finish)
+
+        assert turn.tokens == {"input_tokens": 120, "output_tokens": 30}
+
+    def test_no_text(self):
+        """测试没有文本输出时首字延迟为 None"""
+        assert TurnUsage().time_to_first_token is None
+
+
+class TestUsageTracker:
+    """UsageTracker 类测试"""
+
+    def _turn(self, text: str = "abc", tools: tuple = ()) -> TurnUsage:
+        turn = TurnUsage()
+        turn.observe(assistant(text))
+        for index, name in enumerate(tools):
+            turn.observe(tool_call(f"t{index}", name))
+        return turn
+
+    def test_record_turn(self, tracker):
+        """测试按会话和按模型累计"""
+        tracker.record_turn("s1", "glm-4.7", self._turn("abc", ("read_file",)))
+        tracker.record_turn("s1", "glm-4.7", self._turn("de", ("read_file", "edit")))
+        tracker.record_turn("s2", None, self._turn("f"))
+
+        s1 = tracker.session_usage("s1")
+        assert s1["turns"] == 2
+        assert s1["chars"] == 5
+        assert s1["tool_calls"] == {"read_file": 2, "edit": 1}
+        assert s1["model"] == "glm-4.7"
+        assert set(tracker.models) == {"glm-4.7", "default"}
+        totals = tracker.totals()
+        assert totals["turns"] == 3
+        assert totals["chars"] == 6
+        assert totals["tool_calls"] == 3
+
+    def test_forget_session(self, tracker):
+        """测试删除会话时保留模型累计值"""
+        tracker.record_turn("s1", "glm-4.7", self._turn())
+        tracker.forget_session("s1")
+
+        assert tracker.session_usage("s1")["turns"] == 0
+        assert tracker.models["glm-4.7"]["turns"] == 1
+
+    @pytest.mark.asyncio
+    async def test_save_and_load(self, tracker):
+        """测试只在有变化时写入，并能重新读取"""
+        assert await tracker.save() is False
+        tracker.record_turn("s1", "glm-4.7", self._turn("abc", ("read_file",)))
+        assert await tracker.save() is True
+        assert await tracker.save() is False
+
+        restored = UsageTracker(path=tracker.path)
+        await restored.load()
+
+        assert restored.session_usage("s1")["tool_calls"] == {"read_file": 1}
+        assert restored.since == tracker.since
+        # 读取后继续累计
+        restored.record_turn("s1", "glm-4.7", self._turn())
+        assert restored.session_usage("s1")["turns"] == 2
+
+    def test_load_corrupt(self, tracker):
+        """测试文件损坏或版本不符时从零开始"""
+        with open(tracker.path, "w", encoding="utf-8") as f:
+            f.write("{not json")
+        tracker.load_sync()
+        assert tracker.models == {}
+
+        with open(tracker.path, "w", encoding="utf-8") as f:
+            json.dump({"version": 99, "models": {"x": {}}}, f)
+        tracker.load_sync()
+        assert tracker.models == {}
@@ -89,6 +89,69 @@ class TestConnectionManager:
 
         assert session_id == "test-session-123"
 
+    @pytest.mark.asyncio
+    async def test_session_index(self, connection_manager):
+        """测试按会话索引连接并发送消息"""
+        first, second, other = _make_websocket(), _make_websocket(), _make_websocket()
+        await connection_manager.connect(first, "s1")
+        await connection_manager.connect(second, "s1")
+        await connection_manager.connect(other, "s2")
+
+        await connection_manager.send_to_session("s1", {"type": "test"})
+
+        first.send_json.assert_awaited_once_with({"type": "test"})
+        second.send_json.assert_awaited_once_with({"type": "test"})
+        other.send_json.assert_not_awaited()
+
+        connection_manager.disconnect(first)
+        connection_manager.disconnect(second)
+        assert "s1" not in connection_manager.session_connections
+        assert connection_manager.get_connections("s2") == [other]
+
+    @pytest.mark.asyncio
+    async def test_global_limit(self):
+        """测试超过全局连接数时拒绝握手"""
+        connection_manager = ConnectionManager(max_connections=1, max_per_ip=0)
+        first, second = _make_websocket("10.0.0.1"), _make_websocket("10.0.0.2")
+
+        assert await connection_manager.accept(first) is True
+        assert await connection_manager.accept(second) is False
+
+        second.accept.assert_not_awaited()
+        second.close.assert_awaited_once_with(code=1013)
+        assert second not in connection_manager.active_connections
+        assert connection_manager.snapshot()["rejected"] == {"global_limit": 1}
+
+    @pytest.mark.asyncio
+    async def test_per_ip_limit(self):
+        """测试单个 IP 的连接数限制，断开后释放名额"""
+        connection_manager = ConnectionManager(max_connections=0, max_per_ip=1)
+        first, second, other = _make_websocket("10.0.0.1"), _make_websocket("10.0.0.1"), _make_websocket("10.0.0.2")
+
+        assert await connection_manager.accept(first) is True
+        assert await connection_manager.accept(second) is False
+        assert await connection_manager.accept(other) is True
+
+        connection_manager.disconnect(first)
+        assert "10.0.0.1" not in connection_manager.ip_connections
+        assert await connection_manager.accept(second) is True
+
+        stats = connection_manager.snapshot()
+        assert stats["active"] == 2
+        assert stats["peak"] == 2
+        assert stats["accepted"] == 3
+        assert stats["rejected"] == {"ip_limit": 1}
+
+
+def _make_websocket(host="127.0.0.1"):
+    """创建指定客户端地址的模拟 WebSocket"""
+    websocket = Mock(spec=WebSocket)
+    websocket.client = Mock(host=host)
+    websocket.accept = AsyncMock()
+    websocket.send_json = AsyncMock()
+    websocket.close = AsyncMock()
+    return websocket
+
 
 @pytest.mark.skip(reason="WebSocket 集成测试需要更复杂的设置")
 class TestHandleWebsocket:
@@ -0,0 +1,185 @@
+"""
+对话记录导出模块
+把会话记录逐行渲染为 NDJSON 或 Markdown，并可即时 gzip 压缩，或把多个会话打包为 zip 归档；
+全部以同步生成器实现，由 StreamingResponse 在线程池中迭代，内存占用与记录大小无关
+"""
+
+import json
+import time
+import zipfile
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator
+from transcript_store import transcript_store, ROLE_LABELS
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 格式 -> (文件扩展名, Content-Type)
+EXPORT_FORMATS = {
+    "ndjson": (".ndjson", "application/x-ndjson"),
+    "markdown": (".md", "text/markdown; charset=utf-8"),
+}
+
+
+def _format_ts(ts) -> str:
+    try:
+        return datetime.fromtimestamp(float(ts)).isoformat(sep=" ", timespec="seconds")
+    except (TypeError, ValueError, OverflowError, OSError):
+        return ""
+
+
+def ndjson_lines(session: dict, entries: Iterable[dict]) -> Iterator[str]:
+    """
+    渲染为 NDJSON：第一行是会话信息，之后每行一条消息
+
+    Args:
+        session: 会话信息（Session.to_dict()）
+        entries: 对话记录
+
+    Yields:
+        str: 以换行结尾的 JSON 行
+    """
+    yield json.dumps({"type": "session", **session}, ensure_ascii=False) + "\n"
+    for entry in entries:
+        yield json.dumps({"type": "message", **entry}, ensure_ascii=False) + "\n"
+
+
+def markdown_lines(session: dict, entries: Iterable[dict]) -> Iterator[str]:
+    """
+    渲染为 Markdown：标题和会话信息，之后每条消息一个小节
+
+    Args:
+        session: 会话信息（Session.to_dict()）
+        entries: 对话记录
+
+    Yields:
+        str: Markdown 文本片段
+    """
+    yield f"# {session.get('title') or session.get('session_id')}\n\n"
+    yield f"- 会话 ID: `{session.get('session_id')}`\n"
+    yield f"- 工作目录: `{session.get('working_dir')}`\n"
+    yield f"- 模型: {session.get('model')}\n"
+    yield f"- 创建时间: {session.get('created_at')}\n"
+    for entry in entries:
+        role = ROLE_LABELS.get(entry.get("role"), entry.get("role"))
+        timestamp = _format_ts(entry.get("ts"))
+        heading = f"{role} · {timestamp}" if timestamp else role
+        yield f"\n## {heading}\n\n{entry.get('content', '').rstrip()}\n"
+
+
+_RENDERERS = {"ndjson": ndjson_lines, "markdown": markdown_lines}
+
+
+def _chunked(pieces: Iterable[str], size: int) -> Iterator[bytes]:
+    """把文本片段编码并合并为约 size 字节的块，减少响应的写入次数"""
+    buffer, buffered = [], 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = None) -> Iterator[bytes]:
+    """
+    即时 gzip 压缩字节流
+
+    Args:
+        chunks: 原始字节块
+        level: 压缩级别，默认使用 EXPORT_GZIP_LEVEL
+
+    Yields:
+        bytes: gzip 格式的字节块
+    """
+    compressor = zlib.compressobj(level if level is not None else config.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def render_session(session: dict, fmt: str) -> Iterator[bytes]:
+    """
+    逐行读取会话记录并渲染为字节块（未压缩）
+
+    Args:
+        session: 会话信息（Session.to_dict()）
+        fmt: ndjson 或 markdown
+
+    Returns:
+        Iterator[bytes]: 约 EXPORT_CHUNK_SIZE 字节的块
+    """
+    entries = transcript_store.iter_sync(session["session_id"])
+    return _chunked(_RENDERERS[fmt](session, entries), config.EXPORT_CHUNK_SIZE)
+
+
+def export_session(session: dict, fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """
+    导出单个会话
+
+    Args:
+        session: 会话信息（Session.to_dict()）
+        fmt: ndjson 或 markdown
+        compress: 是否 gzip 压缩
+
+    Returns:
+        Iterator[bytes]: 响应体字节流
+    """
+    chunks = render_session(session, fmt)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+class _StreamSink:
+    """zipfile 的输出目标：只支持顺序写入，写入的数据由生成器取走"""
+
+    def __init__(self):
+        self._buffer: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._buffer.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def export_archive(sessions: Iterable[dict], fmt: str) -> Iterator[bytes]:
+    """
+    把多个会话导出为 zip 归档（每个会话一个文件），边写边输出
+
+    Args:
+        sessions: 会话信息列表
+        fmt: ndjson 或 markdown
+
+    Yields:
+        bytes: zip 格式的字节块
+    """
+    extension = EXPORT_FORMATS[fmt][0]
+    sink = _StreamSink()
+    # 输出不可回退，zipfile 会在每个文件后写入数据描述符；大小未知，统一使用 ZIP64
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for session in sessions:
+            info = zipfile.ZipInfo(f"{session['session_id']}{extension}", date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, "w", force_zip64=True) as f:
+                for chunk in render_session(session, fmt):
+                    f.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
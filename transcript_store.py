@@ -0,0 +1,210 @@
+"""
+会话记录模块
+把每个会话的对话记录追加写入 JSONL 文件，用于休眠会话恢复时重放上下文
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Iterator, Optional
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 会话 ID 只允许这些字符，防止路径穿越
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+ROLE_LABELS = {"user": "用户", "assistant": "助手"}
+
+
+class TranscriptStore:
+    """基于 JSONL 文件的对话记录存储，每个会话一个文件"""
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir if base_dir is not None else config.TRANSCRIPT_DIR
+
+    def path(self, session_id: str) -> str:
+        """
+        获取会话记录文件路径
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            str: 文件路径
+        """
+        if not _SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.base_dir, f"{session_id}.jsonl")
+
+    def append_sync(self, session_id: str, entries: list[dict]) -> None:
+        """
+        追加记录（同步，在线程中调用）
+
+        Args:
+            session_id: 会话 ID
+            entries: 记录列表，每条包含 role 和 content
+        """
+        os.makedirs(self.base_dir, exist_ok=True)
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with open(self.path(session_id), "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def read_sync(self, session_id: str) -> list[dict]:
+        """
+        读取会话的全部记录（同步，在线程中调用）
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            list[dict]: 记录列表，文件不存在时返回空列表
+        """
+        try:
+            with open(self.path(session_id), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping corrupt transcript line for session {session_id}")
+        return entries
+
+    def iter_sync(self, session_id: str) -> Iterator[dict]:
+        """
+        逐行读取会话记录（同步生成器，在线程中迭代），内存占用与记录大小无关
+
+        Args:
+            session_id: 会话 ID
+
+        Yields:
+            dict: 记录，文件不存在时不产生任何记录
+        """
+        try:
+            f = open(self.path(session_id), "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt transcript line for session {session_id}")
+
+    def delete_sync(self, session_id: str) -> None:
+        """
+        删除会话记录（同步，在线程中调用）
+
+        Args:
+            session_id: 会话 ID
+        """
+        try:
+            os.remove(self.path(session_id))
+        except FileNotFoundError:
+            pass
+
+    async def append(self, session_id: str, role: str, content: str) -> None:
+        """
+        追加一条记录
+
+        Args:
+            session_id: 会话 ID
+            role: user 或 assistant
+            content: 消息内容
+        """
+        entry = {"role": role, "content": content, "ts": time.time()}
+        await asyncio.to_thread(self.append_sync, session_id, [entry])
+
+    def has_entries_sync(self, session_id: str) -> bool:
+        """
+        会话是否已有记录（同步，在线程中调用）
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            bool: 记录文件存在且非空
+        """
+        try:
+            return os.path.getsize(self.path(session_id)) > 0
+        except OSError:
+            return False
+
+    async def has_entries(self, session_id: str) -> bool:
+        """
+        会话是否已有记录
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            bool: 记录文件存在且非空
+        """
+        return await asyncio.to_thread(self.has_entries_sync, session_id)
+
+    async def read(self, session_id: str) -> list[dict]:
+        """
+        读取会话的全部记录
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            list[dict]: 记录列表
+        """
+        return await asyncio.to_thread(self.read_sync, session_id)
+
+    async def delete(self, session_id: str) -> None:
+        """
+        删除会话记录
+
+        Args:
+            session_id: 会话 ID
+        """
+        await asyncio.to_thread(self.delete_sync, session_id)
+
+
+def build_replay_prompt(entries: list[dict], message: str, max_chars: Optional[int] = None) -> str:
+    """
+    构建带有历史上下文的提示词：从最近的记录开始向前收集，直到达到字符上限
+
+    Args:
+        entries: 会话记录
+        message: 新的用户消息
+        max_chars: 历史上下文的字符上限
+
+    Returns:
+        str: 提示词，没有历史记录时返回原消息
+    """
+    max_chars = max_chars if max_chars is not None else config.HIBERNATE_REPLAY_MAX_CHARS
+    entry_limit = max(max_chars // 4, 200)  # 单条记录的截断长度，避免一条长回复占满上下文
+    lines = []
+    used = 0
+    for entry in reversed(entries):
+        content = entry.get("content", "")
+        if len(content) > entry_limit:
+            content = content[:entry_limit] + "…"
+        line = f"{ROLE_LABELS.get(entry.get('role'), entry.get('role'))}: {content}"
+        if used + len(line) > max_chars:
+            break
+        lines.append(line)
+        used += len(line)
+
+    if not lines:
+        return message
+    history = "\n".join(reversed(lines))
+    return (
+        "以下是本会话此前的对话记录（可能已截断），请在此基础上继续：\n"
+        f"<transcript>\n{history}\n</transcript>\n\n"
+        f"{message}"
+    )
+
+
+# 全局会话记录存储实例
+transcript_store = TranscriptStore()
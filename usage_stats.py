@@ -0,0 +1,252 @@
+"""
+用量统计模块
+按会话和按模型累计对话轮数、流式输出的字符数和字节数、各工具的调用次数、耗时以及 SDK 报告的 token 用量；
+每轮先在 TurnUsage 中局部累计，结束时一次合并到全局计数，并定期写入 JSON 文件
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Optional
+from iflow_sdk.types import AssistantMessage, ToolCallMessage, TaskFinishMessage
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+USAGE_VERSION = 1
+
+
+class TurnUsage:
+    """一轮对话的用量，由消息循环逐条累计"""
+
+    __slots__ = ("started", "first_token_at", "finished_at", "chars", "bytes", "tool_calls", "tokens", "_tool_ids", "outcome")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chars = 0
+        self.bytes = 0
+        self.tool_calls: Counter = Counter()
+        self.tokens: Counter = Counter()
+        self._tool_ids: set = set()
+        self.outcome = "completed"
+
+    def observe(self, msg: Any) -> None:
+        """
+        累计一条 SDK 消息
+
+        Args:
+            msg: SDK 消息
+        """
+        if isinstance(msg, AssistantMessage):
+            self.observe_text(getattr(msg.chunk, "text", None) or "")
+        elif isinstance(msg, ToolCallMessage):
+            # 同一个工具调用会随状态变化多次推送，按 id 只计一次
+            key = msg.id or id(msg)
+            if key not in self._tool_ids:
+                self._tool_ids.add(key)
+                self.tool_calls[msg.tool_name or msg.label or "unknown"] += 1
+        elif isinstance(msg, TaskFinishMessage):
+            stop_reason = getattr(msg, "stop_reason", None)
+            if stop_reason is not None:
+                self.outcome = getattr(stop_reason, "value", str(stop_reason))
+        # 当前 SDK 不报告 token 用量；若消息带有 usage 字段（例如新版 SDK 的 TaskFinishMessage），按数值字段累计
+        usage = getattr(msg, "usage", None)
+        if isinstance(usage, dict):
+            for name, value in usage.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.tokens[name] += value
+
+    def observe_text(self, text: str) -> None:
+        """
+        累计一个文本分块（回放缓存的响应时直接按帧内容累计）
+
+        Args:
+            text: 文本分块
+        """
+        if text:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            self.chars += len(text)
+            self.bytes += len(text.encode("utf-8"))
+
+    @property
+    def wall_time(self) -> float:
+        """本轮耗时（秒），未结束时计算到当前"""
+        return (self.finished_at or time.monotonic()) - self.started
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """首个文本分块的延迟（秒），没有文本输出时为 None"""
+        return self.first_token_at - self.started if self.first_token_at is not None else None
+
+
+def _empty() -> dict:
+    return {"turns": 0, "chars": 0, "bytes": 0, "wall_time": 0.0, "tool_calls": {}, "tokens": {}, "outcomes": {}}
+
+
+def _merge(totals: dict, turn: TurnUsage) -> None:
+    totals["turns"] += 1
+    totals["chars"] += turn.chars
+    totals["bytes"] += turn.bytes
+    totals["wall_time"] += turn.wall_time
+    for field, counts in (("tool_calls", turn.tool_calls), ("tokens", turn.tokens)):
+        target = totals[field]
+        for name, value in counts.items():
+            target[name] = target.get(name, 0) + value
+    totals["outcomes"][turn.outcome] = totals["outcomes"].get(turn.outcome, 0) + 1
+
+
+class UsageTracker:
+    """按会话和按模型累计用量，定期持久化"""
+
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else config.USAGE_PATH
+        self.sessions: dict[str, dict] = {}
+        self.models: dict[str, dict] = {}
+        self.since = time.time()
+        self._dirty = False
+
+    def record_turn(self, session_id: str, model: Optional[str], turn: TurnUsage) -> None:
+        """
+        把一轮的用量合并到会话和模型的累计值
+
+        Args:
+            session_id: 会话 ID
+            model: 模型名称
+            turn: 本轮用量
+        """
+        if turn.finished_at is None:
+            turn.finished_at = time.monotonic()
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = _empty()
+        session["model"] = model
+        session["last_turn_at"] = time.time()
+        _merge(session, turn)
+        model_key = model or "default"
+        totals = self.models.get(model_key)
+        if totals is None:
+            totals = self.models[model_key] = _empty()
+        _merge(totals, turn)
+        self._dirty = True
+
+    def forget_session(self, session_id: str) -> None:
+        """
+        删除会话的累计值（模型累计值保留）
+
+        Args:
+            session_id: 会话 ID
+        """
+        if self.sessions.pop(session_id, None) is not None:
+            self._dirty = True
+
+    def session_usage(self, session_id: str) -> dict:
+        """
+        获取会话的累计用量
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            dict: 累计用量，没有记录时各项为 0
+        """
+        return self.sessions.get(session_id) or _empty()
+
+    def totals(self) -> dict:
+        """
+        所有模型的合计
+
+        Returns:
+            dict: 轮数、字符数、字节数、耗时、工具调用次数和 token 用量
+        """
+        result = {"turns": 0, "chars": 0, "bytes": 0, "wall_time": 0.0, "tool_calls": 0, "tokens": {}}
+        for totals in self.models.values():
+            for field in ("turns", "chars", "bytes", "wall_time"):
+                result[field] += totals[field]
+            result["tool_calls"] += sum(totals["tool_calls"].values())
+            for name, value in totals["tokens"].items():
+                result["tokens"][name] = result["tokens"].get(name, 0) + value
+        result["wall_time"] = round(result["wall_time"], 3)
+        return result
+
+    def reset(self) -> None:
+        """清空全部计数（测试使用）"""
+        self.sessions.clear()
+        self.models.clear()
+        self.since = time.time()
+        self._dirty = False
+
+    # ---- 持久化 ----
+
+    def load_sync(self) -> None:
+        """读取持久化的累计值（同步，在线程中调用），文件不存在或损坏时从零开始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable usage file {self.path}: {e}")
+            return
+        if data.get("version") != USAGE_VERSION:
+            logger.warning(f"Ignoring usage file {self.path} with unsupported version")
+            return
+        self.sessions = data.get("sessions", {})
+        self.models = data.get("models", {})
+        self.since = data.get("since", self.since)
+
+    def _serialize(self) -> str:
+        data = {"version": USAGE_VERSION, "since": self.since, "sessions": self.sessions, "models": self.models}
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    def _write(self, payload: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def save_sync(self) -> None:
+        """原子地写入累计值（同步）"""
+        self._write(self._serialize())
+
+    async def load(self) -> None:
+        """读取持久化的累计值"""
+        await asyncio.to_thread(self.load_sync)
+
+    async def save(self) -> bool:
+        """
+        有变化时写入文件
+
+        Returns:
+            bool: 是否写入
+        """
+        if not self._dirty:
+            return False
+        self._dirty = False
+        # 在事件循环中序列化（避免线程写入时字典被修改），只把文件写入放到线程中
+        payload = self._serialize()
+        try:
+            await asyncio.to_thread(self._write, payload)
+        except OSError as e:
+            self._dirty = True
+            logger.warning(f"Failed to save usage stats to {self.path}: {e}")
+            return False
+        return True
+
+    async def run_persistence(self) -> None:
+        """
+        后台任务：定期把有变化的累计值写入文件
+        """
+        while True:
+            await asyncio.sleep(config.USAGE_FLUSH_INTERVAL)
+            await self.save()
+
+
+# 全局用量统计实例
+usage_tracker = UsageTracker()
@@ -5,43 +5,149 @@ WebSocket 消息处理模块
 
 import json
 import asyncio
+from collections import Counter
+from typing import Optional
 from fastapi import WebSocket, WebSocketDisconnect
 from iflow_manager import iflow_manager
 from session_manager import session_manager
+from response_cache import response_cache, compute_fingerprint
+from log_setup import LogSampler, redact_body
+from file_watcher import file_watchers
+from rate_limiter import rate_limiter, client_identity, rate_limit_message, PROMPT
+from agent_channels import AgentRouter
 import logging
 import config
 
-logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# 流式分块日志限速，避免日志开销随响应长度增长
+chunk_log_sampler = LogSampler(config.LOG_CHUNK_INTERVAL)
+
 
 class ConnectionManager:
-    """WebSocket 连接管理器"""
+    """
+    WebSocket 连接管理器
+    所有连接在这里登记（字典索引，增删均为 O(1)），接受连接时执行全局和单 IP 的连接数限制
+    """
 
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    def __init__(self, max_connections: int = None, max_per_ip: int = None):
+        self.max_connections = config.WS_MAX_CONNECTIONS if max_connections is None else max_connections
+        self.max_per_ip = config.WS_MAX_CONNECTIONS_PER_IP if max_per_ip is None else max_per_ip
+        self.active_connections: dict[WebSocket, str] = {}  # WebSocket -> 客户端 IP
         self.connection_sessions: dict[WebSocket, str] = {}  # WebSocket -> session_id
+        self.session_connections: dict[str, set[WebSocket]] = {}  # session_id -> WebSocket 集合
+        self.ip_connections: Counter = Counter()  # 客户端 IP -> 连接数
+        self.accepted = 0
+        self.peak = 0
+        self.rejected: Counter = Counter()  # 拒绝原因 -> 次数
+
+    @staticmethod
+    def client_ip(websocket: WebSocket) -> str:
+        """获取客户端 IP"""
+        client = websocket.client
+        return client.host if client else "unknown"
+
+    def admission_error(self, ip: str) -> Optional[str]:
+        """
+        检查是否还能接受来自该 IP 的连接
+
+        Args:
+            ip: 客户端 IP
+
+        Returns:
+            str: 拒绝原因（global_limit 或 ip_limit），允许时返回 None
+        """
+        if self.max_connections and len(self.active_connections) >= self.max_connections:
+            return "global_limit"
+        if self.max_per_ip and self.ip_connections[ip] >= self.max_per_ip:
+            return "ip_limit"
+        return None
+
+    async def accept(self, websocket: WebSocket) -> bool:
+        """
+        执行准入检查并接受连接，超出限制时拒绝握手
+
+        Args:
+            websocket: WebSocket 连接
+
+        Returns:
+            bool: 是否已接受
+        """
+        ip = self.client_ip(websocket)
+        reason = self.admission_error(ip)
+        if reason:
+            self.rejected[reason] += 1
+            logger.warning(f"Rejecting WebSocket from {ip}: {reason} "
+                           f"({len(self.active_connections)} active, {self.ip_connections[ip]} from this IP)")
+            # 握手前关闭，客户端收到 HTTP 403
+            await websocket.close(code=1013)
+            return False
 
-    async def connect(self, websocket: WebSocket, session_id: str) -> None:
-        """接受新的 WebSocket 连接"""
-        await websocket.accept()
-        self.active_connections.append(websocket)
+        # 先登记再 accept，避免并发握手同时通过检查
+        self.active_connections[websocket] = ip
+        self.ip_connections[ip] += 1
+        try:
+            await websocket.accept()
+        except Exception:
+            self.disconnect(websocket)
+            raise
+        self.accepted += 1
+        self.peak = max(self.peak, len(self.active_connections))
+        return True
+
+    def bind(self, websocket: WebSocket, session_id: str) -> None:
+        """
+        将已接受的连接关联到会话
+
+        Args:
+            websocket: WebSocket 连接
+            session_id: 会话 ID
+        """
         self.connection_sessions[websocket] = session_id
+        self.session_connections.setdefault(session_id, set()).add(websocket)
         logger.info(f"WebSocket connected for session {session_id}. Total connections: {len(self.active_connections)}")
 
+    async def connect(self, websocket: WebSocket, session_id: str) -> bool:
+        """接受新的 WebSocket 连接并关联到会话"""
+        if not await self.accept(websocket):
+            return False
+        self.bind(websocket, session_id)
+        return True
+
     def disconnect(self, websocket: WebSocket) -> None:
         """断开 WebSocket 连接"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if websocket in self.connection_sessions:
-            session_id = self.connection_sessions[websocket]
-            del self.connection_sessions[websocket]
+        ip = self.active_connections.pop(websocket, None)
+        if ip is not None:
+            self.ip_connections[ip] -= 1
+            if self.ip_connections[ip] <= 0:
+                del self.ip_connections[ip]
+        session_id = self.connection_sessions.pop(websocket, None)
+        if session_id is not None:
+            sockets = self.session_connections.get(session_id)
+            if sockets is not None:
+                sockets.discard(websocket)
+                if not sockets:
+                    del self.session_connections[session_id]
         logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
 
     def get_session_id(self, websocket: WebSocket) -> str:
         """获取 WebSocket 对应的会话 ID"""
         return self.connection_sessions.get(websocket)
 
+    def get_connections(self, session_id: str) -> list[WebSocket]:
+        """获取会话的所有 WebSocket 连接"""
+        return list(self.session_connections.get(session_id, ()))
+
+    async def send_to_session(self, session_id: str, message: dict) -> None:
+        """发送消息给会话的所有 WebSocket 连接"""
+        for websocket in self.get_connections(session_id):
+            await self.send_message(websocket, message)
+
+    async def broadcast(self, message: dict) -> None:
+        """发送消息给所有已关联会话的 WebSocket 连接"""
+        for websocket in list(self.connection_sessions):
+            await self.send_message(websocket, message)
+
     async def send_message(self, websocket: WebSocket, message: dict) -> None:
         """发送消息给指定的 WebSocket"""
         try:
@@ -50,6 +156,24 @@ class ConnectionManager:
             logger.error(f"Error sending message: {e}")
             self.disconnect(websocket)
 
+    def snapshot(self) -> dict:
+        """
+        获取连接统计
+
+        Returns:
+            dict: 当前连接数、会话数、峰值、累计接受和拒绝次数、限制
+        """
+        return {
+            "active": len(self.active_connections),
+            "sessions": len(self.session_connections),
+            "unique_ips": len(self.ip_connections),
+            "peak": self.peak,
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+            "max_connections": self.max_connections,
+            "max_per_ip": self.max_per_ip,
+        }
+
 
 # 全局连接管理器
 manager = ConnectionManager()
@@ -62,12 +186,16 @@ async def handle_websocket(websocket: WebSocket) -> None:
     Args:
         websocket: WebSocket 连接对象
     """
-    # 先接受 WebSocket 连接
-    await websocket.accept()
+    # 先接受 WebSocket 连接（超出连接数限制时拒绝）
+    if not await manager.accept(websocket):
+        return
     logger.info("WebSocket connection accepted, waiting for session_id...")
 
     session_id = None
     is_processing = False
+    watching = False
+    turn_task: Optional[asyncio.Task] = None
+    router = AgentRouter()
 
     async def send_message_safe(message: dict) -> bool:
         """安全地发送消息，检查连接状态"""
@@ -78,6 +206,70 @@ async def handle_websocket(websocket: WebSocket) -> None:
             logger.error(f"Error sending message: {e}")
             return False
 
+    async def run_turn(session, message_data: dict, message_content: str) -> None:
+        """发送给 iFlow 并转发响应（作为独立任务运行，期间仍可接收订阅等控制消息）"""
+        nonlocal is_processing
+        # 查找响应缓存（仅在允许的审批模式下，客户端可通过 bypass_cache 跳过）；
+        # 缓存键不包含对话上下文，只缓存会话的第一轮，避免追问命中其他会话的回复
+        cache_key = None
+        cached_frames = None
+        stream = None
+        try:
+            if (
+                not message_data.get("bypass_cache")
+                and response_cache.is_enabled_for(config.IFLOW_APPROVAL_MODE)
+                and not await iflow_manager.has_history(session_id)
+            ):
+                fingerprint = await compute_fingerprint(session.working_dir)
+                if fingerprint:
+                    cache_key = response_cache.make_key(session.model, config.IFLOW_APPROVAL_MODE, message_content, fingerprint)
+                    cached_frames = response_cache.get(cache_key)
+
+            # 获取或创建 iFlow 会话（传递模型参数，iFlow 进程在实际发送消息时才启动）
+            iflow_session = await iflow_manager.get_or_create_session(session_id, session.working_dir, session.model)
+            if cached_frames is not None:
+                logger.info(f"Response cache hit for session {session_id}")
+                # 缓存的回复同样写入会话记录、搜索索引和用量统计
+                stream = iflow_session.replay_cached(message_content, response_cache.replay(cached_frames))
+            else:
+                stream = iflow_session.send_message(message_content)
+
+            recorded = [] if cache_key and cached_frames is None else None
+            router.begin_turn()
+            async for response in stream:
+                chunk_log_sampler.log(logger, logging.DEBUG, session_id, "Streaming %s frame to session %s", response.get("type"), session_id)
+                if recorded is not None:
+                    recorded.append(response)
+                # 未订阅的子 Agent 的输出只在服务端缓冲，客户端展开时再发送
+                sent = True
+                for frame in router.route(response):
+                    if not await send_message_safe(frame):
+                        sent = False
+                        break
+                if not sent:
+                    logger.warning("WebSocket disconnected during message processing")
+                    recorded = None
+                    break
+
+            # 只缓存正常结束的完整响应（超时取消的不缓存）
+            if recorded and recorded[-1].get("type") == "finish" and not recorded[-1].get("timed_out"):
+                response_cache.put(cache_key, recorded)
+        except asyncio.CancelledError:
+            logger.info("Message processing cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Error processing iFlow message: {e}", exc_info=True)
+            await send_message_safe({
+                "type": "error",
+                "content": f"Error: {str(e)}",
+            })
+        finally:
+            if stream is not None:
+                # 提前结束（客户端断开或任务被取消）时关闭响应流，由 IFlowSession 中断未读完的一轮
+                await stream.aclose()
+            is_processing = False
+            chunk_log_sampler.reset(session_id)
+
     try:
         # 等待客户端发送 session_id
         init_message = await websocket.receive_text()
@@ -95,10 +287,15 @@ async def handle_websocket(websocket: WebSocket) -> None:
             await send_message_safe({"type": "error", "content": "Session not found"})
             return
 
+        # 客户端声明 agent_streams=on_demand 时，子 Agent 的输出按订阅发送；否则保持原样全部发送
+        router = AgentRouter(on_demand=init_data.get("agent_streams") == "on_demand")
+
         # 注册连接到管理器
-        manager.active_connections.append(websocket)
-        manager.connection_sessions[websocket] = session_id
-        logger.info(f"WebSocket connected for session {session_id}. Total connections: {len(manager.active_connections)}")
+        manager.bind(websocket, session_id)
+
+        # 监听工作目录的文件变更并推送给该会话的连接
+        file_watchers.acquire(session_id, session.working_dir, manager.send_to_session)
+        watching = True
 
         # 发送pong响应
         await send_message_safe({"type": "pong"})
@@ -118,8 +315,19 @@ async def handle_websocket(websocket: WebSocket) -> None:
                         await send_message_safe({"type": "error", "content": "正在处理中，请稍候..."})
                         continue
 
+                    # 在启动任何 iFlow 工作之前检查提示词限额
+                    retry_after = rate_limiter.acquire(PROMPT, client_identity(websocket))
+                    if retry_after:
+                        await send_message_safe({
+                            "type": "error",
+                            "content": rate_limit_message(retry_after),
+                            "reason": "rate_limited",
+                            "retry_after": round(retry_after, 1),
+                        })
+                        continue
+
                     # 处理用户消息
-                    logger.info(f"Received user message from session {session_id}: {message_content}")
+                    logger.info("Received user message from session %s: %s", session_id, redact_body(message_content))
                     is_processing = True
 
                     # 更新会话活动时间
@@ -130,28 +338,19 @@ async def handle_websocket(websocket: WebSocket) -> None:
                         "type": "user",
                         "content": message_content,
                     }):
+                        is_processing = False
                         break
 
-                    # 获取或创建 iFlow 会话（传递模型参数）
-                    iflow_session = await iflow_manager.get_or_create_session(session_id, session.working_dir, session.model)
-
-                    # 发送给 iFlow 并处理响应
-                    try:
-                        async for response in iflow_session.send_message(message_content):
-                            if not await send_message_safe(response):
-                                logger.warning("WebSocket disconnected during message processing")
-                                break
-                    except asyncio.CancelledError:
-                        logger.info("Message processing cancelled")
-                        break
-                    except Exception as e:
-                        logger.error(f"Error processing iFlow message: {e}", exc_info=True)
-                        await send_message_safe({
-                            "type": "error",
-                            "content": f"Error: {str(e)}",
-                        })
-                    finally:
-                        is_processing = False
+                    turn_task = asyncio.create_task(run_turn(session, message_data, message_content))
+
+                elif message_type == "agent_subscribe":
+                    # 展开子 Agent：补发缓冲的输出，之后直接发送
+                    for frame in router.subscribe(str(message_data.get("agent_id", ""))):
+                        await send_message_safe(frame)
+
+                elif message_type == "agent_unsubscribe":
+                    # 折叠子 Agent：之后的输出只缓冲
+                    router.unsubscribe(str(message_data.get("agent_id", "")))
 
                 elif message_type == "ping":
                     # 心跳检测
@@ -171,9 +370,13 @@ async def handle_websocket(websocket: WebSocket) -> None:
     except Exception as e:
         logger.error(f"WebSocket error: {e}", exc_info=True)
     finally:
+        if turn_task is not None and not turn_task.done():
+            turn_task.cancel()
+            try:
+                await turn_task
+            except asyncio.CancelledError:
+                pass
         is_processing = False
-        if websocket in manager.active_connections:
-            manager.active_connections.remove(websocket)
-        if websocket in manager.connection_sessions:
-            del manager.connection_sessions[websocket]
-        logger.info(f"WebSocket disconnected. Total connections: {len(manager.active_connections)}")
\ No newline at end of file
+        if watching:
+            await file_watchers.release(session_id)
+        manager.disconnect(websocket)
\ No newline at end of file